@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+from time import time
+
+import xbmc
+
+from Lib.SimpleCache import simpleCache as cache
+from Lib.SimpleRateLimiter import rateLimiter
+from Lib.RequestHelper import requestHelper
+from Lib.CatalogHelper import catalogHelper
+from Lib.SearchCache import searchCache
+from Lib.Providers import getEpisodeProviders, resolveProviderURL, clearStreamCache
+
+
+# End-to-end timing of the main add-on paths, meant to run against the fixture server (see
+# Lib/FixtureServer.py) so the numbers are reproducible before and after a change.
+
+# Each case is run "cold", after clearing the cache, then "warm" right after. The rate limiter
+# buckets are reset before each run, so the runs don't wait on each other's requests.
+
+BENCHMARK_API = requestHelper.API_ANIMETOON
+BENCHMARK_ROUTE = '/GetAllCartoon'
+BENCHMARK_GENRE = 'Comedy'
+BENCHMARK_QUERY = 'dragon'
+
+
+def runBenchmark(repeat=3):
+    '''
+    Times the catalog build, genre search, name search and resolve paths.
+    ** Clears the cache, it should be confirmed by the user first. **
+    :param repeat: How many cold and warm runs of each case.
+    :returns: A list of (case name, cold times, warm times) tuples, the times are lists of milliseconds.
+    A case that failed has None instead of the times lists.
+    '''
+    api = BENCHMARK_API
+
+    def _catalogBuild():
+        return catalogHelper.allRouteCatalog({'api': api, 'route': BENCHMARK_ROUTE})
+
+    def _genreSearch():
+        return catalogHelper.genreSearchCatalog({'api': api, 'genreName': BENCHMARK_GENRE})
+
+    def _nameSearch():
+        # Same as the name search in Plugin._viewSearchResults().
+        searchData = searchCache.getResults(api, BENCHMARK_QUERY)
+        if not searchData:
+            searchData = requestHelper.nameSearchEntries(api, BENCHMARK_QUERY)
+            searchData = tuple(searchData) if searchData else None
+            if searchData:
+                searchCache.setResults(api, BENCHMARK_QUERY, searchData)
+        return searchData
+
+    episodeID = _findEpisodeID(api)
+    def _resolve():
+        providers = getEpisodeProviders(api, episodeID) if episodeID else None
+        return resolveProviderURL(next(iter(providers.values()))[0]) if providers else None
+
+    results = [ ]
+    for caseName, function in (
+        ('catalog build', _catalogBuild),
+        ('genre search', _genreSearch),
+        ('name search', _nameSearch),
+        ('resolve', _resolve)
+    ):
+        coldTimes = [ ]
+        warmTimes = [ ]
+        try:
+            for index in range(repeat):
+                _clearCaches()
+                coldTime, coldResult = _timed(function)
+                rateLimiter.reset()
+                warmTime, warmResult = _timed(function)
+                if not coldResult or not warmResult:
+                    break
+                coldTimes.append(coldTime)
+                warmTimes.append(warmTime)
+        except Exception as e:
+            xbmc.log('Toonmania2 | Benchmark case "%s" failed: %s' % (caseName, str(e)), xbmc.LOGERROR)
+            coldTimes = None
+        results.append((caseName, coldTimes, warmTimes) if coldTimes else (caseName, None, None))
+    _clearCaches()
+    return results
+
+
+def formatBenchmark(results):
+    lines = ['%-14s %12s %12s %12s %12s' % ('case', 'cold best', 'cold median', 'warm best', 'warm median')]
+    for caseName, coldTimes, warmTimes in results:
+        if coldTimes:
+            lines.append(
+                '%-14s %12.1f %12.1f %12.1f %12.1f'
+                % (caseName, min(coldTimes), _median(coldTimes), min(warmTimes), _median(warmTimes))
+            )
+        else:
+            lines.append('%-14s %12s' % (caseName, 'failed'))
+    lines.append('(milliseconds)')
+    return '\n'.join(lines)
+
+
+def _findEpisodeID(api):
+    # The first episode of the first show of the benchmark route, so it works with any recording.
+    requestHelper.setAPISource(api)
+    jsonData = requestHelper.routeGET(BENCHMARK_ROUTE)
+    if jsonData:
+        details = requestHelper.routeGET('/GetDetails/' + str(jsonData[0]['id']))
+        if details and details.get('episode'):
+            return details['episode'][0]['id']
+    return None
+
+
+def _clearCaches():
+    cache.clearCacheFiles()
+    clearStreamCache()
+    rateLimiter.reset()
+
+
+def _timed(function):
+    startTime = time()
+    result = function()
+    return (time() - startTime) * 1000.0, result
+
+
+def _median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    return values[middle] if len(values) % 2 else (values[middle-1] + values[middle]) / 2.0
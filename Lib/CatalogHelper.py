@@ -1,11 +1,18 @@
 # -*- coding: utf-8 -*-
 import json
 from string import ascii_uppercase
+from time import time
 from datetime import datetime
 from itertools import chain
+from threading import Thread
 
+import xbmc
+import xbmcaddon
+
+from Lib import DICT_ITER_ITEMS, DICT_ITER_KEYS
 from Lib.SimpleCache import simpleCache as cache
-from Lib.RequestHelper import requestHelper
+from Lib.RequestHelper import RequestHelper, requestHelper, mapConcurrently, getConcurrency
+from Lib.SimpleSingleFlight import singleFlight
 
 
 class CatalogHelper():
@@ -14,8 +21,32 @@ class CatalogHelper():
     # displayed) used to build the catalog of items. Used to tell if a new catalog needs to be built.
     PROPERTY_CATALOG_API = 'toonmania2.catalogAPI'
     PROPERTY_CATALOG_ROUTE = 'toonmania2.catalogRoute'
-    # Property name for the catalog of items itself. See catalogFromIterable() for more info.
-    PROPERTY_CATALOG = 'toonmania2.catalog'
+    # Property name prefix for the catalog sections, each section is stored in its own property named
+    # like 'toonmania2.catalog.A' so that a section view only needs to deserialize the section it shows.
+    # See getCatalogSection() for more info.
+    PROPERTY_CATALOG_SECTION = 'toonmania2.catalog.'
+    # Property name for the catalog manifest, a small dict of section keys mapped to their item counts.
+    PROPERTY_CATALOG_MANIFEST = 'toonmania2.catalogManifest'
+
+    # Prefix for the persistent memory properties that flag a '/GetAll(...)' route as being refreshed
+    # in the background, holding the time the refresh started. See _refreshRoutes().
+    PROPERTY_REFRESHING = 'toonmania2.refreshing.'
+    # Seconds after which a refresh flag is ignored, in case its add-on invocation was killed.
+    REFRESH_TIMEOUT = 300
+
+    # Limits for patching expired '/GetAll(...)' routes with the latest updates, see _patchRoutes().
+    # More unknown IDs than this and the routes are downloaded again instead.
+    PATCH_MAX_ITEMS = 25
+    # After this many patches in a row a route is downloaded again, to drop removed items and fix any drift.
+    PATCH_MAX_CONSECUTIVE = 4
+
+    # Suffix of the disk-enabled properties that hold the HTTP validators (ETag, Last-Modified) of each
+    # cached '/GetAll(...)' route, used to revalidate the route when it expires. See _refreshRoutesWorker()
+    # and _requestRouteEntries().
+    VALIDATORS_SUFFIX = '.validators'
+    # Suffix of the disk-enabled properties that count the patches in a row of each cached '/GetAll(...)'
+    # route, see _patchRoutes().
+    PATCHES_SUFFIX = '.patches'
 
     LETTERS_SET = set(ascii_uppercase) # Used in the catalogFromIterable() function.
 
@@ -35,27 +66,61 @@ class CatalogHelper():
             '_searchResults': self.searchResultsCatalog,
             # Otherwise defaults to the 'genericCatalog' function.
         }
+        # Manifest of the catalog that's ready for this add-on invocation, and the catalog itself
+        # if it was (re)built in this invocation. See _ensureCatalog().
+        self.manifest = None
+        self.builtCatalog = None
 
 
-    def getCatalog(self, params):
+    def getCatalogManifest(self, params):
+        '''
+        Retrieves the catalog manifest, a dict of each section key mapped to the number of items
+        in that section, eg. {'#': 3, 'A': 120, 'B': 97, ...}.
+        Used to list the sections and count pages without deserializing any of the items.
         '''
-        Retrieves the catalog from a persistent window property between different add-on
-        states, or recreates the catalog if needed.
+        self._ensureCatalog(params)
+        return self.manifest
 
-        The catalog is a dictionary of lists of entries, used to store data between add-on states to make xbmcgui.ListItems:
-        {
-            (1. Sections, as in alphabet sections for list items: #, A, B, C, D, E, F etc., each section holds a tuple of items.)
-            A: (
-                item, item, item, ...    (2. Items, each item is a tuple with the format seen in makeCatalogEntry().)
-            )
-            B: (...)
-            C: (...)
-        }
+
+    def getCatalogSection(self, params, sectionKey, start=0, stop=None):
         '''
-        def _buildCatalog():
-            catalog = self.catalogFunctions.get(params['route'], self.genericCatalog)(params)
-            cache.setCacheProperty(self.PROPERTY_CATALOG, catalog, saveToDisk = False)
-            return catalog
+        Retrieves the items of a catalog section, optionally sliced with 'start' and 'stop' indexes.
+        For the "ALL" pseudo-section the sections are concatenated in sorted key order, and only
+        the sections that overlap the slice are deserialized.
+
+        The catalog is kept as a persistent window property for each section, between different add-on
+        states, and recreated if needed. Each section is a list of items with the format seen in makeCatalogEntry():
+        (
+            A: [item, item, item, ...] -> 'toonmania2.catalog.A'
+            B: [...] -> 'toonmania2.catalog.B'
+            C: [...] -> 'toonmania2.catalog.C'
+        )
+        :returns: A list of catalog items.
+        '''
+        self._ensureCatalog(params)
+        if sectionKey == 'ALL':
+            sectionKeys = sorted(DICT_ITER_KEYS(self.manifest))
+        else:
+            sectionKeys = (sectionKey,)
+
+        items = [ ]
+        offset = 0 # Index of the first item of the current section, in the whole of the sections being read.
+        for key in sectionKeys:
+            size = self.manifest.get(key, 0)
+            if size and offset + size > start and (stop == None or offset < stop):
+                section = self._loadCatalogSection(key)
+                items.extend(section[max(start - offset, 0) : None if stop == None else stop - offset])
+            offset += size
+        return items
+
+
+    def _ensureCatalog(self, params):
+        '''
+        Makes sure that the catalog for 'params' is in memory, rebuilding it if needed.
+        Only the manifest is read from memory, the sections are read on demand by getCatalogSection().
+        '''
+        if self.manifest != None:
+            return # Already checked in this add-on invocation.
 
         # If these properties are empty (like when coming in from a favourites menu), or if a different
         # route (website area) or a different API was stored in this property, then reload it.
@@ -70,12 +135,32 @@ class CatalogHelper():
         ):
             cache.setRawProperty(self.PROPERTY_CATALOG_API, params['api'])
             cache.setRawProperty(self.PROPERTY_CATALOG_ROUTE, params['route'])
-            catalog = _buildCatalog()
+            self._buildCatalog(params)
         else:
-            catalog = cache.getCacheProperty(self.PROPERTY_CATALOG, readFromDisk = False)
-            if not catalog:
-                catalog = _buildCatalog()
-        return catalog
+            self.manifest = cache.getCacheProperty(self.PROPERTY_CATALOG_MANIFEST, readFromDisk = False)
+            if not self.manifest:
+                self._buildCatalog(params)
+
+
+    def _buildCatalog(self, params):
+        catalog = self.catalogFunctions.get(params['route'], self.genericCatalog)(params)
+        self.manifest = {sectionKey: len(section) for sectionKey, section in DICT_ITER_ITEMS(catalog)}
+        self.builtCatalog = catalog
+        cache.setCacheProperties(
+            (
+                (self.PROPERTY_CATALOG_SECTION + sectionKey, section)
+                for sectionKey, section in DICT_ITER_ITEMS(catalog)
+            ),
+            saveToDisk = False
+        )
+        cache.setCacheProperty(self.PROPERTY_CATALOG_MANIFEST, self.manifest, saveToDisk = False)
+
+
+    def _loadCatalogSection(self, sectionKey):
+        if self.builtCatalog:
+            return self.builtCatalog.get(sectionKey, [ ]) # Built in this invocation, no need to deserialize.
+        section = cache.getCacheProperty(self.PROPERTY_CATALOG_SECTION + sectionKey, readFromDisk = False)
+        return section if section else [ ]
 
 
     def makeCatalogEntry(self, entry):
@@ -92,6 +177,20 @@ class CatalogHelper():
         )
 
 
+    def makeRouteEntry(self, entry):
+        '''
+        Trims an entry from a '/GetAll(...)' route to the fields used by the add-on, the
+        ones in makeCatalogEntry(). The cached routes keep only these trimmed entries.
+        '''
+        return {
+            'id': entry['id'],
+            'name': entry.get('name') or '',
+            'description': entry.get('description') or '',
+            'genres': entry.get('genres') or [ ],
+            'released': entry.get('released', None)
+        }
+
+
     def getEmptyCatalog(self):
         return {key: [ ] for key in ascii_uppercase + '#'}
 
@@ -125,12 +224,10 @@ class CatalogHelper():
         genericIDs = cache.getCacheProperty(api+route, readFromDisk = False)
         if not genericIDs:
             requestHelper.setAPISource(api)
-            requestHelper.delayBegin()
-            jsonData = requestHelper.routeGET(route)
+            jsonData = requestHelper.routeGET(route, 500)
             if jsonData:
                 genericIDs = tuple(entry['id'] for entry in jsonData)
                 cache.setCacheProperty(api+route, genericIDs, saveToDisk = False)
-            requestHelper.delayEnd(500)
 
         if genericIDs:
             # Load all the main routes of the API (they are disk-cached), to compare IDs with.
@@ -150,14 +247,20 @@ class CatalogHelper():
 
         propName = self._diskFriendlyPropName(api, route)
 
-        jsonData = cache.getCacheProperty(propName, readFromDisk = True)
-        if not jsonData:
-            requestHelper.setAPISource(api)
-            requestHelper.delayBegin()
-            jsonData = requestHelper.routeGET(route)
-            if jsonData:
-                cache.setCacheProperty(propName, jsonData, saveToDisk = True) # Defaults to 3 days cache lifetime.
-            requestHelper.delayEnd(500)
+        jsonData, isExpired = self._getCachedRouteData(api, route)
+        if isExpired:
+            self._refreshRoutes(api, {route: jsonData})
+        elif not jsonData:
+            # If another add-on invocation is already downloading this route, wait for it and use its data.
+            isLeader = singleFlight.begin(api + route)
+            if not isLeader:
+                jsonData = cache.getCacheProperty(propName, readFromDisk = True)
+            if not jsonData:
+                try:
+                    return self._downloadRouteCatalog(api, route, propName)
+                finally:
+                    if isLeader:
+                        singleFlight.end(api + route)
 
         if jsonData:
             return self.catalogFromIterable(self.makeCatalogEntry(entry) for entry in jsonData)
@@ -165,6 +268,36 @@ class CatalogHelper():
             return self.getEmptyCatalog()
 
 
+    def _downloadRouteCatalog(self, api, route, propName):
+        '''
+        Downloads one of the main '/GetAll(...)' routes and caches it.
+        :returns: A catalog of the route entries, empty if the request failed.
+        '''
+        requestHelper.setAPISource(api)
+        startTime = time()
+        entries, renewedData = self._requestRouteEntries(requestHelper, propName, route, 500)
+        if renewedData:
+            cache.recordWebRequest(propName, startTime, 0)
+            return self.catalogFromIterable(self.makeCatalogEntry(entry) for entry in renewedData)
+        if entries != None:
+            # The catalog is built while the route is parsed, the route data is cached after.
+            jsonData = [ ]
+            try:
+                catalog = self.catalogFromIterable(self._streamRouteEntries(entries, jsonData))
+            except ValueError:
+                return self.getEmptyCatalog()
+            cache.recordWebRequest(propName, startTime, requestHelper.lastResponseSize)
+            cache.setCacheProperties(
+                (
+                    (propName, jsonData, cache.LIFETIME_THREE_DAYS),
+                    self._validatorsProperty(propName, requestHelper.lastValidators)
+                ),
+                saveToDisk = True
+            )
+            return catalog
+        return self.getEmptyCatalog()
+
+
     def latestUpdatesCatalog(self, params):
         '''
         Returns a catalog for the Latest Updates category.
@@ -183,12 +316,10 @@ class CatalogHelper():
         latestIDs = cache.getCacheProperty(_PROPERTY_LAST_UPDATES, readFromDisk = False)
         if not latestIDs:
             requestHelper.setAPISource(api)
-            requestHelper.delayBegin()
             jsonData = requestHelper.routeGET(params['route'])
             if jsonData:
                 latestIDs = tuple(entry['id'] for entry in jsonData.get('updates', [ ]))
                 cache.setCacheProperty(_PROPERTY_LAST_UPDATES, latestIDs, saveToDisk = False)
-            requestHelper.delayEnd(1000)
 
         if latestIDs:
             # Latest Updates needs all items of the current API loaded, to compare IDs with.
@@ -238,35 +369,315 @@ class CatalogHelper():
         :returns: A dict of the '/GetAll(...)' routes of the API, each route key holds a list of catalog entries.
         '''
         requestHelper.setAPISource(api)
-        if customRoute:
-            routeAlls = (customRoute,)
-        else:
-            if api == requestHelper.API_ANIMETOON:
-                routeAlls = ('/GetAllCartoon', '/GetAllMovies', '/GetAllDubbed') # Animetoon 'All' routes.
-            else:
-                routeAlls = ('/GetAllMovies', '/GetAllShows') # Animeplus 'All' routes.
+        routeAlls = (customRoute,) if customRoute else self.getMainRoutes(api)
 
-        routesData = [ ]
-        newProperties = [ ]
+        routesJSON = { }
+        missingRoutes = [ ]
+        expiredData = { }
         for route in routeAlls:
             # Try to get the cached property first.
-            jsonData = cache.getCacheProperty(
-                self._diskFriendlyPropName(api, route), readFromDisk = True
-            )
-            if not jsonData:
-                requestHelper.delayBegin()
-                jsonData = requestHelper.routeGET(route)
-                if jsonData:
-                    newProperties.append(
-                        (cache.diskFriendlyPropName(api + route), jsonData, cache.LIFETIME_THREE_DAYS)
+            jsonData, isExpired = self._getCachedRouteData(api, route)
+            if isExpired:
+                expiredData[route] = jsonData
+            elif not jsonData:
+                missingRoutes.append(route)
+            routesJSON[route] = jsonData
+
+        if missingRoutes:
+            def _fetchAndCache(routes):
+                newProperties = [ ]
+                for route, (jsonData, validators, isRenewed) in DICT_ITER_ITEMS(self._fetchRoutes(api, routes)):
+                    if jsonData:
+                        routesJSON[route] = jsonData
+                        if not isRenewed: # A renewed route is already saved.
+                            propName = self._diskFriendlyPropName(api, route)
+                            newProperties.append((propName, jsonData, cache.LIFETIME_THREE_DAYS))
+                            newProperties.append(self._validatorsProperty(propName, validators))
+                if newProperties:
+                    cache.setCacheProperties(newProperties, saveToDisk=True)
+
+            # Download the routes that no other add-on invocation is downloading right now.
+            ledRoutes = [route for route in missingRoutes if singleFlight.tryBegin(api + route)]
+            try:
+                if ledRoutes:
+                    _fetchAndCache(ledRoutes)
+            finally:
+                for route in ledRoutes:
+                    singleFlight.end(api + route)
+            # Then wait for the other downloads to end and use their data from the cache. The routes
+            # that still aren't cached (their download failed) are downloaded here.
+            retryRoutes = [ ]
+            for route in missingRoutes:
+                if route not in ledRoutes:
+                    singleFlight.wait(api + route)
+                    propName = self._diskFriendlyPropName(api, route)
+                    routesJSON[route] = cache.getCacheProperty(propName, readFromDisk=True)
+                    if not routesJSON[route]:
+                        retryRoutes.append(route)
+            if retryRoutes:
+                _fetchAndCache(retryRoutes)
+        if expiredData:
+            self._refreshRoutes(api, expiredData)
+
+        return [
+            tuple(self.makeCatalogEntry(entry) for entry in (routesJSON[route] or ())) for route in routeAlls
+        ]
+
+
+    def _fetchRoutes(self, api, routes):
+        '''
+        Requests several routes from an API, with up to 'fetch_concurrency' (add-on setting) requests
+        at the same time in worker threads. The requests are rate limited to one every 'fetch_interval'
+        milliseconds on average (after a small burst), so we don't abuse the source.
+        :returns: A dict of each route mapped to a (jsonData, validators, isRenewed) tuple. The JSON data
+        is None if its request failed. When 'isRenewed' is True the route wasn't modified, and its
+        expired data was renewed in the cache.
+        '''
+        try:
+            interval = int(xbmcaddon.Addon().getSetting('fetch_interval'))
+        except ValueError:
+            interval = 1000
+
+        def _fetchRouteHelper(helper, route):
+            helper.setAPISource(api)
+            return self._fetchRoute(helper, api, route, interval)
+
+        return {
+            route: result or (None, None, False)
+            for route, result in zip(routes, mapConcurrently(_fetchRouteHelper, routes, getConcurrency()))
+        }
+
+
+    def _fetchRoute(self, helper, api, route, interval):
+        propName = self._diskFriendlyPropName(api, route)
+        startTime = time()
+        entries, renewedData = self._requestRouteEntries(helper, propName, route, interval)
+        if renewedData:
+            cache.recordWebRequest(propName, startTime, 0)
+            return renewedData, helper.lastValidators, True
+        jsonData = self._readRouteEntries(entries) # Parsed in this thread as well.
+        if jsonData:
+            cache.recordWebRequest(propName, startTime, helper.lastResponseSize)
+        return jsonData, helper.lastValidators, False
+
+
+    def _requestRouteEntries(self, helper, propName, route, interval):
+        '''
+        Requests one of the main '/GetAll(...)' routes with routeGETEntries(). When the storage still has
+        the expired data of the route (see SimpleCache.EXPIRED_KEEP_HOURS), the request is made conditional
+        with its validators, and if the route wasn't modified the expired data is renewed and used.
+        :returns: A tuple (entries, renewedData). Either the entries generator from routeGETEntries() (None
+        if the request failed) and None, or None and the renewed route data.
+        '''
+        validators = cache.peekCacheProperty(propName + self.VALIDATORS_SUFFIX)
+        expiredData = cache.peekCacheProperty(propName) if validators else None
+        entries = helper.routeGETEntries(route, interval, validators if expiredData else None)
+        if helper.lastNotModified:
+            if not cache.renewCacheProperty(propName, cache.LIFETIME_THREE_DAYS):
+                cache.saveCachePropertyNow(propName, expiredData, cache.LIFETIME_THREE_DAYS) # Only in memory.
+            return None, expiredData
+        return entries, None
+
+
+    def _getCachedRouteData(self, api, route):
+        '''
+        Tries to get the cached JSON data of one of the main '/GetAll(...)' routes.
+        With the 'cache_stale_hours' setting on, expired data is still returned for that many hours,
+        so the caller can show it right away and refresh it in the background (stale-while-revalidate).
+        :returns: A tuple (jsonData, isExpired). The JSON data is None when it's not cached or too
+        stale, then it needs a blocking request.
+        '''
+        propName = self._diskFriendlyPropName(api, route)
+        maxStaleness = cache.getMaxStaleness()
+        if maxStaleness:
+            return cache.getStaleCacheProperty(propName, maxStaleness)
+        else:
+            return cache.getCacheProperty(propName, readFromDisk = True), False
+
+
+    def _refreshRoutes(self, api, expiredData):
+        '''
+        Starts a worker thread to request fresh data for expired '/GetAll(...)' routes.
+        A persistent memory property flags each route being refreshed, so other add-on invocations
+        that also find it expired don't refresh it again.
+        :param expiredData: A dict of each expired route mapped to its (stale) JSON data.
+        '''
+        currentTime = int(time())
+        pendingData = { }
+        for route, jsonData in DICT_ITER_ITEMS(expiredData):
+            flagName = self.PROPERTY_REFRESHING + api + route
+            flagTime = cache.getRawProperty(flagName)
+            if not flagTime or currentTime - int(flagTime) > self.REFRESH_TIMEOUT:
+                cache.setRawProperty(flagName, str(currentTime))
+                pendingData[route] = jsonData
+        if pendingData:
+            # Not a daemon thread, the add-on script only ends after the refresh is done.
+            Thread(target=self._refreshRoutesWorker, args=(api, pendingData)).start()
+
+
+    def _refreshRoutesWorker(self, api, expiredData):
+        # A separate request helper, so this thread doesn't change the API or headers used by the main thread.
+        workerHelper = RequestHelper()
+        workerHelper.setAPISource(api)
+
+        fullRoutes = list(expiredData)
+        if xbmcaddon.Addon().getSetting('cache_patch_updates') == 'true':
+            try:
+                fullRoutes = self._patchRoutes(workerHelper, api, expiredData)
+            except Exception as e:
+                xbmc.log('Toonmania2 | Patching the catalogs failed: ' + str(e), xbmc.LOGWARNING)
+
+        for route in fullRoutes:
+            try:
+                propName = self._diskFriendlyPropName(api, route)
+                # Revalidate with the validators of the cached route, if the API sent any. An unchanged
+                # route is answered with a "304 Not Modified" and only its lifetime needs to be renewed.
+                validators = cache.peekCacheProperty(propName + self.VALIDATORS_SUFFIX)
+                startTime = time()
+                jsonData = self._readRouteEntries(workerHelper.routeGETEntries(route, validators=validators))
+                if workerHelper.lastNotModified:
+                    cache.recordWebRequest(propName, startTime, 0)
+                    cache.renewCacheProperty(propName, cache.LIFETIME_THREE_DAYS)
+                elif jsonData:
+                    cache.recordWebRequest(propName, startTime, workerHelper.lastResponseSize)
+                    cache.saveCachePropertyNow(propName, jsonData, cache.LIFETIME_THREE_DAYS)
+                    cache.saveCachePropertyNow(propName + self.PATCHES_SUFFIX, 0, cache.LIFETIME_FOREVER)
+                    cache.saveCachePropertyNow(
+                        propName + self.VALIDATORS_SUFFIX, workerHelper.lastValidators, cache.LIFETIME_FOREVER
                     )
-                requestHelper.delayEnd(1000) # Always delay between requests so we don't abuse the source.
-            routesData.append(tuple(self.makeCatalogEntry(entry) for entry in jsonData))
+            except Exception as e:
+                xbmc.log('Toonmania2 | Background refresh of %s failed: %s' % (route, str(e)), xbmc.LOGWARNING)
+
+        for route in expiredData:
+            cache.setRawProperty(self.PROPERTY_REFRESHING + api + route, '')
+        cache.flushCacheStats() # The add-on invocation might have already flushed its statistics.
+
+
+    def _patchRoutes(self, helper, api, expiredData):
+        '''
+        Tries to bring expired '/GetAll(...)' routes up to date with a few small requests, instead of
+        downloading them again. The IDs from the '/GetUpdates/' feed and from the '/GetNew(...)' route
+        of each expired route are compared to the IDs already cached for the API. The unknown IDs that
+        show up in the '/GetNew(...)' route of an expired route are added to that route (using
+        '/GetDetails/<id>' when the new entry is incomplete), and the route lifetime is extended.
+        Unknown IDs that can't be placed in a route, or whose entry can't be completed, make the
+        routes be downloaded again instead, so no new item is left out.
+        :returns: A list of the routes that couldn't be patched and need to be downloaded again.
+        '''
+        patchRoutes = [ ]
+        fullRoutes = [ ]
+        patchCounts = { }
+        for route in expiredData:
+            patchCounts[route] = cache.peekCacheProperty(
+                self._diskFriendlyPropName(api, route) + self.PATCHES_SUFFIX
+            ) or 0
+            if expiredData[route] and patchCounts[route] < self.PATCH_MAX_CONSECUTIVE:
+                patchRoutes.append(route)
+            else:
+                fullRoutes.append(route)
+        if not patchRoutes:
+            return fullRoutes
+
+        updatesData = helper.routeGET('/GetUpdates/')
+        if not updatesData:
+            return fullRoutes + patchRoutes
+        candidateIDs = set(entry['id'] for entry in updatesData.get('updates', [ ]))
+
+        # Newest entries of each route being patched, used to tell which route an unknown ID belongs to.
+        newEntries = { }
+        newIDs = set()
+        for route in patchRoutes:
+            newData = helper.routeGET(route.replace('All', 'New'))
+            if newData == None:
+                return fullRoutes + patchRoutes
+            newEntries[route] = {entry['id']: entry for entry in newData}
+            newIDs.update(newEntries[route])
+        candidateIDs.update(newIDs)
+
+        # All the IDs known for this API, including the main routes that aren't expired.
+        knownIDs = set()
+        for route in self.getMainRoutes(api):
+            jsonData = expiredData[route] if route in expiredData else cache.peekCacheProperty(
+                self._diskFriendlyPropName(api, route)
+            )
+            if jsonData:
+                knownIDs.update(entry['id'] for entry in jsonData)
+
+        unknownIDs = candidateIDs - knownIDs
+        if len(unknownIDs) > self.PATCH_MAX_ITEMS:
+            return fullRoutes + patchRoutes # Too many changes, download the routes again.
+        if not unknownIDs.issubset(newIDs):
+            # Unknown IDs from '/GetUpdates/' that aren't new in any of these routes, it's not known which
+            # route they go to. Download the routes again rather than extend them without those items.
+            return fullRoutes + patchRoutes
+
+        for route in patchRoutes:
+            routeIDs = unknownIDs.intersection(newEntries[route])
+            patchEntries = [self._patchEntry(helper, newEntries[route][entryID]) for entryID in routeIDs]
+            if not all(patchEntries):
+                fullRoutes.append(route) # The details of an entry couldn't be requested.
+                continue
+            # A new list, the main thread might still be reading the stale one.
+            jsonData = list(expiredData[route]) + patchEntries
+            propName = self._diskFriendlyPropName(api, route)
+            cache.saveCachePropertyNow(propName, jsonData, cache.LIFETIME_THREE_DAYS)
+            cache.saveCachePropertyNow(propName + self.PATCHES_SUFFIX, patchCounts[route] + 1, cache.LIFETIME_FOREVER)
+        return fullRoutes
+
+
+    def _patchEntry(self, helper, newEntry):
+        '''
+        Makes a '/GetAll(...)' style entry from a '/GetNew(...)' entry, requesting its
+        details if it doesn't have the fields needed by makeCatalogEntry().
+        '''
+        if 'name' not in newEntry or 'genres' not in newEntry:
+            details = helper.routeGET('/GetDetails/' + str(newEntry['id']))
+            if not details:
+                return None
+            newEntry = dict(details, id=newEntry['id'])
+        return self.makeRouteEntry(newEntry)
+
+
+    def getMainRoutes(self, api):
+        if api == requestHelper.API_ANIMETOON:
+            return ('/GetAllCartoon', '/GetAllMovies', '/GetAllDubbed') # Animetoon 'All' routes.
+        else:
+            return ('/GetAllMovies', '/GetAllShows') # Animeplus 'All' routes.
+
+
+    def _streamRouteEntries(self, entries, routeData):
+        '''
+        Generator of catalog entries from a streamed '/GetAll(...)' route (see RequestHelper.routeGETEntries()).
+        Each route entry is trimmed and appended to the 'routeData' list, to be cached, as it's parsed.
+        '''
+        for entry in entries:
+            routeEntry = self.makeRouteEntry(entry)
+            routeData.append(routeEntry)
+            yield self.makeCatalogEntry(routeEntry)
+
+
+    def _readRouteEntries(self, entries):
+        '''
+        :returns: A list of the trimmed entries of a streamed '/GetAll(...)' route, or None if the
+        request failed or if the response was incomplete or not a JSON array.
+        '''
+        if entries == None:
+            return None
+        try:
+            return [self.makeRouteEntry(entry) for entry in entries]
+        except ValueError:
+            return None
+
+
+    def _validatorsProperty(self, propName, validators):
+        '''
+        :returns: A disk-enabled property entry for setCacheProperties(), holding the validators of a route.
+        '''
+        return (propName + self.VALIDATORS_SUFFIX, validators, cache.LIFETIME_FOREVER)
 
-        if newProperties:
-            cache.setCacheProperties(newProperties, saveToDisk=True)
 
-        return routesData
+    def _diskFriendlyPropName(self, api, route):
+        return cache.diskFriendlyPropName(api + route)
 
 
 catalogHelper = CatalogHelper()
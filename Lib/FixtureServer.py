@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+import sys
+import json
+import argparse
+from time import sleep, time
+from hashlib import sha1
+from os import makedirs, path as osPath
+
+if sys.version.startswith('3'):
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from socketserver import ThreadingMixIn
+    from urllib.request import Request, urlopen
+    from urllib.error import HTTPError
+else:
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+    from SocketServer import ThreadingMixIn
+    from urllib2 import Request, urlopen, HTTPError
+
+
+# A stand-in HTTP server that records and replays the responses of the websites used by the add-on,
+# to measure the add-on performance offline and with reproducible numbers. It runs outside of Kodi.
+
+# It works as an HTTP proxy: with the 'fixture_proxy' add-on setting pointing at it, the plain HTTP
+# requests of RequestHelper (API routes, search pages and provider pages) go through it. HTTPS requests
+# (like Trakt) aren't proxied. Each response is a fixture of two files in the fixtures folder, named after
+# the SHA-1 of the URL: '<hash>.meta' with the URL, status and headers as JSON, and '<hash>.body'.
+#
+# Record the fixtures from the live websites, then replay them with a simulated connection:
+# python -m Lib.FixtureServer record fixtures/
+# python -m Lib.FixtureServer replay fixtures/ --latency 150 --bandwidth 512
+#
+# The "Run Benchmark" add-on setting (see Lib/Benchmark.py) always makes the same requests, so running
+# it once while recording captures all the fixtures it needs.
+
+# Response headers that are kept in the fixtures.
+KEPT_HEADERS = ('Content-Type', 'ETag', 'Last-Modified', 'Retry-After', 'Location')
+
+# Request headers that aren't forwarded when recording. The body is saved decoded, so no 'Accept-Encoding'.
+DROPPED_HEADERS = set(('host', 'proxy-connection', 'connection', 'accept-encoding', 'keep-alive'))
+
+# Bytes written at a time, when simulating a limited bandwidth.
+WRITE_CHUNK_SIZE = 8192
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1' # Keep-alive, like the requests sessions of the add-on.
+
+
+    def do_GET(self):
+        url = self._getURL()
+        fixturePath = osPath.join(self.server.fixturesDir, sha1(url.encode('utf-8')).hexdigest())
+        fixture = self._loadFixture(fixturePath)
+        if not fixture and self.server.mode == 'record':
+            fixture = self._recordFixture(url, fixturePath) # Only the missing fixtures are recorded.
+        if not fixture:
+            self.log_message('No fixture for %s', url)
+            self._sendResponse(404, { }, b'')
+            return
+
+        status, headers, body = fixture
+        etag = headers.get('ETag')
+        if etag and etag == self.headers.get('If-None-Match'):
+            status, body = 304, b''
+        elif headers.get('Last-Modified') and headers.get('Last-Modified') == self.headers.get('If-Modified-Since'):
+            status, body = 304, b''
+        self._sendResponse(status, headers, body)
+
+
+    def _getURL(self):
+        # Proxied requests have the full URL in the request line, direct requests only have the path.
+        if self.path.startswith('http://'):
+            return self.path
+        return 'http://' + self.headers.get('Host', 'localhost') + self.path
+
+
+    def _recordFixture(self, url, fixturePath):
+        headers = {
+            key: value for key, value in self.headers.items() if key.lower() not in DROPPED_HEADERS
+        }
+        try:
+            response = urlopen(Request(url, headers=headers), timeout=30)
+            status = response.getcode()
+        except HTTPError as e:
+            response = e
+            status = e.code
+        except Exception as e:
+            self.log_message('Recording %s failed: %s', url, str(e))
+            return None
+        body = response.read()
+        keptHeaders = {key: response.headers.get(key) for key in KEPT_HEADERS if response.headers.get(key)}
+        with open(fixturePath + '.meta', 'w') as metaFile:
+            json.dump({'url': url, 'status': status, 'headers': keptHeaders}, metaFile, indent=1)
+        with open(fixturePath + '.body', 'wb') as bodyFile:
+            bodyFile.write(body)
+        self.log_message('Recorded %s (%i bytes)', url, len(body))
+        return status, keptHeaders, body
+
+
+    def _loadFixture(self, fixturePath):
+        if not osPath.exists(fixturePath + '.meta'):
+            return None
+        with open(fixturePath + '.meta', 'r') as metaFile:
+            meta = json.load(metaFile)
+        with open(fixturePath + '.body', 'rb') as bodyFile:
+            body = bodyFile.read()
+        return meta['status'], meta['headers'], body
+
+
+    def _sendResponse(self, status, headers, body):
+        if self.server.latency:
+            sleep(self.server.latency / 1000.0) # Time to the first byte.
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.server.bandwidth:
+            bytesPerSecond = self.server.bandwidth * 1024.0
+            startTime = time()
+            for offset in range(0, len(body), WRITE_CHUNK_SIZE):
+                self.wfile.write(body[offset : offset+WRITE_CHUNK_SIZE])
+                # Wait until the time that the bytes written so far would take to download.
+                delay = (offset + WRITE_CHUNK_SIZE) / bytesPerSecond - (time() - startTime)
+                if delay > 0.0:
+                    sleep(delay)
+        else:
+            self.wfile.write(body)
+
+
+class FixtureServer(ThreadingMixIn, HTTPServer):
+
+    daemon_threads = True
+
+
+    def __init__(self, address, mode, fixturesDir, latency=0, bandwidth=0):
+        '''
+        :param address: A (host, port) tuple to listen at.
+        :param mode: Either 'record' or 'replay'.
+        :param latency: Milliseconds to wait before each response.
+        :param bandwidth: Kilobytes per second to send the response bodies at, or zero for no limit.
+        '''
+        HTTPServer.__init__(self, address, FixtureHandler)
+        self.mode = mode
+        self.fixturesDir = fixturesDir
+        self.latency = latency
+        self.bandwidth = bandwidth
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Records and replays the websites used by Toonmania2.')
+    parser.add_argument('mode', choices=('record', 'replay'))
+    parser.add_argument('fixturesDir')
+    parser.add_argument('--host', default='127.0.0.1', help='Use 0.0.0.0 for Kodi on another device.')
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--latency', type=int, default=0, help='Milliseconds before each response.')
+    parser.add_argument('--bandwidth', type=int, default=0, help='Kilobytes per second, 0 = no limit.')
+    args = parser.parse_args()
+
+    if not osPath.exists(args.fixturesDir):
+        makedirs(args.fixturesDir)
+    server = FixtureServer((args.host, args.port), args.mode, args.fixturesDir, args.latency, args.bandwidth)
+    print('Fixture server (%s) listening at %s:%i' % (args.mode, args.host, args.port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
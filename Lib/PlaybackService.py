@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+import json
+from time import time
+
+import xbmc
+import xbmcgui
+import xbmcaddon
+
+from Lib import parse_qsl
+
+
+# Background service that prepares the next episode of the video playlist while the current one plays,
+# and that tells which resolved streams fail to start.
+
+# A few minutes before the current video ends, the next playlist item (if it's a 'RESOLVE' item of this
+# add-on) gets its providers and stream resolved into the cache, so the plugin invocation that plays it
+# has them right away. See Providers.preResolve() and Plugin.viewResolve().
+
+class PlaybackWatch():
+    '''
+    The stream that the plugin just gave to Kodi, watched by the service until it starts or fails, so that
+    the plugin invocation can end right away. Streams that fail to start are kept for the next plugin
+    invocation, which forgets them (see Providers.forgetStream()) and records their provider as failed.
+    Both are in the properties of the home window, the same one for the plugin and the service.
+    '''
+
+    # Property with the JSON of the watched stream, {'streams': [...], 'provider': name, 'time': seconds}.
+    # 'streams' are the streams of the parts when playing all the parts of a movie.
+    PROPERTY_WATCH = 'toonmania2.playbackWatch'
+    # Property with the JSON list of the watches that failed to start.
+    PROPERTY_FAILED = 'toonmania2.playbackFailed'
+
+    START_TIMEOUT = 30 # Seconds for a stream to start, after that it's not known if it failed or not.
+    MAX_FAILED = 10
+
+
+    def __init__(self):
+        self.window = xbmcgui.Window(10000)
+
+
+    def begin(self, stream, partStreams, providerName):
+        '''
+        Watches a stream, from the plugin, right before it's given to Kodi.
+        '''
+        self.window.setProperty(
+            self.PROPERTY_WATCH,
+            json.dumps({'streams': partStreams or [stream], 'provider': providerName, 'time': time()})
+        )
+
+
+    def takeFailed(self):
+        '''
+        :returns: A list of (streams, providerName) tuples of the watched streams that failed to start,
+        since the last call. The provider name can be None.
+        '''
+        failedRaw = self.window.getProperty(self.PROPERTY_FAILED)
+        if not failedRaw:
+            return [ ]
+        self.window.clearProperty(self.PROPERTY_FAILED)
+        try:
+            return [(watch['streams'], watch['provider']) for watch in json.loads(failedRaw)]
+        except (ValueError, KeyError, TypeError):
+            return [ ]
+
+
+    def started(self):
+        '''
+        From the service, the video started so the watched stream (if any) works.
+        '''
+        self.window.clearProperty(self.PROPERTY_WATCH)
+
+
+    def failed(self):
+        '''
+        From the service, the video failed to start. The watched stream is kept as failed if it was
+        given to Kodi recently, or else the video that failed isn't known.
+        '''
+        watchRaw = self.window.getProperty(self.PROPERTY_WATCH)
+        if not watchRaw:
+            return
+        self.window.clearProperty(self.PROPERTY_WATCH)
+        try:
+            watch = json.loads(watchRaw)
+            if time() - watch['time'] > self.START_TIMEOUT:
+                return
+            failedRaw = self.window.getProperty(self.PROPERTY_FAILED)
+            failedWatches = json.loads(failedRaw) if failedRaw else [ ]
+        except (ValueError, KeyError, TypeError):
+            return
+        failedWatches.append(watch)
+        self.window.setProperty(self.PROPERTY_FAILED, json.dumps(failedWatches[-self.MAX_FAILED:]))
+
+
+playbackWatch = PlaybackWatch()
+
+
+class PlaybackWatcher(xbmc.Player):
+    '''
+    Player that tells PlaybackWatch if the videos being opened start playing or fail.
+    '''
+    def __init__(self):
+        xbmc.Player.__init__(self)
+        self.isPlaying = False # If a video started and didn't stop yet.
+
+    def onPlayBackStarted(self):
+        if not hasattr(xbmc.Player, 'onAVStarted'):
+            self.onAVStarted() # Kodi 17.6, on Kodi 18+ this is called before the video is opened.
+
+    def onAVStarted(self):
+        self.isPlaying = True
+        playbackWatch.started()
+
+    def onPlayBackError(self):
+        self.isPlaying = False
+        playbackWatch.failed()
+
+    def onPlayBackStopped(self):
+        if self.isPlaying:
+            self.isPlaying = False # The previous video, not the one being opened.
+        else:
+            playbackWatch.failed() # Stopped before it played, it might have been the user but it's unlikely.
+
+    def onPlayBackEnded(self):
+        self.onPlayBackStopped()
+
+
+class PlaybackService(xbmc.Monitor):
+
+    CHECK_INTERVAL = 5 # Seconds between checks of the player.
+    LEAD_TIME = 180 # Seconds before the end of the current video to prepare the next one.
+
+
+    def __init__(self):
+        xbmc.Monitor.__init__(self)
+        self.player = PlaybackWatcher()
+        self.pluginURL = 'plugin://' + xbmcaddon.Addon().getAddonInfo('id') + '/'
+        self.lastPreparedPath = None # Path of the latest item prepared, so it's only prepared once.
+
+
+    def run(self):
+        '''
+        Checks the player until Kodi exits.
+        '''
+        while not self.waitForAbort(self.CHECK_INTERVAL):
+            try:
+                self._checkPlayer()
+            except Exception as e:
+                xbmc.log('Toonmania2 | Preparing the next episode failed: ' + str(e), xbmc.LOGWARNING)
+
+
+    def _checkPlayer(self):
+        if not self.player.isPlayingVideo():
+            return
+        try:
+            remainingTime = self.player.getTotalTime() - self.player.getTime()
+        except RuntimeError:
+            return # Playback stopped after the check above.
+        if not 0.0 < remainingTime <= self.LEAD_TIME:
+            return
+
+        playlist = xbmc.PlayList(xbmc.PLAYLIST_VIDEO)
+        position = playlist.getposition()
+        if position < 0 or position + 1 >= playlist.size():
+            return
+        nextPath = playlist[position + 1].getPath()
+        if nextPath == self.lastPreparedPath or not nextPath.startswith(self.pluginURL) or '?' not in nextPath:
+            return
+        nextParams = dict(parse_qsl(nextPath.split('?', 1)[1], keep_blank_values=True))
+        if nextParams.get('view') != 'RESOLVE' or xbmcaddon.Addon().getSetting('preresolve_next') != 'true':
+            return
+
+        self.lastPreparedPath = nextPath
+        # Imported when first needed, during playback, so the cache uses the same Kodi window
+        # as the plugin invocations made by the playlist.
+        from Lib.Providers import preResolve
+        from Lib.ProviderHealth import providerHealth
+        from Lib.SimpleCache import simpleCache as cache
+        providerHealth.reload() # The plugin invocations changed it since the last time.
+        preResolve(nextParams)
+        cache.saveCacheIfDirty()
+
+
+def run():
+    PlaybackService().run()
@@ -2,7 +2,6 @@
 import re
 import sys
 from math import ceil
-from itertools import chain, islice
 
 import xbmc
 import xbmcgui
@@ -10,10 +9,17 @@ import xbmcaddon
 import xbmcplugin
 
 from Lib import parse_qsl, urlencode, DICT_ITER_ITEMS, DICT_ITER_KEYS, UNICODE
-from Lib.Providers import getEpisodeProviders, resolveProviderURL
+from Lib.Providers import (
+    getEpisodeProviders, resolveProviderURL, resolveFirstProvider, resolveAllParts, forgetStream
+)
+from Lib.ProviderRegistry import providerRegistry
+from Lib.ProviderHealth import providerHealth
+from Lib.PlaybackService import playbackWatch
 from Lib.SimpleCache import simpleCache as cache
 from Lib.SimpleTrakt import SimpleTrakt as trakt
 from Lib.RequestHelper import requestHelper
+from Lib.SearchCache import searchCache
+from Lib.SimpleSingleFlight import singleFlight
 from Lib.CatalogHelper import catalogHelper
 #from Lib.SimpleTVDB import tvdb # Unused. Potentially get per-episode thumbnails and descriptions in the future.
 
@@ -40,6 +46,7 @@ def viewMenu(params):
     Directory for the main add-on menu.
     '''
     cache.saveCacheIfDirty()
+    cache.sweepCache()
 
     def _menuItem(view, title, isFolder):
         return (buildURL({'view': view}), xbmcgui.ListItem(title), isFolder)
@@ -71,6 +78,84 @@ def viewClearCache(params):
         xbmc.executebuiltin('Dialog.Close(all)')
 
 
+def viewCacheUsage(params):
+    totalBytes, totalEntries = cache.getCacheUsage()
+    xbmcgui.Dialog().ok(
+        'Toonmania2', 'Cache size: [B]%.1f MB[/B] in [B]%i[/B] entries.' % (totalBytes / 1048576.0, totalEntries)
+    )
+
+
+def viewCacheBenchmark(params):
+    '''
+    Benchmarks the cache codecs with the biggest cached catalog route, to help choosing the 'cache_codec' setting.
+    '''
+    from Lib.SimpleCacheCodecs import formatBenchmark
+    routesData = (
+        cache.peekCacheProperty(cache.diskFriendlyPropName(api + route))
+        for api in (requestHelper.API_ANIMETOON, requestHelper.API_ANIMEPLUS)
+        for route in catalogHelper.getMainRoutes(api)
+    )
+    data = max(routesData, key=lambda jsonData: len(jsonData) if jsonData else 0)
+    if data:
+        xbmcgui.Dialog().textviewer('Toonmania2 Cache Codecs', formatBenchmark(cache.benchmarkCodecs(data)))
+    else:
+        xbmcgui.Dialog().notification('Toonmania2', 'Open an "All" catalog first', xbmcgui.NOTIFICATION_INFO, 3000, False)
+
+
+def viewBenchmark(params):
+    '''
+    Times the main add-on paths against the fixture server, see Lib/Benchmark.py.
+    '''
+    if not ADDON.getSetting('fixture_proxy'):
+        xbmcgui.Dialog().notification('Toonmania2', 'Set the fixture server first', xbmcgui.NOTIFICATION_INFO, 3000, False)
+        return
+    if not xbmcgui.Dialog().yesno('Toonmania2', 'The benchmark clears the cache. Continue?'):
+        return
+    from Lib.Benchmark import runBenchmark, formatBenchmark
+    progress = xbmcgui.DialogProgressBG()
+    progress.create('Toonmania2', 'Running benchmark...')
+    try:
+        results = runBenchmark()
+    finally:
+        progress.close()
+    xbmcgui.Dialog().textviewer('Toonmania2 Benchmark', formatBenchmark(results))
+
+
+def viewCacheStats(params):
+    '''
+    Shows the cache statistics of each property, to see how well the cache is doing.
+    '''
+    if params.get('reset'):
+        cache.resetCacheStats()
+        xbmcgui.Dialog().notification('Toonmania2', 'Cache statistics reset', xbmcgui.NOTIFICATION_INFO, 2500, False)
+        return
+
+    def _average(counters, event):
+        return counters.get(event + 'Ms', 0.0) / counters[event] if counters.get(event) else 0.0
+
+    lines = ['%-40s %8s %12s %6s %12s %10s %10s' % (
+        'property', 'memory', 'disk (ms)', 'miss', 'web (ms)', 'KB read', 'KB saved'
+    )]
+    stats = cache.getCacheStats()
+    for propName in sorted(stats):
+        counters = stats[propName]
+        lines.append('%-40s %8i %5i (%4.0f) %6i %5i (%4.0f) %10.1f %10.1f' % (
+            propName[-40:],
+            counters.get('memory', 0),
+            counters.get('disk', 0),
+            _average(counters, 'disk'),
+            counters.get('miss', 0),
+            counters.get('web', 0),
+            _average(counters, 'web'),
+            counters.get('bytesRead', 0) / 1024.0,
+            counters.get('bytesWritten', 0) / 1024.0
+        ))
+    if len(lines) > 1:
+        xbmcgui.Dialog().textviewer('Toonmania2 Cache Statistics', '\n'.join(lines))
+    else:
+        xbmcgui.Dialog().notification('Toonmania2', 'No cache statistics yet', xbmcgui.NOTIFICATION_INFO, 3000, False)
+
+
 def viewAnimetoonMenu(params):
     '''
     Directory for the Animetoon website.
@@ -129,7 +214,12 @@ def _viewSearchResults(params, text):
     Sub directory as an intermediary step before showing the search results catalog.
     This lets you favourite your search results so you can come back to them later.
     '''
-    searchData = requestHelper.nameSearchEntries(params['api'], text) # Does the actual web requests.
+    searchData = searchCache.getResults(params['api'], text) # Repeated searches don't need web requests.
+    if not searchData:
+        searchData = requestHelper.nameSearchEntries(params['api'], text) # Does the actual web requests.
+        searchData = tuple(searchData) if searchData else None # Reads all the result pages.
+        if searchData:
+            searchCache.setResults(params['api'], text, searchData)
     if searchData:
         # Make an item leading to the the 'ALL' catalog section instead of the main catalog menu, because
         # the name search results are usually fewer.
@@ -229,9 +319,7 @@ def viewSearchGenre(params):
         # The data from the '/GetGenres/' route is a dict with a list of genre names like "Action",
         # "Comedy" etc., but it also has some weird texts in the list probably from data entry errors.
         requestHelper.setAPISource(api)
-        requestHelper.delayBegin()
-        genreList = requestHelper.routeGET(route).get('genres', [ ])
-        requestHelper.delayEnd()
+        genreList = requestHelper.routeGET(route, 200).get('genres', [ ])
         # Store the current API genres in a disk-persistent property with 1 week of lifetime.
         cache.setCacheProperty(_PROPERTY_GENRE_NAMES, genreList, saveToDisk = True, lifetime = cache.LIFETIME_ONE_WEEK)
 
@@ -324,7 +412,7 @@ def viewCatalogMenu(params):
     '''
     xbmcplugin.setContent(int(sys.argv[1]), 'tvshows')
 
-    catalog = catalogHelper.getCatalog(params)
+    manifest = catalogHelper.getCatalogManifest(params) # Only the section sizes are needed here.
 
     api = params['api']
     route = params['route']
@@ -335,7 +423,7 @@ def viewCatalogMenu(params):
             xbmcgui.ListItem(sectionKey),
             True
         )
-        for sectionKey in sorted(DICT_ITER_KEYS(catalog)) if len(catalog[sectionKey]) > 0
+        for sectionKey in sorted(DICT_ITER_KEYS(manifest)) if manifest[sectionKey] > 0
     )
 
     if len(listItems):
@@ -364,7 +452,7 @@ def viewCatalogSection(params):
     
     cache.saveCacheIfDirty()
 
-    catalog = catalogHelper.getCatalog(params)
+    manifest = catalogHelper.getCatalogManifest(params)
     showThumbs = isSettingTrue('show_thumbnails')
     sectionKey = params['section']
 
@@ -403,16 +491,14 @@ def viewCatalogSection(params):
         start = page * pageSize
         stop = start + pageSize
 
+        # The "ALL" pseudo-section is all sections flattened, the catalog helper only reads the sections
+        # that overlap the current directory page.
+        itemsIterable = catalogHelper.getCatalogSection(params, sectionKey, start, stop)
         if sectionKey == 'ALL':
-            # Create pages for the pseudo-section "ALL":
-            # Flatten all sections into an iterable, which is then islice'd to get the current directory page.
-            flatSections = chain.from_iterable(catalog[sectionKey] for sectionKey in sorted(DICT_ITER_KEYS(catalog)))
-            itemsIterable = (entry for entry in islice(flatSections, start, stop))
-            totalSectionPages = int(ceil(sum(len(section) for section in catalog.itervalues()) / float(pageSize)))
+            totalItems = sum(manifest.values())
         else:
-            # Do an islice of a specific section.
-            itemsIterable = (entry for entry in islice(catalog[sectionKey], start, stop))
-            totalSectionPages = int(ceil(len(catalog[sectionKey]) / float(pageSize))) # The 'float' is for Python 2.
+            totalItems = manifest.get(sectionKey, 0)
+        totalSectionPages = int(ceil(totalItems / float(pageSize))) # The 'float' is for Python 2.
 
         page += 1
         if totalSectionPages > 1 and page < totalSectionPages:
@@ -423,12 +509,7 @@ def viewCatalogSection(params):
             xbmcplugin.addSortMethod(int(sys.argv[1]), xbmcplugin.SORT_METHOD_LABEL_IGNORE_THE)
             xbmcplugin.addDirectoryItems(int(sys.argv[1]), tuple(_catalogSectionItems(itemsIterable)))
     else:
-        if sectionKey == 'ALL':
-            itemsIterable = (
-                entry for entry in chain.from_iterable(catalog[sectionKey] for sectionKey in sorted(DICT_ITER_KEYS(catalog)))
-            )
-        else:
-            itemsIterable = (entry for entry in catalog[sectionKey])
+        itemsIterable = catalogHelper.getCatalogSection(params, sectionKey)
         xbmcplugin.addSortMethod(int(sys.argv[1]), xbmcplugin.SORT_METHOD_LABEL_IGNORE_THE)
         xbmcplugin.addDirectoryItems(int(sys.argv[1]), tuple(_catalogSectionItems(itemsIterable)))
 
@@ -481,19 +562,47 @@ def _makeEpisodeItems(api, episodes, showTitle, showGenres, showThumb, showPlot,
         yield (url, item, False)
 
 
-def _makeEpisodePartItems(episodeEntry, providers, showTitle, showGenres, showThumb, showPlot, showDate):
+def _makeEpisodePartItems(api, episodeEntry, providers, showTitle, showGenres, showThumb, showPlot, showDate):
     '''
     Similar logic to _makeEpisodeItems(), but it works on just one item with multiple streams.
     This will make one (repeated) xbmc.ListItem for the several parts, each part points to a stream.
+    With the 'play_parts_together' setting on, each provider also gets an item that plays all of its
+    parts as one video, see viewResolve().
     '''
     playlist = getPlaylist()
     addedFirstProvider = False
+    playPartsTogether = isSettingTrue('play_parts_together')
 
     episodeName = episodeEntry['name']
     season, episode = getTitleInfo(episodeName)
     episodeDate = episodeEntry['date'][ : 10] if 'date' in episodeEntry else showDate
 
     for providerName, providerURLs in DICT_ITER_ITEMS(providers):
+        if playPartsTogether:
+            allPartsName = '[B]%s[/B] | %s | [B]ALL PARTS[/B]' % (providerName, episodeName)
+            item = xbmcgui.ListItem(allPartsName)
+            setupListItem(item, showTitle, allPartsName, True, season, episode, showGenres, showThumb, showPlot, episodeDate)
+            url = buildURL(
+                {
+                    'view': 'RESOLVE',
+                    'api': api,
+                    'episodeID': episodeEntry['id'],
+                    'showTitle': showTitle,
+                    'name': allPartsName,
+                    'season': str(season),
+                    'episode': str(episode),
+                    'genres': ','.join(showGenres),
+                    'thumb': showThumb,
+                    'plot': showPlot,
+                    'date': episodeDate,
+                    'allParts': providerName,
+                    'providers': str(providers) # Unresolved URLs, so the other providers can stand in for failed parts.
+                }
+            )
+            if not addedFirstProvider:
+                playlist.add(url, item)
+            yield (url, item, False)
+
         for partIndex, providerURL in enumerate(providerURLs, 1):
             partName = '[B]%s[/B] | %s | [B]PART %i[/B]' % (providerName, episodeName, partIndex)
             item = xbmcgui.ListItem(partName)
@@ -512,7 +621,7 @@ def _makeEpisodePartItems(episodeEntry, providers, showTitle, showGenres, showTh
                     'providerURL': providerURL
                 }
             )
-            if not addedFirstProvider:
+            if not addedFirstProvider and not playPartsTogether:
                 playlist.add(url, item)
 
             yield (url, item, False)
@@ -543,12 +652,21 @@ def viewListEpisodes(params):
     if lastShowDetails and showKey in lastShowDetails:
         jsonData = lastShowDetails[showKey] # Use the show ID + API name as the unique identifier.
     if not jsonData:
-        requestHelper.setAPISource(api)
-        requestHelper.delayBegin()
-        jsonData = requestHelper.routeGET('/GetDetails/' + params['id'])
-        if jsonData:
-            cache.setCacheProperty(_PROPERTY_LAST_SHOW_DETAILS, {showKey: jsonData}, saveToDisk=False)
-        requestHelper.delayEnd()
+        # If another add-on invocation is already requesting these details, wait for it and use them.
+        flightKey = api + '/GetDetails/' + params['id']
+        isLeader = singleFlight.begin(flightKey)
+        if not isLeader:
+            lastShowDetails = cache.getCacheProperty(_PROPERTY_LAST_SHOW_DETAILS, readFromDisk=False)
+            jsonData = lastShowDetails.get(showKey) if lastShowDetails else None
+        if not jsonData:
+            try:
+                requestHelper.setAPISource(api)
+                jsonData = requestHelper.routeGET('/GetDetails/' + params['id'], 200)
+                if jsonData:
+                    cache.setCacheProperty(_PROPERTY_LAST_SHOW_DETAILS, {showKey: jsonData}, saveToDisk=False)
+            finally:
+                if isLeader:
+                    singleFlight.end(flightKey)
 
     # Genres, thumb and plot are taken from the parent show \ movie.
     # But the date of the parent show \ movie will only be used if the individual episode doesn't have a date itself.
@@ -583,12 +701,12 @@ def viewListEpisodes(params):
                 cache.setCacheProperty(_PROPERTY_LAST_EPISODE_DETAILS, {episodeKey: episodeProviders}, saveToDisk=False)
 
         if episodeProviders:
-            if len(next(episodeProviders.itervalues())) > 1: # If it's a multi-video-part media.
+            if len(next(iter(episodeProviders.values()))) > 1: # If it's a multi-video-part media.
                 xbmcplugin.addDirectoryItems(
                     int(sys.argv[1]),
                     tuple(
                         _makeEpisodePartItems(
-                            episodeEntry, episodeProviders, showTitle, showGenres, showThumb, showPlot, showDate
+                            api, episodeEntry, episodeProviders, showTitle, showGenres, showThumb, showPlot, showDate
                         )
                     )
                 )
@@ -613,9 +731,17 @@ def viewResolve(params):
     '''
     Resolves and plays the chosen episode, based on the API and ID supplied in 'params'.
     '''
-    cache.saveCacheIfDirty() # Save the cache, only if necessary, before watching a video.
-
     stream = None
+    providerName = None # Provider of the stream, to record if it fails to play.
+    partStreams = None # The streams of the parts when playing all the parts of a movie.
+
+    # Resolved streams are reused for a while, forget the ones that failed to start since the last
+    # resolve so they're resolved again.
+    for failedStreams, failedProvider in playbackWatch.takeFailed():
+        for failedStream in failedStreams:
+            forgetStream(failedStream)
+        if failedProvider:
+            providerHealth.record(failedProvider, False)
 
     if 'stream' in params:
         # BACKWARDS COMPATIBILITY: Toonmania2 0.4.4.
@@ -623,6 +749,16 @@ def viewResolve(params):
         stream = params['stream']
     elif 'providerURL' in params:
         stream = resolveProviderURL(params['providerURL'])
+        providerName = providerRegistry.classify(params['providerURL'])
+    elif 'allParts' in params:
+        # All the parts of a movie, resolved at the same time and played as one stacked video.
+        from ast import literal_eval
+        parts = resolveAllParts(literal_eval(params['providers']), params['allParts'])
+        if parts:
+            providerName = params['allParts']
+            partStreams = [partStream for partProvider, partStream in parts]
+            # Kodi's stack format: paths separated by ' , ', with any commas in the paths doubled.
+            stream = 'stack://' + ' , '.join(partStream.replace(',', ',,') for partStream in partStreams)
     else:
         providers = None
         if 'providers' in params:
@@ -634,14 +770,22 @@ def viewResolve(params):
 
         if providers:
             if isSettingTrue('autoplay'):
-                from random import choice
-                randomKey = choice(tuple(DICT_ITER_KEYS(providers)))
-                stream = resolveProviderURL(providers[randomKey][0])
+                # Play the first provider to resolve, out of the healthiest ones resolved at the same time.
+                firstResolved = resolveFirstProvider(providers)
+                if firstResolved:
+                    providerName, stream = firstResolved
             else:
-                index = xbmcgui.Dialog().select('Select Provider', tuple(name for name in DICT_ITER_KEYS(providers)))
+                # List the healthiest providers first, with their success rate and resolve time.
+                providerNames = providerHealth.sortProviders(DICT_ITER_KEYS(providers))
+                def _providerLabel(name):
+                    summary = providerHealth.getSummary(name)
+                    if summary:
+                        return name + '  [COLOR gray]%i%%, %.1f s[/COLOR]' % (summary[0] * 100, summary[1] / 1000.0)
+                    return name
+                index = xbmcgui.Dialog().select('Select Provider', tuple(_providerLabel(name) for name in providerNames))
                 if index >= 0:
-                    chosenKey = next(key for keyIndex, key in enumerate(DICT_ITER_KEYS(providers)) if keyIndex == index)
-                    stream = resolveProviderURL(providers[chosenKey][0])
+                    providerName = providerNames[index]
+                    stream = resolveProviderURL(providers[providerName][0])
                 else:
                     # User cancelled the 'Select Provider' dialog.
                     xbmcplugin.setResolvedUrl(int(sys.argv[1]), False, xbmcgui.ListItem('None'))
@@ -662,11 +806,18 @@ def viewResolve(params):
             params.get('date', '')
         )
         item.setPath(stream)
+        # The service tells if it starts, so this invocation doesn't wait for it.
+        playbackWatch.begin(stream, partStreams, providerName)
         xbmcplugin.setResolvedUrl(int(sys.argv[1]), True, item)
     else:
         logStreamError(params['api'], params['showTitle'], params['episodeID'])
         xbmcplugin.setResolvedUrl(int(sys.argv[1]), False, xbmcgui.ListItem('None'))
 
+    # Save the provider health of the resolves (failed ones included) and the cache, only if necessary,
+    # after the video started so that it doesn't wait for it.
+    providerHealth.flush()
+    cache.saveCacheIfDirty()
+
 
 def getPlaylist():
     playlist = xbmc.PlayList(xbmc.PLAYLIST_VIDEO)
@@ -778,6 +929,10 @@ VIEW_FUNCS = {
     'TRAKT_ITEM': viewTraktItem,
 
     'CLEAR_CACHE': viewClearCache,
+    'CACHE_USAGE': viewCacheUsage,
+    'CACHE_BENCHMARK': viewCacheBenchmark,
+    'CACHE_STATS': viewCacheStats,
+    'BENCHMARK': viewBenchmark,
     'CLEAR_TRAKT': viewClearTrakt,
     'LIST_EPISODES': viewListEpisodes,
     'RESOLVE': viewResolve
@@ -794,4 +949,5 @@ def main():
     Uses the global VIEW_FUNCS dictionary.
     '''
     params = dict(pair for pair in parse_qsl(sys.argv[2][1:], keep_blank_values=True))
-    VIEW_FUNCS[params.get('view', 'MENU')](params)
\ No newline at end of file
+    VIEW_FUNCS[params.get('view', 'MENU')](params)
+    cache.flushCacheStats()
\ No newline at end of file
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+from time import time
+from threading import Lock
+
+from Lib.SimpleCache import simpleCache as cache
+
+
+# Health of the video providers, to try the providers that usually work (and work fast) first.
+
+# Each provider has a success rate and a resolve latency, both exponential moving averages of its
+# latest resolves. Old measurements fade back towards neutral values over time, so a provider that
+# was down gets tried again some day. Resolves can happen in worker threads, so they're accumulated
+# in this object and merged into a disk-enabled cache property by the main thread with flush().
+
+class ProviderHealth():
+
+    # Disk-enabled property with the health of each provider, a dict of provider names
+    # mapped to [successRate, latencyMs, lastTime].
+    PROPERTY_HEALTH = 'toonmania2.providerHealth'
+
+    SMOOTHING = 0.3 # Weight of the latest resolve in the moving averages.
+    HALF_LIFE = 48 * 3600 # Seconds for old measurements to fade halfway back to the neutral values.
+
+    # Neutral values, for providers that weren't measured yet.
+    NEUTRAL_SUCCESS = 0.75
+    NEUTRAL_LATENCY = 2000.0
+
+
+    def __init__(self):
+        self.pending = [ ]
+        self.lock = Lock()
+        self.health = None
+
+
+    def record(self, providerName, success, latencyMs=0.0):
+        '''
+        Records the outcome of resolving (or playing) a provider. Can be called from worker threads.
+        :param providerName: A name from getEpisodeProviders(), the ' (2)' etc. suffix is ignored.
+        '''
+        with self.lock:
+            self.pending.append((self._baseName(providerName), success, latencyMs, time()))
+
+
+    def flush(self):
+        '''
+        Merges the recorded outcomes into the health property, from the main thread.
+        '''
+        with self.lock:
+            pending, self.pending = self.pending, [ ]
+        if not pending:
+            return
+        self.health = None # Start from the latest health, other add-on invocations might have changed it.
+        health = dict(self._loadHealth())
+        for providerName, success, latencyMs, recordTime in pending:
+            successRate, latency = self._getValues(health.get(providerName), recordTime)
+            successRate += self.SMOOTHING * ((1.0 if success else 0.0) - successRate)
+            if success and latencyMs:
+                latency += self.SMOOTHING * (latencyMs - latency)
+            health[providerName] = [successRate, latency, recordTime]
+        self.health = health
+        cache.setCacheProperty(self.PROPERTY_HEALTH, health, saveToDisk=True, lifetime=cache.LIFETIME_FOREVER)
+
+
+    def reload(self):
+        '''
+        Forgets the loaded health so the latest one is used, for scripts that outlive a plugin
+        invocation like the playback service.
+        '''
+        self.health = None
+
+
+    def getScore(self, providerName):
+        '''
+        :returns: A score where higher is better, the success rate divided by the latency in seconds (plus one).
+        '''
+        successRate, latency = self._getValues(self._loadHealth().get(self._baseName(providerName)), time())
+        return successRate / (1.0 + latency / 1000.0)
+
+
+    def getSummary(self, providerName):
+        '''
+        :returns: A tuple (successRate, latencyMs) of a provider, or None if it wasn't measured yet.
+        '''
+        entry = self._loadHealth().get(self._baseName(providerName))
+        return tuple(self._getValues(entry, time())) if entry else None
+
+
+    def sortProviders(self, providerNames):
+        '''
+        :returns: A list of the provider names with the best scoring ones first.
+        '''
+        return sorted(providerNames, key=self.getScore, reverse=True)
+
+
+    def _getValues(self, entry, currentTime):
+        # The measured values, faded towards the neutral values by their age.
+        if not entry:
+            return self.NEUTRAL_SUCCESS, self.NEUTRAL_LATENCY
+        successRate, latency, lastTime = entry
+        weight = 0.5 ** (max(currentTime - lastTime, 0.0) / self.HALF_LIFE)
+        return (
+            self.NEUTRAL_SUCCESS + (successRate - self.NEUTRAL_SUCCESS) * weight,
+            self.NEUTRAL_LATENCY + (latency - self.NEUTRAL_LATENCY) * weight
+        )
+
+
+    def _loadHealth(self):
+        if self.health == None:
+            self.health = cache.getCacheProperty(self.PROPERTY_HEALTH, readFromDisk=True) or { }
+        return self.health
+
+
+    def _baseName(self, providerName):
+        # From 'PLAY44.NET (2)' get 'PLAY44.NET'.
+        return providerName.split(' (', 1)[0]
+
+
+providerHealth = ProviderHealth()
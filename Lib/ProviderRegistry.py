@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+import re
+import sys
+import json
+from time import time
+from os import listdir, path as osPath
+
+
+# Registry of the "mostly" supported video providers, used to tell the provider of a URL and to
+# get the stream out of a provider page. It doesn't use any Kodi modules, so it can be benchmarked
+# outside of Kodi (see the end of this file).
+
+# Resolving not available for these right now, they need to be researched on how to solve:
+# 'cheesestream.com', '4vid.me', 'video66.org', 'videobug.net', 'videofun.me', 'vidzur.com'.
+
+# Stream patterns of the provider pages, compiled once.
+_VIDEO_LINKS_PATTERN = re.compile(r'''var video_links.*?['"]link['"]\s*?:\s*?['"](.*?)['"]''', re.DOTALL)
+_URL_PATTERN = re.compile(r'''{\s*?url\s*?:\s*?['"](.*?)['"]''', re.DOTALL)
+_FILE_PATTERN = re.compile(r'''file\s*?:\s*?['"](.*?)['"]''', re.DOTALL)
+
+
+def extractGeneric(html):
+    '''
+    The stream extractor used by all the providers so far.
+    :returns: The first stream URL found in a provider page, or None.
+    '''
+    if 'var video_links' in html:
+        # The generic videozoo \ play44 page.
+        match = _VIDEO_LINKS_PATTERN.search(html)
+    else:
+        # Variants (found sometimes in Playpanda.net etc.).
+        match = _URL_PATTERN.search(html) or _FILE_PATTERN.search(html)
+    return match.group(1).replace(r'\/', r'/') if match else None # Unescape any potential escaped JS slashes.
+
+
+class ProviderRegistry():
+
+    def __init__(self):
+        self.extractors = { } # Provider names mapped to their extractor functions.
+        self.variantIndex = { } # Variant names mapped to their provider names, see classify().
+
+
+    def register(self, providerName, variants, extractor=extractGeneric):
+        '''
+        Adds a supported provider.
+        :param variants: The names of the provider that come up in its URLs, between dots or with
+        their domain suffix (like 'play44' and 'play44.net').
+        :param extractor: A function that takes the HTML of a provider page and returns the stream URL, or None.
+        '''
+        self.extractors[providerName] = extractor
+        for variant in variants:
+            self.variantIndex[variant] = providerName
+
+
+    def classify(self, url):
+        '''
+        :returns: The name of the provider of 'url', or None if it's not a supported provider.
+        '''
+        # The words between dots, like 'www', 'play44' and 'net/embed' from 'http://www.play44.net/embed...'.
+        # Each word is also tried with the next one up to any slash, for the variants with a dot like 'play44.net'.
+        schemeEnd = url.find('://')
+        words = (url[schemeEnd+3:] if schemeEnd != -1 else url).split('.')
+        lastIndex = len(words) - 1
+        for index, word in enumerate(words):
+            providerName = self.variantIndex.get(word)
+            if not providerName and index < lastIndex:
+                providerName = self.variantIndex.get(word + '.' + words[index+1].split('/', 1)[0])
+            if providerName:
+                return providerName
+        return None
+
+
+    def extractStream(self, providerName, html):
+        '''
+        :returns: The stream URL from the page of a provider, or None if it's not found.
+        '''
+        return self.extractors.get(providerName, extractGeneric)(html)
+
+
+providerRegistry = ProviderRegistry()
+providerRegistry.register('VIDEOZOO.ME', ('videozoo.me', 'videozoome', 'videozoo'))
+providerRegistry.register('PLAY44.NET', ('play44.net', 'play44net', 'play44'))
+providerRegistry.register('EASYVIDEO.ME', ('easyvideo.me', 'easyvideome', 'easyvideo'))
+providerRegistry.register('PLAYBB.ME', ('playbb.me', 'playbbme', 'playbb'))
+providerRegistry.register('PLAYPANDA.NET', ('playpanda.net', 'playpandanet', 'playpanda'))
+providerRegistry.register('VIDEOWING.ME', ('videowing.me', 'videowingme', 'videowing'))
+
+
+def benchmark(fixturesDir, repeat=20):
+    '''
+    Measures the classification of the URLs in the saved '/GetVideos/' payloads, and the stream extraction
+    of the saved provider pages, from a folder of fixtures recorded with Lib/FixtureServer.py.
+    :returns: A list of (step, item count, total ms, microseconds per item) tuples.
+    '''
+    videoURLs = [ ]
+    providerPages = [ ]
+    for fileName in listdir(fixturesDir):
+        if fileName.endswith('.meta'):
+            with open(osPath.join(fixturesDir, fileName), 'r') as metaFile:
+                url = json.load(metaFile)['url']
+            with open(osPath.join(fixturesDir, fileName[:-5] + '.body'), 'rb') as bodyFile:
+                body = bodyFile.read().decode('utf-8', 'replace')
+            if '/GetVideos/' in url:
+                jsonData = json.loads(body)
+                for element in jsonData:
+                    if isinstance(element, dict):
+                        videoURLs.append(element['url'])
+                    elif isinstance(element, list):
+                        videoURLs.extend(element)
+                    else:
+                        videoURLs.append(element)
+            else:
+                providerName = providerRegistry.classify(url)
+                if providerName:
+                    providerPages.append((providerName, body))
+
+    def _bestTime(function, items):
+        bestTime = None
+        for index in range(repeat):
+            startTime = time()
+            for item in items:
+                function(item)
+            elapsed = (time() - startTime) * 1000.0
+            bestTime = elapsed if bestTime == None else min(bestTime, elapsed)
+        return bestTime
+
+    results = [ ]
+    for step, function, items in (
+        ('classify', providerRegistry.classify, videoURLs),
+        ('extract', lambda page: providerRegistry.extractStream(*page), providerPages)
+    ):
+        totalTime = _bestTime(function, items) if items else 0.0
+        results.append((step, len(items), totalTime, totalTime * 1000.0 / len(items) if items else 0.0))
+    return results
+
+
+def formatBenchmark(results):
+    lines = ['%-10s %8s %10s %10s' % ('step', 'items', 'total ms', 'us/item')]
+    for step, count, totalTime, itemTime in results:
+        lines.append('%-10s %8i %10.2f %10.2f' % (step, count, totalTime, itemTime))
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    # Benchmark outside of Kodi with a folder of fixtures:
+    # python -m Lib.ProviderRegistry fixtures/
+    print(formatBenchmark(benchmark(sys.argv[1])))
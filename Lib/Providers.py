@@ -1,21 +1,32 @@
 # -*- coding: utf-8 -*-
-import re
+from ast import literal_eval
+from time import time
+from random import shuffle
+from threading import Lock
 
-from Lib.RequestHelper import requestHelper
+import xbmcaddon
 
+from Lib import DICT_ITER_ITEMS, DICT_ITER_KEYS
+from Lib.SimpleCache import simpleCache as cache
+from Lib.RequestHelper import requestHelper, mapConcurrently, firstConcurrently, getConcurrency
+from Lib.ProviderRegistry import providerRegistry
+from Lib.ProviderHealth import providerHealth
 
-# Internal dictionary of "mostly" supported providers, each key is a provider name, each value is a
-# set of variant names for each provider. All these variants come up in the URLs...
-_SUPPORTED_PROVIDERS = {
-    'VIDEOZOO.ME': set(('videozoo.me', 'videozoome', 'videozoo')),
-    'PLAY44.NET': set(('play44.net', 'play44net', 'play44')),
-    'EASYVIDEO.ME': set(('easyvideo.me', 'easyvideome', 'easyvideo')),
-    'PLAYBB.ME': set(('playbb.me', 'playbbme', 'playbb')),
-    'PLAYPANDA.NET': set(('playpanda.net', 'playpandanet', 'playpanda')),
-    'VIDEOWING.ME': set(('videowing.me', 'videowingme', 'videowing'))
-}
-# Resolving not available for these right now, they need to be researched on how to solve:
-# 'cheesestream.com', '4vid.me', 'video66.org', 'videobug.net', 'videofun.me', 'vidzur.com'.
+
+# Memory-only property with the recently resolved streams, a dict of provider URLs mapped to
+# [stream, expiryTime]. Replaying or resuming an episode then doesn't need to resolve it again.
+_PROPERTY_STREAMS = 'tmania2.prop.streams'
+# Streams are resolved (and cached) from worker threads, see resolveFirstProvider() and resolveAllParts().
+_streamsLock = Lock()
+
+# Seconds that a resolved stream is reused. The stream links of the providers usually last for hours,
+# this is kept well below that. Streams that fail to play are forgotten sooner, see forgetStream().
+STREAM_LIFETIME = 1800
+
+# Memory-only property with the providers of the latest episodes, a dict of API + episode IDs mapped to
+# [providers, expiryTime]. They're kept for STREAM_LIFETIME seconds as well, see preResolve().
+_PROPERTY_EPISODE_PROVIDERS = 'tmania2.prop.episodeProviders'
+MAX_CACHED_EPISODES = 10
 
 
 def getEpisodeProviders(api, episodeID):
@@ -26,10 +37,13 @@ def getEpisodeProviders(api, episodeID):
     Usually each provider list has a single stream list, but in some rare cases there's more than
     one set of streams for the same provider.
     '''
+    episodeKey = api + episodeID
+    episodesProviders = cache.getCacheProperty(_PROPERTY_EPISODE_PROVIDERS, readFromDisk=False) or { }
+    if episodeKey in episodesProviders and time() < episodesProviders[episodeKey][1]:
+        return episodesProviders[episodeKey][0]
+
     requestHelper.setAPISource(api)
-    requestHelper.delayBegin()
     jsonData = requestHelper.routeGET('/GetVideos/' + episodeID)
-    requestHelper.delayEnd(1000)
 
     if not jsonData:
         return None
@@ -51,19 +65,7 @@ def getEpisodeProviders(api, episodeID):
 
     for url in providerURLs:
         # Try to get the provider name from the URL to see if we support resolving it.
-        if url.startswith('http://'):
-            tempURL = url.replace('http://', '')
-        elif url.startswith('https://'):
-            tempURL = url.replace('https://', '')
-
-        providerName = next(
-            (
-                key
-                for word in tempURL.split('.')
-                for key in _SUPPORTED_PROVIDERS.iterkeys() if word in _SUPPORTED_PROVIDERS[key]
-            ),
-            None
-        )
+        providerName = providerRegistry.classify(url)
         if not providerName:
             continue # It's not a supported provider (or we failed finding its name).
 
@@ -83,34 +85,166 @@ def getEpisodeProviders(api, episodeID):
     # providers[videozoo] = [[...], [...], [...]] becomes providers[videozoo][...], providers[videozoo2][...], etc.
     allProviders = {
         (providerName if index == 1 else providerName + ' (' + str(index) + ')'): urlList
-        for providerName in providers.iterkeys()
-        for index, urlList in enumerate(providers[providerName], 1)        
+        for providerName, urlLists in DICT_ITER_ITEMS(providers)
+        for index, urlList in enumerate(urlLists, 1)
     }
-    return allProviders if allProviders else None
+    if not allProviders:
+        return None
+
+    # Keep the latest episodes only, dropping the ones that expire first.
+    currentTime = time()
+    episodesProviders = dict(
+        sorted(
+            ((key, entry) for key, entry in DICT_ITER_ITEMS(episodesProviders) if entry[1] > currentTime),
+            key=lambda item: item[1][1]
+        )[-(MAX_CACHED_EPISODES-1):]
+    )
+    episodesProviders[episodeKey] = [allProviders, currentTime + STREAM_LIFETIME]
+    cache.setCacheProperty(_PROPERTY_EPISODE_PROVIDERS, episodesProviders, saveToDisk=False)
+    return allProviders
 
 
-def resolveProviderURL(providerURL):
+def resolveProviderURL(providerURL, helper=requestHelper):
     '''
     Tries to resolve a provider URL into a stream.
+    :param helper: The RequestHelper to request with, worker threads use their own.
     '''
+    stream = getCachedStream(providerURL)
+    if stream:
+        return stream
+    providerName = providerRegistry.classify(providerURL)
+    startTime = time()
     try:
-        temp = None
-        requestHelper.delayBegin()
-        r = requestHelper.GET(providerURL)
+        r = helper.GET(providerURL) # Rate limited per provider host.
         if r.ok:
-            html = r.text
-            if 'var video_links' in html:
-                # Try the generic videozoo \ play44 resolve first:
-                temp = re.findall(r'''var video_links.*?['"]link['"]\s*?:\s*?['"](.*?)['"]''', html, re.DOTALL)
-            else:
-                # Try variants (found sometimes in Playpanda.net etc.):
-                temp = re.findall(r'''{\s*?url\s*?:\s*?['"](.*?)['"]''', html, re.DOTALL)
-                if not temp:
-                    temp = re.findall(r'''file\s*?:\s*?['"](.*?)['"]''', html, re.DOTALL)
-            requestHelper.delayEnd(1000) # Sleep this thread a little before the next request, if necessary.
-        if temp:
-            return temp[0].replace(r'\/', r'/') # Unescape any potential escaped JS slashes.
+            # Go straight to the stream extractor of the provider.
+            stream = providerRegistry.extractStream(providerName, r.text)
+            if stream:
+                _cacheStream(providerURL, stream)
     except:
         pass
+    # A resolve that was cancelled (see resolveFirstProvider()) doesn't tell anything about the provider.
+    if providerName and (stream or not helper.isCancelled):
+        providerHealth.record(providerName, bool(stream), (time() - startTime) * 1000.0)
+    return stream
+
+
+def resolveFirstProvider(providers):
+    '''
+    Resolves the providers from getEpisodeProviders() starting with the healthiest ones (see ProviderHealth),
+    several of them at the same time (from the 'autoplay_fanout' add-on setting), and returns as soon as one
+    of them resolves. This way a dead provider doesn't hold up the playback.
+    :returns: A tuple (providerName, stream), or None if no provider could be resolved.
+    '''
+    providerNames = list(DICT_ITER_KEYS(providers))
+    shuffle(providerNames) # Spread the load between the providers that score the same.
+    providerNames = providerHealth.sortProviders(providerNames)
+
+    # A provider that was resolved recently is used right away.
+    for providerName in providerNames:
+        stream = getCachedStream(providers[providerName][0])
+        if stream:
+            return providerName, stream
+
+    def _resolveHelper(helper, providerName):
+        return resolveProviderURL(providers[providerName][0], helper)
+    return firstConcurrently(_resolveHelper, providerNames, _getFanOut())
+
+
+def resolveAllParts(providers, providerName):
+    '''
+    Resolves all the parts of a multi-part video (a movie) from one provider at the same time.
+    A part that doesn't resolve is taken from the other providers that have the same number of
+    parts, the healthiest ones first.
+    :returns: A list of (providerName, stream) tuples in part order, or None if a part couldn't be resolved.
+    '''
+    partURLs = providers[providerName]
+
+    def _resolveHelper(helper, providerURL):
+        return resolveProviderURL(providerURL, helper)
+    streams = list(mapConcurrently(_resolveHelper, partURLs, getConcurrency()))
+
+    # Providers with a different number of parts split the video at different times.
+    otherNames = providerHealth.sortProviders(
+        name for name in DICT_ITER_KEYS(providers) if name != providerName and len(providers[name]) == len(partURLs)
+    )
+    parts = [ ]
+    for partIndex, stream in enumerate(streams):
+        if stream:
+            parts.append((providerName, stream))
+            continue
+        def _partHelper(helper, otherName, partIndex=partIndex):
+            return resolveProviderURL(providers[otherName][partIndex], helper)
+        firstResolved = firstConcurrently(_partHelper, otherNames, _getFanOut()) if otherNames else None
+        if not firstResolved:
+            return None
+        parts.append(firstResolved)
+    return parts
+
+
+def preResolve(params):
+    '''
+    Resolves a 'RESOLVE' view item ahead of time, like the next item of the playlist, so that its
+    providers and stream are cached when it's played.
+    :param params: The parameters of the item, see Plugin.viewResolve().
+    '''
+    if 'allParts' in params:
+        resolveAllParts(literal_eval(params['providers']), params['allParts'])
+    elif 'providerURL' in params:
+        resolveProviderURL(params['providerURL'])
+    elif 'api' in params and 'episodeID' in params:
+        providers = getEpisodeProviders(params['api'], params['episodeID'])
+        # Without autoplay the user picks the provider, so only the providers are cached.
+        if providers and xbmcaddon.Addon().getSetting('autoplay') == 'true':
+            resolveFirstProvider(providers)
+    providerHealth.flush()
+
+
+def getCachedStream(providerURL):
+    '''
+    :returns: The stream that 'providerURL' was resolved to recently, or None.
+    '''
+    streams = cache.getCacheProperty(_PROPERTY_STREAMS, readFromDisk=False)
+    if streams and providerURL in streams:
+        stream, expiryTime = streams[providerURL]
+        if time() < expiryTime:
+            return stream
+    return None
+
 
-    return None
\ No newline at end of file
+def forgetStream(stream):
+    '''
+    Removes a stream from the resolved streams, like when it fails to play.
+    '''
+    with _streamsLock:
+        streams = cache.getCacheProperty(_PROPERTY_STREAMS, readFromDisk=False)
+        if streams:
+            remaining = {url: entry for url, entry in DICT_ITER_ITEMS(streams) if entry[0] != stream}
+            if len(remaining) != len(streams):
+                cache.setCacheProperty(_PROPERTY_STREAMS, remaining, saveToDisk=False)
+
+
+def clearStreamCache():
+    '''
+    Forgets the resolved streams and the cached episode providers.
+    '''
+    with _streamsLock:
+        cache.setCacheProperty(_PROPERTY_STREAMS, { }, saveToDisk=False)
+    cache.setCacheProperty(_PROPERTY_EPISODE_PROVIDERS, { }, saveToDisk=False)
+
+
+def _getFanOut():
+    # How many providers are resolved at the same time, from the 'autoplay_fanout' add-on setting.
+    try:
+        return max(int(xbmcaddon.Addon().getSetting('autoplay_fanout')), 1)
+    except ValueError:
+        return 1
+
+
+def _cacheStream(providerURL, stream):
+    currentTime = time()
+    with _streamsLock:
+        streams = cache.getCacheProperty(_PROPERTY_STREAMS, readFromDisk=False) or { }
+        streams = {url: entry for url, entry in DICT_ITER_ITEMS(streams) if entry[1] > currentTime} # Drop the expired.
+        streams[providerURL] = [stream, currentTime + STREAM_LIFETIME]
+        cache.setCacheProperty(_PROPERTY_STREAMS, streams, saveToDisk=False)
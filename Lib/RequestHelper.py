@@ -1,12 +1,21 @@
 # -*- coding: utf-8 -*-
+import json
 import requests
-from datetime import datetime
-from bs4 import BeautifulSoup, SoupStrainer
+from random import uniform
+from time import time
+from email.utils import parsedate_tz, mktime_tz
+from codecs import getincrementaldecoder
+from itertools import chain
+from threading import Thread, Lock, Event
 
-from xbmc import sleep
+import xbmc
+import xbmcaddon
 
 from Lib import quote_plus
 from Lib.SimpleCache import simpleCache as cache
+from Lib.SimpleRateLimiter import rateLimiter
+from Lib.SimpleCircuitBreaker import circuitBreaker
+from Lib.SearchParser import parseSearchPage
 
 
 # A requests helper class just for the Animetoon and Animeplus APIs.
@@ -34,6 +43,27 @@ class RequestHelper():
     # Used when name searching, it needs a desktop header for the website.
     PROPERTY_RANDOM_USERAGENT = 'rhelper.prop.randomUA'
 
+    # Default average time between requests to the same host in milliseconds, see SimpleRateLimiter.
+    REQUEST_INTERVAL = 1000
+
+    # Bytes read at a time from streamed responses, see routeGETEntries().
+    STREAM_CHUNK_SIZE = 65536
+
+    # Average time between requests to the search website in milliseconds, see SimpleRateLimiter.
+    SEARCH_INTERVAL = 1500
+
+    # Seconds to wait for a connection, and for the server to send data, see GET().
+    CONNECT_TIMEOUT = 4
+    READ_TIMEOUT = 10
+
+    # Retries of failed GET requests. The waits between attempts grow exponentially from RETRY_BASE_DELAY
+    # seconds, with random jitter. A 'Retry-After' wait longer than RETRY_MAX_DELAY seconds isn't retried.
+    RETRY_ATTEMPTS = 3
+    RETRY_BASE_DELAY = 0.5
+    RETRY_MAX_DELAY = 8.0
+    # Response status codes that are worth retrying.
+    RETRY_STATUS_CODES = frozenset((429, 500, 502, 503, 504))
+
 
     def __init__(self):
         self.animetoonHeaders = {
@@ -51,6 +81,15 @@ class RequestHelper():
             'Accept': '*/*'
         }
         self.session = requests.Session()
+        # Plain HTTP requests can go through the fixture server instead, see Lib/FixtureServer.py.
+        fixtureProxy = xbmcaddon.Addon().getSetting('fixture_proxy')
+        if fixtureProxy:
+            self.session.proxies = {'http': 'http://' + fixtureProxy}
+        self.lastResponseSize = 0 # Size in bytes of the last routeGET() response, for the cache statistics.
+        # Validators of the last routeGET() response (see getValidators()), and if it was a "304 Not Modified".
+        self.lastValidators = None
+        self.lastNotModified = False
+        self.isCancelled = False # When True no more requests are made, see cancel().
         #self.checkAppVersions() # Seems unnecessary for the time being.
 
 
@@ -82,18 +121,14 @@ class RequestHelper():
         toonVersion = cache.getRawProperty(self.PROPERTY_ANIMETOON_VERSION)
         if not toonVersion:
             self.setAPISource(self.API_ANIMETOON)
-            self.delayBegin()
-            toonVersion = self.routeGET('/GetVersion').get('version', '8.0')
-            self.delayEnd()
+            toonVersion = self.routeGET('/GetVersion', 200).get('version', '8.0')
             cache.setRawProperty(self.PROPERTY_ANIMETOON_VERSION, toonVersion)
         self.animetoonHeaders.update({'App-Version': toonVersion})
 
         plusVersion = cache.getRawProperty(self.PROPERTY_ANIMEPLUS_VERSION)
         if not plusVersion:
                 self.setAPISource(self.API_ANIMEPLUS)
-                self.delayBegin()
-                plusVersion = self.routeGET('/GetVersion').get('version', '8.0')
-                self.delayEnd()
+                plusVersion = self.routeGET('/GetVersion', 200).get('version', '8.0')
                 cache.setRawProperty(self.PROPERTY_ANIMEPLUS_VERSION, plusVersion)
         self.animeplusHeaders.update({'App-Version': plusVersion})'''
 
@@ -106,13 +141,58 @@ class RequestHelper():
         self.session.headers.update(self._getDesktopHeader())
 
 
-    def GET(self, url):
-        try:
-            return self.session.get(url, timeout = 10)
-        except:
-            from xbmcgui import Dialog
-            Dialog().notification('Toonmania2', 'Web request failed', xbmcgui.NOTIFICATION_INFO, 3000, True)
-            return type('FakeResponse', (object,), {'ok': False}) # Just so other parts of the add-on don't break.
+    def cancel(self):
+        '''
+        Makes this helper stop making requests (and stop retrying them), so a worker thread
+        that's no longer needed ends soon. Can be called from another thread.
+        '''
+        self.isCancelled = True
+
+
+    def GET(self, url, interval=REQUEST_INTERVAL, headers=None, stream=False, burst=None):
+        '''
+        GETs from 'url', waiting first if the requests to its host go over the rate limit.
+        Connection errors, timeouts and temporary server errors are retried a few times with backoff.
+        Each failed attempt counts for the circuit breaker of the host, and when too many failed in a
+        row the host isn't requested (nor retried) for a while, see SimpleCircuitBreaker.
+        :param interval: The average time between requests to the host in milliseconds, see SimpleRateLimiter.
+        :param headers: Optional dict of extra headers for this request only.
+        :param stream: When True the body isn't downloaded yet, see routeGETEntries().
+        :param burst: Optional bucket size for the rate limiter, see SimpleRateLimiter.acquire().
+        :returns: The response, or a fake response with 'ok' False if the request failed.
+        '''
+        if not circuitBreaker.allow(url):
+            xbmc.log('RequestHelper | Skipping request to unavailable host: ' + url, xbmc.LOGWARNING)
+            return self._failedResponse()
+
+        attempt = 1
+        while True:
+            if self.isCancelled:
+                return self._failedResponse()
+            rateLimiter.acquire(url, interval, burst)
+            try:
+                r = self.session.get(
+                    url, headers = headers, stream = stream, timeout = (self.CONNECT_TIMEOUT, self.READ_TIMEOUT)
+                )
+                if r.status_code not in self.RETRY_STATUS_CODES:
+                    circuitBreaker.recordSuccess(url) # The host answered, even if with a client error.
+                    return r
+                circuitBreaker.recordFailure(url)
+                retryDelay = self._retryDelay(attempt, r.headers.get('Retry-After'))
+                if attempt >= self.RETRY_ATTEMPTS or retryDelay > self.RETRY_MAX_DELAY or not circuitBreaker.allow(url):
+                    return r
+                r.close()
+            except requests.RequestException as e:
+                circuitBreaker.recordFailure(url)
+                if attempt >= self.RETRY_ATTEMPTS or not circuitBreaker.allow(url):
+                    xbmc.log('RequestHelper | Request failed: ' + url + ' (' + str(e) + ')', xbmc.LOGWARNING)
+                    if not self.isCancelled:
+                        import xbmcgui
+                        xbmcgui.Dialog().notification('Toonmania2', 'Web request failed', xbmcgui.NOTIFICATION_INFO, 3000, True)
+                    return self._failedResponse()
+                retryDelay = self._retryDelay(attempt)
+            xbmc.sleep(int(retryDelay * 1000))
+            attempt += 1
 
 
     def POST(self, url, data):
@@ -122,71 +202,114 @@ class RequestHelper():
         return self.session.post(url, data = data, timeout = 10)
 
 
-    def routeGET(self, routeURL):
+    def routeGET(self, routeURL, interval=REQUEST_INTERVAL, validators=None):
         '''
         Convenience function to GET from a route path.
         Assumes 'routeURL' starts with a forward slash.
+        :param validators: Optional validators dict of a cached response, from getValidators(). The request
+        is made conditional with them, so an unchanged route answers "304 Not Modified" without a body.
+
+        :returns: The JSON of the response or None if it failed or wasn't modified. When it wasn't
+        modified 'self.lastNotModified' is True.
+        '''
+        r = self.GET(self.apiURL + routeURL, interval, self._conditionalHeaders(validators))
+        self.lastNotModified = getattr(r, 'status_code', None) == 304
+        if r.ok and not self.lastNotModified:
+            self.lastResponseSize = len(r.content)
+            self.lastValidators = self.getValidators(r)
+            return r.json()
+        else:
+            self.lastResponseSize = 0
+            self.lastValidators = validators if self.lastNotModified else None
+            return None
+
+
+    def routeGETEntries(self, routeURL, interval=REQUEST_INTERVAL, validators=None):
+        '''
+        Streaming version of routeGET() for the routes that return a JSON array, like the big
+        '/GetAll(...)' ones. The response is parsed while it downloads, so its whole text and the
+        whole array don't need to be in memory at the same time.
+
+        :returns: A generator of the array elements, or None if the request failed or wasn't modified
+        (see routeGET()). The generator raises ValueError if the response isn't a JSON array or if the
+        download breaks. 'self.lastResponseSize' is only complete after the generator is exhausted.
+        '''
+        r = self.GET(self.apiURL + routeURL, interval, self._conditionalHeaders(validators), stream=True)
+        self.lastNotModified = getattr(r, 'status_code', None) == 304
+        self.lastResponseSize = 0
+        if r.ok and not self.lastNotModified:
+            self.lastValidators = self.getValidators(r)
+            return self._iterResponseArray(r)
+        else:
+            self.lastValidators = validators if self.lastNotModified else None
+            return None
+
 
-        :returns: The JSON of the response or None if it failed.
+    def _retryDelay(self, attempt, retryAfter=None):
+        '''
+        :returns: The seconds to wait before the next attempt of a request. It's the 'Retry-After'
+        header value if the server sent one, otherwise a random time up to an exponential backoff.
         '''
-        r = self.GET(self.apiURL + routeURL)
-        return r.json() if r.ok else None
+        if retryAfter:
+            # Either a number of seconds or an HTTP date.
+            try:
+                return max(float(retryAfter), 0.0)
+            except ValueError:
+                retryDate = parsedate_tz(retryAfter)
+                if retryDate:
+                    return max(mktime_tz(retryDate) - time(), 0.0)
+        return uniform(0.0, self.RETRY_BASE_DELAY * (2 ** attempt))
+
+
+    def _failedResponse(self):
+        return type('FakeResponse', (object,), {'ok': False}) # Just so other parts of the add-on don't break.
+
+
+    def getValidators(self, response):
+        '''
+        :returns: A dict with the 'etag' and 'lastModified' headers of a response, to make conditional
+        requests for the same content later. None if the response has neither.
+        '''
+        etag = response.headers.get('ETag')
+        lastModified = response.headers.get('Last-Modified')
+        return {'etag': etag, 'lastModified': lastModified} if etag or lastModified else None
 
 
     def nameSearchEntries(self, api, text):
         '''
         This name search is done with their own website search.
-        :returns: A string with a comma-separated list entry IDs found in the search.
+        When there's more than one page of results, the other pages are downloaded and parsed in
+        worker threads (see mapConcurrently()) while the results of the first page are read.
+        :returns: A generator of (id, title, description) tuples of the search results in page order,
+        or None if the search failed or found nothing.
         '''
         self.setDesktopSource(api) # Desktop browser spoofing.
-        self.delayBegin()
-        r = self.GET(self.searchURL + quote_plus(text) + ('&search_submit=Go' if api == self.API_ANIMEPLUS else ''))
-        self.delayEnd(1500)
+        # The search requests get their own burst, for the first page plus one page per worker thread,
+        # so a search of a few pages doesn't wait on the interval. Any pages beyond that are spread out.
+        concurrency = getConcurrency()
+        searchBurst = concurrency + 1
+        r = self.GET(
+            self.searchURL + quote_plus(text) + ('&search_submit=Go' if api == self.API_ANIMEPLUS else ''),
+            self.SEARCH_INTERVAL,
+            burst=searchBurst
+        )
         if not r.ok:
             return None
 
-        soup = BeautifulSoup(r.text, 'html.parser')
-        mainUL = soup.find('div', class_='series_list').ul
-
+        results, pageURLs = parseSearchPage(r.text)
         # Early exit test. No point in going further if there's no search results.
-        if not mainUL.find('li'):
+        if not results:
             return None
-        allULs = [mainUL]
-
-        # Helper function to find the entry with the same ID as the one from the search results.
-        def _nameSearchEntriesHelper(mainULs):
-            for ul in mainULs:
-                for li in ul.find_all('li'):
-                    img  = li.find('img')
-                    if img:
-                        src = img['src']
-                        # Assuming the thumb images of search results always end with
-                        # '.jpg' (4 characters long), the IDs of search results can be
-                        # obtained from these thumb URLs.
-                        thumbID = src[src.rfind('/')+1 : -4] # Grab the 'id' from '..../small/id.jpg'.
-                        title = li.h3.text.strip()
-                        descrDIV = li.find('div', class_='descr')
-                        description = descrDIV.text.replace(' [More]', '').strip() if descrDIV else ''
-                        yield thumbID, title, description
 
         # When there's more than one page of results there'll be buttons for pagination.
-        # Request and scrape these other pages.
-        paginationDIV = soup.find('ul', {'class': 'pagination'})
-        if paginationDIV:
-            strainer = SoupStrainer('div', class_='series_list')
+        # Request and scrape these other pages, starting right away.
+        def _pageResultsHelper(helper, pageURL):
+            helper.setDesktopSource(api)
+            r2 = helper.GET(pageURL, self.SEARCH_INTERVAL, burst=searchBurst)
+            return parseSearchPage(r2.text)[0] if r2.ok else None
 
-            for button in paginationDIV.find_all('button'):
-                nextURL = button.get('href', None)
-                if nextURL:
-                    self.delayBegin()
-                    r2 = self.GET(nextURL)
-                    if r2.ok:
-                        mainDIV = BeautifulSoup(r2.text, 'html.parser', parse_only=strainer)
-                        allULs.append(mainDIV.ul)
-                    self.delayEnd(1500)
-
-        # Return a string with a comma-separated list of entry IDs.
-        return tuple(_nameSearchEntriesHelper(allULs))
+        pageResults = mapConcurrently(_pageResultsHelper, pageURLs, concurrency)
+        return chain(results, chain.from_iterable(pageResult for pageResult in pageResults if pageResult))
 
 
     def makeThumbURL(self, id):
@@ -196,23 +319,29 @@ class RequestHelper():
         return self.imageURL + str(id) + '.jpg' # 'imageURL' changes depending on the API set in setAPISource().
 
 
-    def delayBegin(self):
-        '''
-        Called before a request or a code block that includes a request to
-        grab the current time, used for some request delay logic for scraping.
-        '''
-        self.delayStartTime = datetime.now()
-
-
-    def delayEnd(self, delayOverride = 200):
-        '''
-        Called after a request or a code block that included a request. This actually
-        does the delay.
-        :param delayOverride: Custom delay time in milliseconds. Default: 200ms.
-        '''
-        elapsed = int((datetime.now() - self.delayStartTime).total_seconds() * 1000)
-        if elapsed < delayOverride: # Only delay if we haven't waited the full time already.
-            sleep(max(delayOverride - elapsed, 100))
+    def _conditionalHeaders(self, validators):
+        if not validators:
+            return None
+        headers = { }
+        if validators.get('etag'):
+            headers['If-None-Match'] = validators['etag']
+        if validators.get('lastModified'):
+            headers['If-Modified-Since'] = validators['lastModified']
+        return headers
+
+
+    def _iterResponseArray(self, response):
+        def _chunks():
+            for chunk in response.iter_content(self.STREAM_CHUNK_SIZE):
+                self.lastResponseSize += len(chunk)
+                yield chunk
+        try:
+            for element in iterJSONArray(_chunks()):
+                yield element
+        except requests.RequestException as e:
+            raise ValueError('Download failed: ' + str(e))
+        finally:
+            response.close()
 
 
     def _getDesktopHeader(self):
@@ -247,4 +376,145 @@ class RequestHelper():
         )
 
 
+def getConcurrency():
+    '''
+    :returns: How many requests can be done at the same time, from the 'fetch_concurrency' add-on setting.
+    '''
+    try:
+        return max(int(xbmcaddon.Addon().getSetting('fetch_concurrency')), 1)
+    except ValueError:
+        return 1
+
+
+def mapConcurrently(function, items, concurrency):
+    '''
+    Calls function(helper, item) for each item, in up to 'concurrency' worker threads that each have
+    their own RequestHelper, as a requests session can't be shared between threads.
+    The threads start right away, before the results are read.
+    :returns: A generator of the results in the same order as the items, each one yielded as soon
+    as it (and the ones before it) is ready. A result is None if its function call failed.
+    '''
+    items = list(items)
+    results = [None] * len(items)
+    readyEvents = [Event() for item in items]
+    itemsIter = iter(enumerate(items))
+    itemsLock = Lock()
+
+    def _worker():
+        helper = RequestHelper()
+        while True:
+            with itemsLock:
+                nextItem = next(itemsIter, None)
+            if not nextItem:
+                break
+            index, item = nextItem
+            try:
+                results[index] = function(helper, item)
+            except Exception as e:
+                xbmc.log('Toonmania2 | Concurrent request failed: ' + str(e), xbmc.LOGWARNING)
+            finally:
+                readyEvents[index].set()
+
+    # Not daemon threads, the add-on script only ends after they're done.
+    for index in range(min(concurrency, len(items))):
+        Thread(target=_worker).start()
+
+    def _resultsGenerator():
+        for index in range(len(items)):
+            readyEvents[index].wait()
+            yield results[index]
+            results[index] = None # Don't keep it after it's read.
+    return _resultsGenerator()
+
+
+def firstConcurrently(function, items, concurrency):
+    '''
+    Calls function(helper, item) for the items in up to 'concurrency' worker threads, like mapConcurrently(),
+    until one of the calls returns a result. Then the helpers of the other calls are cancelled and the items
+    left aren't used.
+    :returns: A tuple (item, result) of the first call that returned a result, or None if none did.
+    '''
+    itemsIter = iter(enumerate(items))
+    itemsLock = Lock()
+    doneEvent = Event()
+    firstResult = [ ]
+    helpers = [RequestHelper() for index in range(max(concurrency, 1))]
+    runningCount = [len(helpers)]
+
+    def _worker(helper):
+        while not doneEvent.is_set():
+            with itemsLock:
+                nextItem = next(itemsIter, None)
+            if not nextItem:
+                break
+            item = nextItem[1]
+            try:
+                result = function(helper, item)
+            except Exception as e:
+                xbmc.log('Toonmania2 | Concurrent request failed: ' + str(e), xbmc.LOGWARNING)
+                result = None
+            if result:
+                with itemsLock:
+                    if not firstResult:
+                        firstResult.append((item, result))
+                        for otherHelper in helpers:
+                            otherHelper.cancel()
+                        doneEvent.set()
+        with itemsLock:
+            runningCount[0] -= 1
+            if not runningCount[0]:
+                doneEvent.set() # All the items failed.
+
+    # Not daemon threads, the add-on script only ends after they're done. The cancelled
+    # ones end after their current request.
+    for helper in helpers:
+        Thread(target=_worker, args=(helper,)).start()
+    doneEvent.wait()
+    return firstResult[0] if firstResult else None
+
+
+def iterJSONArray(chunks):
+    '''
+    Parses a JSON array incrementally from an iterable of UTF-8 byte chunks, yielding each element
+    as soon as it's complete. Only the text that wasn't parsed yet is kept in memory.
+    Raises ValueError if the text isn't a JSON array or if it ends before the array does.
+    '''
+    decoder = json.JSONDecoder()
+    textDecoder = getincrementaldecoder('utf-8')()
+    text = ''
+    isStarted = False
+    for chunk in chunks:
+        text += textDecoder.decode(chunk)
+        index = 0
+        while True:
+            # Skip the whitespace and the commas between the elements.
+            while index < len(text) and text[index] in ' \t\r\n,':
+                index += 1
+            if index == len(text):
+                break
+            if not isStarted:
+                if text[index] != '[':
+                    raise ValueError('Not a JSON array')
+                isStarted = True
+                index += 1
+            elif text[index] == ']':
+                return
+            else:
+                try:
+                    element, elementEnd = decoder.raw_decode(text, index)
+                except ValueError:
+                    break # An incomplete element, it's parsed when more text arrives.
+                # The element is only complete when a separator follows it, as a number cut by the
+                # end of a chunk (like '12' out of '123') also decodes.
+                separatorIndex = elementEnd
+                while separatorIndex < len(text) and text[separatorIndex] in ' \t\r\n':
+                    separatorIndex += 1
+                if separatorIndex == len(text) or text[separatorIndex] not in ',]':
+                    break
+                index = elementEnd
+                yield element
+        text = text[index:]
+    raise ValueError('Incomplete JSON array')
+
+
 requestHelper = RequestHelper()
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+from time import time
+
+import xbmcaddon
+
+from Lib import DICT_ITER_ITEMS
+from Lib.SimpleCache import simpleCache as cache
+
+
+# A cache of name search results, so that repeating a search or browsing a Trakt list again
+# doesn't need to scrape the website search pages again.
+
+# All the cached searches are kept in a single disk-enabled SimpleCache property, as a dict of
+# search keys mapped to [lastUsedTime, searchTime, results]. The searches that weren't used in
+# the longest time are dropped when there's more than the 'search_cache_size' setting.
+
+class SearchCache():
+
+    # Disk-enabled property holding the dict of cached searches.
+    PROPERTY_SEARCHES = 'toonmania2.searchCache'
+
+    DEFAULT_HOURS = 24 # When the 'search_cache_hours' add-on setting isn't set.
+    DEFAULT_SIZE = 100 # When the 'search_cache_size' add-on setting isn't set.
+
+    # Seconds before the last use time of a search is updated again. Updating it means saving all the
+    # searches, so repeated hits within this time don't write anything.
+    TOUCH_INTERVAL = 3600
+
+
+    def getResults(self, api, text):
+        '''
+        :returns: The results of a previous search for 'text' with 'api', as a tuple of
+        (id, title, description) tuples, or None if there's no valid cached search.
+        '''
+        hours = self._getIntSetting('search_cache_hours', self.DEFAULT_HOURS)
+        if not hours:
+            return None # Search cache disabled.
+
+        searches = cache.getCacheProperty(self.PROPERTY_SEARCHES, readFromDisk=True)
+        searchKey = self._makeKey(api, text)
+        if searches and searchKey in searches:
+            entry = searches[searchKey]
+            currentTime = time()
+            if currentTime - entry[1] < hours * 3600:
+                if currentTime - entry[0] >= self.TOUCH_INTERVAL:
+                    entry[0] = currentTime # Most recently used.
+                    cache.setCacheProperty(self.PROPERTY_SEARCHES, searches, saveToDisk=True, lifetime=hours)
+                # JSON makes lists out of the result tuples.
+                return tuple(tuple(result) for result in entry[2])
+            else:
+                del searches[searchKey] # Expired, it's searched again.
+                cache.setCacheProperty(self.PROPERTY_SEARCHES, searches, saveToDisk=True, lifetime=hours)
+        return None
+
+
+    def setResults(self, api, text, results):
+        '''
+        Caches the results of a search, a sequence of (id, title, description) tuples.
+        '''
+        hours = self._getIntSetting('search_cache_hours', self.DEFAULT_HOURS)
+        if not hours:
+            return
+
+        currentTime = time()
+        searches = cache.getCacheProperty(self.PROPERTY_SEARCHES, readFromDisk=True) or { }
+        # Forget the searches that expired, then the least recently used ones if there's too many.
+        searches = {
+            searchKey: entry for searchKey, entry in DICT_ITER_ITEMS(searches)
+            if currentTime - entry[1] < hours * 3600
+        }
+        maxSearches = max(self._getIntSetting('search_cache_size', self.DEFAULT_SIZE), 1)
+        if len(searches) >= maxSearches:
+            keepKeys = sorted(searches, key=lambda searchKey: searches[searchKey][0], reverse=True)[:maxSearches-1]
+            searches = {searchKey: searches[searchKey] for searchKey in keepKeys}
+
+        searches[self._makeKey(api, text)] = [currentTime, currentTime, results]
+        cache.setCacheProperty(self.PROPERTY_SEARCHES, searches, saveToDisk=True, lifetime=hours)
+
+
+    def _makeKey(self, api, text):
+        # Searches are the same regardless of letter case and spacing, like "Dragon  ball" and "dragon ball".
+        return api + ':' + ' '.join(text.lower().split())
+
+
+    def _getIntSetting(self, settingID, default):
+        try:
+            return int(xbmcaddon.Addon().getSetting(settingID))
+        except ValueError:
+            return default
+
+
+searchCache = SearchCache()
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+from Lib import HTMLParser
+
+
+# A scraper for the search result pages of the Animetoon and Animeplus websites.
+
+# It reads the page markup in one pass with the standard library HTMLParser, keeping only
+# the few fields it needs instead of building a document tree. Each search result looks like:
+# <div class="series_list">
+#     <ul>
+#         <li>
+#             <img src=".../images/series/small/<id>.jpg">
+#             <h3>Title</h3>
+#             <div class="descr">Description... [More]</div>
+#         </li>
+#         (...)
+#     </ul>
+# </div>
+# (...)
+# <ul class="pagination"> <button href="(page URL)">...</button> (...) </ul>
+
+class SearchParser(HTMLParser):
+
+    def __init__(self):
+        HTMLParser.__init__(self) # Python 2 HTMLParser is an old-style class, no super().
+        self.results = [ ]
+        self.pageURLs = [ ]
+
+        self.listState = 0 # 0 = before the results list, 1 = inside it, 2 = after it.
+        self.seriesDivDepth = 0 # Depth of the <div> tags inside div.series_list.
+        self.listDepth = 0 # Depth of the <ul> tags inside the results list.
+        self.inPagination = False
+
+        self.item = None # Fields of the result being read, [src, titleParts, descrParts].
+        self.textTarget = None # The list that receives text, when inside a title or description.
+        self.titleDone = False
+        self.descrDivDepth = 0
+
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'div':
+            if self.listState == 0:
+                if self.seriesDivDepth:
+                    self.seriesDivDepth += 1
+                elif 'series_list' in (dict(attrs).get('class') or '').split():
+                    self.seriesDivDepth = 1
+            elif self.item:
+                if self.descrDivDepth:
+                    self.descrDivDepth += 1
+                elif not self.item[2] and 'descr' in (dict(attrs).get('class') or '').split():
+                    self.descrDivDepth = 1
+                    self.textTarget = self.item[2]
+
+        elif tag == 'ul':
+            if self.listState == 1:
+                self.listDepth += 1
+            elif self.listState == 0 and self.seriesDivDepth:
+                self.listState = 1 # The first <ul> inside div.series_list.
+                self.listDepth = 1
+            elif 'pagination' in (dict(attrs).get('class') or '').split() and not self.pageURLs:
+                self.inPagination = True
+
+        elif self.listState == 1:
+            if tag == 'li':
+                # A new item also ends the previous one, in case the <li> tags aren't closed.
+                self._endItem()
+                self.item = [None, [ ], [ ]]
+                self.titleDone = False
+            elif self.item:
+                if tag == 'img' and not self.item[0]:
+                    self.item[0] = dict(attrs).get('src')
+                elif tag == 'h3' and not self.titleDone:
+                    self.textTarget = self.item[1]
+
+        elif tag == 'button' and self.inPagination:
+            pageURL = dict(attrs).get('href')
+            if pageURL and pageURL not in self.pageURLs:
+                self.pageURLs.append(pageURL)
+
+
+    def handle_endtag(self, tag):
+        if tag == 'div':
+            if self.descrDivDepth:
+                self.descrDivDepth -= 1
+                if not self.descrDivDepth:
+                    self.textTarget = None
+            elif self.seriesDivDepth and self.listState == 0:
+                self.seriesDivDepth -= 1
+
+        elif tag == 'ul':
+            if self.listState == 1:
+                self.listDepth -= 1
+                if not self.listDepth:
+                    self._endItem()
+                    self.listState = 2
+            elif self.inPagination:
+                self.inPagination = False
+
+        elif tag == 'li' and self.listState == 1 and self.listDepth == 1:
+            self._endItem()
+
+        elif tag == 'h3' and self.item and self.textTarget is self.item[1]:
+            self.textTarget = None
+            self.titleDone = True
+
+
+    def handle_data(self, data):
+        if self.textTarget != None:
+            self.textTarget.append(data)
+
+
+    # Python 2 HTMLParser doesn't convert the character references by itself.
+    def handle_entityref(self, name):
+        self.handle_data(self.unescape('&%s;' % name))
+
+
+    def handle_charref(self, name):
+        self.handle_data(self.unescape('&#%s;' % name))
+
+
+    def _endItem(self):
+        if self.item:
+            src, titleParts, descrParts = self.item
+            if src:
+                # Assuming the thumb images of search results always end with
+                # '.jpg' (4 characters long), the IDs of search results can be
+                # obtained from these thumb URLs.
+                thumbID = src[src.rfind('/')+1 : -4] # Grab the 'id' from '..../small/id.jpg'.
+                self.results.append(
+                    (thumbID, ''.join(titleParts).strip(), ''.join(descrParts).replace(' [More]', '').strip())
+                )
+            self.item = None
+            self.textTarget = None
+            self.descrDivDepth = 0
+
+
+def parseSearchPage(html):
+    '''
+    :returns: A tuple (results, pageURLs). The results are a list of (id, title, description) tuples,
+    and the page URLs are the links to the other result pages, if any.
+    '''
+    parser = SearchParser()
+    parser.feed(html)
+    parser.close()
+    return parser.results, parser.pageURLs
@@ -2,12 +2,18 @@
 import json
 from os import sep as osSeparator
 from time import time
+from threading import Thread
 
 import xbmc
 import xbmcvfs
 from xbmcgui import getCurrentWindowId, Window
 import xbmcaddon
 
+from Lib import SimpleCacheCodecs as codecs
+from Lib.SimpleCacheStorage import FileStorage, SQLiteStorage
+from Lib.SimpleCacheStats import SimpleCacheStats
+from Lib.SimpleCacheManifest import SimpleCacheManifest
+
 
 # A simple JSON and window property cache, specialized for XBMC video add-ons.
 
@@ -23,22 +29,36 @@ class SimpleCache():
         In this cache version we're using separate cache files for each route the user visited.
         This way uses less memory because we only need to load the routes that the user wants to
         go to, not one huge file that has everything, with what the user wants or doesn't want.
+    4: Toonmania2 0.5.3
+        The saved data can be encoded with a codec (see SimpleCacheCodecs), like zlib-compressed JSON.
+        The codec is detected when loading, so version 3 files (plain JSON) are still read.
     '''
     # Cache version, for future extension. Used with properties saved to disk.
-    CACHE_VERSION = 3
+    CACHE_VERSION = 4
+    # The oldest cache version that can still be read.
+    CACHE_MIN_VERSION = 3
 
     LIFETIME_THREE_DAYS = 72 # 3 days, in hours.
     LIFETIME_FIVE_DAYS = 120 # 5 days.
     LIFETIME_ONE_WEEK = 168 # 7 days.
     LIFETIME_FOREVER = 0 # Never expires.
 
+    # Hours that the storage keeps expired properties (at least), so that they can still be revalidated
+    # with a conditional web request, see peekCacheProperty(). The disk use is still bound by the byte budget.
+    EXPIRED_KEEP_HOURS = LIFETIME_ONE_WEEK
+
     # Path to .../kodi/userdata/addons_data/plugin.video.toonmania2/cache/ -> where the JSON cache files will be.
     CACHE_PATH_DIR = xbmc.translatePath(xbmcaddon.Addon().getAddonInfo('profile')).decode('utf-8') + 'cache' + osSeparator
 
-    # Property name pointing to a Python 'set()' of property names.
-    # This is used to quickly tell if a property exists or not by checking its name in the set,
+    # Prefix of the property names that flag a disk-enabled property as being in memory.
+    # This is used to quickly tell if a property exists or not by checking its small flag,
     # rather than retrieving a property that could be a huge JSON blob just to see that it exists.
-    PROPERTY_DISK_NAMES_SET = 'scache.prop.names'
+    # The flag value is the current memory generation, see PROPERTY_GENERATION.
+    PROPERTY_IN_MEMORY = 'scache.prop.inMemory.'
+
+    # Property name for the memory generation, a number that changes when the cache is cleared so
+    # that all the in-memory flags become invalid at once.
+    PROPERTY_GENERATION = 'scache.prop.generation'
 
 
     # Property name pointing to a comma-separated list of dirty disk-enabled properties that need saving.
@@ -46,16 +66,34 @@ class SimpleCache():
     PROPERTY_DIRTY_NAMES_SET = 'scache.prop.dirty'
 
 
+    # Property name for a flag that tells if the expired properties were already swept in this Kodi session.
+    PROPERTY_SWEPT = 'scache.prop.swept'
+
+
+    # Codec used when the 'cache_codec' add-on setting isn't set.
+    DEFAULT_CODEC = codecs.CODEC_ZLIB
+
+    # Values of the 'cache_storage' add-on setting, mapped to the storage engine classes.
+    STORAGE_ENGINES = {
+        'Files': FileStorage,
+        'Database': SQLiteStorage
+    }
+
+
     def __init__(self):
         '''
         Initialised at every directory change in Kodi <= 17.6.
         '''
         self.window = Window(getCurrentWindowId())
-        self.diskNamesSet = None
+        self.generation = None
         self.dirtyNamesSet = None
+        self.storage = None
+        self.manifest = SimpleCacheManifest(self.window, self.CACHE_PATH_DIR)
+        self.stats = SimpleCacheStats(self.window, self.CACHE_PATH_DIR)
+        self.statsEnabled = None
 
 
-    def setCacheProperty(self, propName, data, saveToDisk, lifetime=72):
+    def setCacheProperty(self, propName, data, saveToDisk, lifetime=72, codec=None):
         '''
         Creates a persistent XBMC window memory property.
         :param propName: Name/Identifier the property should have, used to retrieve it later.
@@ -66,16 +104,17 @@ class SimpleCache():
         :param lifetime: When saving to disk, 'lifetime' specifies how many hours since its
         creation that the property should have on disk, before being erased. Defaults to 72
         hours (3 days). Setting it as '0' (zero) will make it last forever.
+        :param codec: Name of the SimpleCacheCodecs codec to encode this property with. For disk-enabled
+        properties it's used when saving, and defaults to the 'cache_codec' setting. Memory-only
+        properties default to plain JSON, but a compressing codec uses less memory for big data.
         '''
         if saveToDisk:
             # Create the window memory property.
-            self._storeCacheProperty(propName, data, lifetime, self._getEpochHours())
+            self._storeCacheProperty(propName, data, lifetime, self._getEpochHours(), codec)
 
-            # Store the name of this disk-enabled property in a set to quickly tell
-            # that it's already in memory and doesn't need to be loaded from disk.
-            self._ensureDiskNamesSet()
-            self.diskNamesSet.add(propName)
-            self._storeMemorySet(self.PROPERTY_DISK_NAMES_SET, self.diskNamesSet)
+            # Flag this disk-enabled property to quickly tell that it's
+            # already in memory and doesn't need to be loaded from disk.
+            self._setInMemory(propName)
 
             # Add the name of this new property to a set used by saveCacheIfDirty()
             # to tell which disk-enabled properties need saving to disk.
@@ -84,10 +123,10 @@ class SimpleCache():
             self._storeMemorySet(self.PROPERTY_DIRTY_NAMES_SET, self.dirtyNamesSet)
         else:
             # A memory-only property. Other fields (lifetime, epoch etc.) are not needed.
-            self.window.setProperty(propName, json.dumps(data))
+            self.window.setProperty(propName, codecs.encodeText(data, codec or codecs.CODEC_JSON))
 
 
-    def setCacheProperties(self, properties, saveToDisk):
+    def setCacheProperties(self, properties, saveToDisk, codec=None):
         '''
         Convenience function to create several properties at once.
         :param properties: For disk-enabled properties (saveToDisk=True), it's an iterable where
@@ -97,22 +136,22 @@ class SimpleCache():
 
         The PROPERTY_NAME values should not have commas.
         The 'PROPERTY_DATA' or 'data' fields should be JSON-serializable.
+        The 'codec' parameter is used for all of the properties, as in setCacheProperty().
         '''
         if saveToDisk:
-            self._ensureDiskNamesSet()
             self._ensureDirtyNamesSet()
 
             for pEntry in properties:
                 propName, data, lifetime = pEntry
-                self._storeCacheProperty(propName, data, lifetime, self._getEpochHours())
-                self.diskNamesSet.add(propName)
+                self._storeCacheProperty(propName, data, lifetime, self._getEpochHours(), codec)
+                self._setInMemory(propName)
                 self.dirtyNamesSet.add(propName) # These properties are being created \ updated and need saving.
 
-            self._storeMemorySet(self.PROPERTY_DISK_NAMES_SET, self.diskNamesSet)
             self._storeMemorySet(self.PROPERTY_DIRTY_NAMES_SET, self.dirtyNamesSet)
         else:
             for propName, data in properties:
-                self.window.setProperty(propName, json.dumps(data)) # Memory-only properties.
+                # Memory-only properties.
+                self.window.setProperty(propName, codecs.encodeText(data, codec or codecs.CODEC_JSON))
 
 
     def getCacheProperty(self, propName, readFromDisk):
@@ -124,29 +163,152 @@ class SimpleCache():
         from memory first though, then if it's not in memory we load from its file, if it exists.
         :returns: The property data, if it exists, or None.
         '''
+        startTime = time()
         if readFromDisk:
             # A disk-enabled property.
-            # If it's already in the disk names set then it was either added manually or
+            # If it's flagged as in memory then it was either added manually or
             # already loaded from disk into memory.
-            self._ensureDiskNamesSet()
-            if propName in self.diskNamesSet:
+            if self._isInMemory(propName):
                 propRaw = self.window.getProperty(propName)
-                return json.loads(propRaw)[0] if propRaw else None # Data is always the first JSON field.
+                data = json.loads(propRaw)[0] if propRaw else None # Data is always the first JSON field.
+                self._recordStat(propName, 'memory' if propRaw else 'miss', startTime)
+                return data
             else:
-                # Disk-enabled property isn't in memory yet, try to read it from its file.
-                fullPath = self.CACHE_PATH_DIR + propName + '.json'
-                fileProp = self._tryLoadCacheProperty(fullPath)
+                # Disk-enabled property isn't in memory yet, try to read it from the storage.
+                fileProp = self._tryLoadCacheProperty(propName)
                 if fileProp:
                     propName, data, lifetime, epoch = fileProp
                     self._storeCacheProperty(propName, data, lifetime, epoch)
-                    self.diskNamesSet.add(propName)
-                    self._storeMemorySet(self.PROPERTY_DISK_NAMES_SET, self.diskNamesSet)
+                    self._setInMemory(propName)
+                    self._recordStat(propName, 'disk', startTime, self.storage.lastLoadSize)
                     return data
                 else:
+                    self._recordStat(propName, 'miss', startTime)
                     return None
         else:
             propRaw = self.window.getProperty(propName)
-            return json.loads(propRaw) if propRaw else None
+            data = codecs.decodeText(propRaw) if propRaw else None
+            self._recordStat(propName, 'memory' if propRaw else 'miss', startTime)
+            return data
+
+
+    def getStaleCacheProperty(self, propName, maxStaleness):
+        '''
+        Similar to getCacheProperty() with readFromDisk=True, but it also accepts a property that
+        expired less than 'maxStaleness' hours ago. Used to show expired data right away while
+        it's being refreshed (stale-while-revalidate).
+        :returns: A tuple (data, isExpired). The data is None if the property doesn't exist or
+        if it's too stale to be used.
+        '''
+        startTime = time()
+        if self._isInMemory(propName):
+            propRaw = self.window.getProperty(propName)
+            if not propRaw:
+                self._recordStat(propName, 'miss', startTime)
+                return None, False
+            data, lifetime, epoch = json.loads(propRaw)[:3]
+            self._recordStat(propName, 'memory', startTime)
+        else:
+            fileProp = self._tryLoadCacheProperty(propName, maxStaleness)
+            if not fileProp:
+                self._recordStat(propName, 'miss', startTime)
+                return None, False
+            propName, data, lifetime, epoch = fileProp
+            self._storeCacheProperty(propName, data, lifetime, epoch)
+            self._setInMemory(propName)
+            self._recordStat(propName, 'disk', startTime, self.storage.lastLoadSize)
+
+        currentEpoch = self._getEpochHours()
+        if self._isExpired(lifetime, epoch, currentEpoch, maxStaleness):
+            return None, False
+        return data, self._isExpired(lifetime, epoch, currentEpoch)
+
+
+    def saveCachePropertyNow(self, propName, data, lifetime=72, codec=None):
+        '''
+        Updates a disk-enabled property and saves it right away, with a new epoch.
+        This doesn't change the dirty names set, so it's safe to use from worker threads.
+        '''
+        epoch = self._getEpochHours()
+        codec = codec or self._getDefaultCodec()
+        self._storeCacheProperty(propName, data, lifetime, epoch, codec)
+        self._setInMemory(propName)
+        storage = self._makeStorage()
+        written = storage.saveProperties(((propName, data, lifetime, epoch, codec),))
+        self.manifest.update(storage, self._makeManifestEntries(written, {propName: (epoch, lifetime, codec)}))
+
+
+    def renewCacheProperty(self, propName, lifetime=72):
+        '''
+        Renews a disk-enabled property in the storage with a new epoch (and lifetime), without
+        changing its data. Used when a web request tells that the cached data is still current.
+        This doesn't change the dirty names set, so it's safe to use from worker threads.
+        :returns: True if the property was renewed, False if it's not in the storage anymore.
+        '''
+        epoch = self._getEpochHours()
+        storage = self._makeStorage()
+        renewed = storage.renew(propName, lifetime, epoch)
+        if not renewed:
+            return False
+        byteCount, codec = renewed
+        self.manifest.update(
+            storage, self._makeManifestEntries(((propName, byteCount),), {propName: (epoch, lifetime, codec)})
+        )
+        # The memory property still has the old epoch. Rather than decoding it to change that,
+        # it's flagged as not in memory so the renewed property is loaded from the storage.
+        self.window.clearProperty(self.PROPERTY_IN_MEMORY + propName)
+        return True
+
+
+    def peekCacheProperty(self, propName):
+        '''
+        Reads a disk-enabled property from memory, or from the storage without keeping it in memory.
+        Expired properties are returned as long as the storage still has them (see EXPIRED_KEEP_HOURS).
+        This doesn't change the dirty names set, so it's safe to use from worker threads.
+        '''
+        propRaw = self.window.getProperty(propName)
+        if propRaw:
+            return json.loads(propRaw)[0]
+        fileProp = self._makeStorage().load(propName, self._getEpochHours())
+        return fileProp[1] if fileProp else None
+
+
+    def recordWebRequest(self, propName, startTime, byteCount):
+        '''
+        Counts a web request done to create or refresh a property, for the cache statistics.
+        :param startTime: The time() when the request started.
+        '''
+        self._recordStat(propName, 'web', startTime, byteCount)
+
+
+    def getCacheStats(self):
+        '''
+        :returns: The cache statistics dict, see SimpleCacheStats for its format.
+        '''
+        return self.stats.getStats()
+
+
+    def flushCacheStats(self):
+        '''
+        Merges the statistics recorded in this add-on invocation into the persistent ones.
+        '''
+        if self.statsEnabled:
+            self.stats.flush()
+
+
+    def resetCacheStats(self):
+        self.stats.reset()
+
+
+    def getMaxStaleness(self):
+        '''
+        :returns: How many hours an expired property can still be used while it's being refreshed,
+        from the 'cache_stale_hours' add-on setting. Zero means that expired properties aren't used.
+        '''
+        try:
+            return int(xbmcaddon.Addon().getSetting('cache_stale_hours'))
+        except ValueError:
+            return 0
 
 
     def getCacheProperties(self, propNames, readFromDisk):
@@ -155,29 +317,21 @@ class SimpleCache():
         The data is guaranteed to come in the same order as the provided names.
         '''
         if readFromDisk:
-            self._ensureDiskNamesSet()
-            anyLoadedFromFile = False
-
             for propName in propNames:
-                if propName in self.diskNamesSet:
+                if self._isInMemory(propName):
                     propRaw = self.window.getProperty(propName)
                     yield json.loads(propRaw)[0] if propRaw else None
                 else:
-                    fullPath = self.CACHE_PATH_DIR + propName + '.json'
-                    fileProp = self._tryLoadCacheProperty(fullPath)
+                    fileProp = self._tryLoadCacheProperty(propName)
                     if fileProp:
                         propName, data, lifetime, epoch = fileProp
                         self._storeCacheProperty(propName, data, lifetime, epoch)
-                        self.diskNamesSet.add(propName)
-                        anyLoadedFromFile = True
+                        self._setInMemory(propName)
                         yield data
-
-            if anyLoadedFromFile:
-                self._storeMemorySet(self.PROPERTY_DISK_NAMES_SET, self.diskNamesSet)
         else:
             for propName in propNames:
                 propRaw = self.window.getProperty(propName)
-                yield json.loads(propRaw) if propRaw else None
+                yield codecs.decodeText(propRaw) if propRaw else None
 
 
     '''def clearCacheProperty(self, propName, readFromDisk):
@@ -187,11 +341,8 @@ class SimpleCache():
         #
         self.window.clearProperty(propName)
         if readFromDisk:
+            self.window.clearProperty(self.PROPERTY_IN_MEMORY + propName)
             # Direct way to remove the property name from the comma-separated property name list.
-            diskNamesRaw = self.window.getProperty(self.PROPERTY_DISK_NAMES_SET)
-            self.window.setProperty(
-                self.PROPERTY_DISK_NAMES_SET, diskNamesRaw.replace(propName, '').replace(',,', ',').strip(', ')
-            )
             dirtyNamesRaw = self.window.getProperty(self.PROPERTY_DIRTY_NAMES_SET)
             self.window.setProperty(
                 self.PROPERTY_DIRTY_NAMES_SET, dirtyNamesRaw.replace(propName, '').replace(',,', ',').strip(', ')
@@ -237,40 +388,125 @@ class SimpleCache():
 
     def saveCacheIfDirty(self):
         '''
-        Saves the disk-enabled properties that are dirty to their own files.
+        Saves the disk-enabled properties that are dirty to the storage engine, and the manifest file.
+        With the 'cache_background_save' setting enabled the saving is done in a worker thread,
+        so the directory or the video being played don't have to wait on the disk writes.
         '''
         # Optimised way to check if anything needs saving. Most of the time
         # 'dirtyNamesRaw' will be an empty string, easy to check for truthness.
         dirtyNamesRaw = self.window.getProperty(self.PROPERTY_DIRTY_NAMES_SET)
-        if dirtyNamesRaw:
-            if not xbmcvfs.exists(self.CACHE_PATH_DIR):
-                xbmcvfs.mkdir(self.CACHE_PATH_DIR)
+        # The access times of the properties loaded by this invocation are saved along, for the LRU eviction.
+        accessTimes = self.storage.takeAccessTimes() if self.storage else None
+        if dirtyNamesRaw or accessTimes:
+            dirtyNames = ()
+            if dirtyNamesRaw:
+                # Reset the dirty names set and its window property right away, so that other
+                # add-on invocations don't try to save the same properties.
+                self.dirtyNamesSet = set()
+                self.window.setProperty(self.PROPERTY_DIRTY_NAMES_SET, '')
+                dirtyNames = dirtyNamesRaw.split(',')
+
+            byteBudget = self._getByteBudget()
+            if xbmcaddon.Addon().getSetting('cache_background_save') == 'true':
+                # The thread gets its own storage engine, SQLite connections can't be shared between threads.
+                # It's not a daemon thread, so the add-on script only ends after the thread is done.
+                Thread(
+                    target=self._flushProperties, args=(self._makeStorage(), dirtyNames, byteBudget, accessTimes)
+                ).start()
+            else:
+                self._ensureStorage()
+                self._flushProperties(self.storage, dirtyNames, byteBudget, accessTimes)
+        else:
+            # Properties renewed or deleted since the last save only changed the manifest.
+            self.manifest.saveFile()
 
-            for propName in dirtyNamesRaw.split(','):
-                self._saveCacheProperty(propName)
 
-            # Reset the dirty names set and its window property.
-            self.dirtyNamesSet = set()
-            self.window.setProperty(self.PROPERTY_DIRTY_NAMES_SET, '')
+    def sweepCache(self):
+        '''
+        Deletes the expired properties from the storage, at most once per Kodi session.
+        The expired properties are found with the manifest, without reading them.
+        '''
+        if not self.window.getProperty(self.PROPERTY_SWEPT):
+            self._ensureStorage()
+            currentEpoch = self._getEpochHours()
+            expiredNames = [
+                propName for propName, entry in self.manifest.iterItems()
+                if not self._isManifestEntryUsable(entry, currentEpoch, self.storage.staleGrace)
+            ]
+            if expiredNames:
+                self.storage.delete(expiredNames)
+                self.manifest.update(self.storage, removedNames=expiredNames)
+            self.storage.sweepLeftovers()
+            self.window.setProperty(self.PROPERTY_SWEPT, '1')
+
+
+    def benchmarkCodecs(self, data):
+        '''
+        Measures the available codecs with 'data', including the time to write and read
+        the encoded data to the cache folder, so the disk speed of the device is accounted for.
+        :returns: The results from SimpleCacheCodecs.benchmark().
+        '''
+        benchmarkPath = self.CACHE_PATH_DIR + 'benchmark.tmp'
+        if not xbmcvfs.exists(self.CACHE_PATH_DIR):
+            xbmcvfs.mkdir(self.CACHE_PATH_DIR)
 
+        def _writeRead(payload):
+            file = xbmcvfs.File(benchmarkPath, 'w')
+            file.write(bytearray(payload))
+            file.close()
+            file = xbmcvfs.File(benchmarkPath)
+            payload = file.readBytes() if hasattr(file, 'readBytes') else file.read()
+            file.close()
+            return payload
 
-    def clearCacheFiles(self):
-        dirPaths, filePaths = xbmcvfs.listdir(self.CACHE_PATH_DIR)
-        for filePath in filePaths:
-            self._writeBlankCacheFile(self.CACHE_PATH_DIR + filePath)
-        # Clear the disk names set. All disk-enabled properties will be forgotten.
-        self.window.setProperty(self.PROPERTY_DISK_NAMES_SET, '')
-        self.diskNamesSet = set()
-        return len(filePaths) > 0 # Return True if at least one file was cleared.
+        try:
+            return codecs.benchmark(data, writeRead=_writeRead)
+        finally:
+            xbmcvfs.delete(benchmarkPath)
+
+
+    def getCacheUsage(self):
+        '''
+        :returns: A tuple (totalBytes, totalEntries) with the current size of the storage
+        and the number of properties saved in it, from the manifest.
+        '''
+        self._ensureStorage()
+        return (
+            sum(entry[SimpleCacheManifest.FIELD_SIZE] for propName, entry in self.manifest.iterItems()),
+            len(self.manifest.entries)
+        )
 
 
-    def _ensureDiskNamesSet(self):
+    def clearCacheFiles(self):
+        # Clear both engines, in case the user changed the storage setting at some point.
+        anyCleared = False
+        for engineClass in (FileStorage, SQLiteStorage):
+            anyCleared = engineClass(self.CACHE_PATH_DIR, self.CACHE_VERSION, self.CACHE_MIN_VERSION).clear() or anyCleared
+        self.manifest.clear()
+        # Start a new memory generation, all disk-enabled properties in memory will be forgotten.
+        self._ensureGeneration()
+        self.generation = str(int(self.generation) + 1)
+        self.window.setProperty(self.PROPERTY_GENERATION, self.generation)
+        return anyCleared # Return True if at least one property was cleared.
+
+
+    def _ensureGeneration(self):
         '''
         For Kodi <= 17.6, used to initialise this class member in case it's invalid.
         But this function is only called when this member is needed.
         '''
-        if self.diskNamesSet == None:
-            self.diskNamesSet = self._stringToSet(self.window.getProperty(self.PROPERTY_DISK_NAMES_SET))
+        if self.generation == None:
+            self.generation = self.window.getProperty(self.PROPERTY_GENERATION) or '0'
+
+
+    def _isInMemory(self, propName):
+        self._ensureGeneration()
+        return self.window.getProperty(self.PROPERTY_IN_MEMORY + propName) == self.generation
+
+
+    def _setInMemory(self, propName):
+        self._ensureGeneration()
+        self.window.setProperty(self.PROPERTY_IN_MEMORY + propName, self.generation)
 
 
     def _ensureDirtyNamesSet(self):
@@ -283,75 +519,149 @@ class SimpleCache():
 
 
 
-    def _writeBlankCacheFile(self, fullPath):
+    def _ensureStorage(self):
         '''
-        Initializes a blank cache file.
+        Creates the storage engine chosen in the 'cache_storage' add-on setting, and loads
+        its manifest, only when they're needed.
         '''
-        file = xbmcvfs.File(fullPath, 'w')
-        file.write('null') # JSON equivalent to None.
-        file.close()
+        if self.storage == None:
+            self.storage = self._makeStorage()
+        self.manifest.ensureLoaded(self.storage)
 
 
-    def _tryLoadCacheProperty(self, fullPath):
+    def _makeStorage(self):
+        engineClass = self.STORAGE_ENGINES.get(xbmcaddon.Addon().getSetting('cache_storage'), FileStorage)
+        # The storage keeps expired properties for as long as they might be used stale or revalidated.
+        staleGrace = max(self.getMaxStaleness(), self.EXPIRED_KEEP_HOURS)
+        return engineClass(self.CACHE_PATH_DIR, self.CACHE_VERSION, self.CACHE_MIN_VERSION, staleGrace)
+
+
+    def _flushProperties(self, storage, dirtyNames, byteBudget, accessTimes=None):
+        '''
+        Saves the named properties with 'storage', then evicts old properties if the cache went over the
+        size limit, as the cache only grows when saving. Might run in a worker thread.
+        :param accessTimes: Optional dict from the storage takeAccessTimes(), saved first so the eviction uses them.
         '''
-        Tries to load the cache file for the named property.
-        :returns: A tuple of property entries, each entry is a tuple of fields
-        (propName, data, lifetime, epoch).
+        try:
+            if accessTimes:
+                storage.saveAccessTimes(accessTimes)
+            metadata = { }
+            written = storage.saveProperties(self._dirtyEntries(dirtyNames, metadata))
+            for propName, byteCount in written:
+                self._recordStat(propName, 'write', None, byteCount) # Batched, so not timed per property.
+            evictedNames = storage.evict(byteBudget) if byteBudget and written else ()
+            self.manifest.update(storage, self._makeManifestEntries(written, metadata), evictedNames)
+            self.manifest.saveFile()
+            self.flushCacheStats() # This might run after the add-on invocation flushed its statistics.
+        except Exception as e:
+            xbmc.log('SimpleCache | Failed to save the cache: ' + str(e), xbmc.LOGERROR)
+
+
+    def _recordStat(self, propName, event, startTime, byteCount=0):
         '''
+        Records an event in the cache statistics, if the 'cache_stats' add-on setting is enabled.
+        :param startTime: The time() when the event started, or None for an untimed event.
+        '''
+        if self.statsEnabled == None:
+            self.statsEnabled = xbmcaddon.Addon().getSetting('cache_stats') == 'true'
+        if self.statsEnabled:
+            elapsedMs = (time() - startTime) * 1000.0 if startTime else 0.0
+            self.stats.record(propName, event, elapsedMs, byteCount)
+
+
+    def _getDefaultCodec(self):
+        '''
+        :returns: The codec name from the 'cache_codec' add-on setting, used to save disk-enabled properties.
+        '''
+        codec = xbmcaddon.Addon().getSetting('cache_codec').lower()
+        return codec if codec in codecs.availableCodecs() else self.DEFAULT_CODEC
+
+
+    def _getByteBudget(self):
+        '''
+        :returns: The cache size limit from the 'cache_budget' add-on setting (in megabytes),
+        converted to bytes. Zero means no limit.
+        '''
+        try:
+            return int(xbmcaddon.Addon().getSetting('cache_budget')) * 1048576
+        except ValueError:
+            return 0
+
+
+    def _tryLoadCacheProperty(self, propName, maxStaleness=0):
+        '''
+        Tries to load the named property from the storage engine. The manifest is checked
+        first, so missing or expired properties are known without touching the storage.
+        :param maxStaleness: How many hours past its lifetime the property is still accepted.
+        :returns: A tuple of fields (propName, data, lifetime, epoch), or None if the property
+        isn't saved or has expired.
+        '''
+        self._ensureStorage()
         currentEpoch = self._getEpochHours()
-        if xbmcvfs.exists(fullPath):
-            try:
-                file = xbmcvfs.File(fullPath)
-                data = file.read()
-                file.close()
-
-                if data and data != 'null':
-                    fileProp = json.loads(data)
-
-                    # Version restriction.
-                    version = fileProp['version']
-                    if version >= self.CACHE_VERSION:
-                        lifetime = fileProp['lifetime']
-                        epoch = fileProp['epoch']
-                        # Lifetime restriction. See if the property lasts forever or if
-                        # its age is now bigger than its lifetime.
-                        if lifetime == 0 or lifetime >= abs(currentEpoch - epoch):
-                           return (fileProp['propName'], fileProp['data'], lifetime, epoch)
-            except:
-                return None
-        else:
+        entry = self.manifest.get(propName)
+        if not entry or not self._isManifestEntryUsable(entry, currentEpoch, maxStaleness):
+            return None
+
+        fileProp = self.storage.load(propName, currentEpoch)
+        if not fileProp:
+            # Deleted or unreadable, the manifest was out of date.
+            self.manifest.update(self.storage, removedNames=(propName,))
             return None
+        if self._isExpired(fileProp[2], fileProp[3], currentEpoch, maxStaleness):
+            return None
+        return fileProp
+
+
+    def _isExpired(self, lifetime, epoch, currentEpoch, maxStaleness=0):
+        # A zero lifetime lasts forever.
+        return lifetime != 0 and abs(currentEpoch - epoch) > lifetime + maxStaleness
 
 
-    def _storeCacheProperty(self, propName, data, lifetime, epoch):
+    def _isManifestEntryUsable(self, entry, currentEpoch, maxStaleness=0):
+        return (
+            entry[SimpleCacheManifest.FIELD_VERSION] >= self.CACHE_MIN_VERSION
+            and not self._isExpired(
+                entry[SimpleCacheManifest.FIELD_LIFETIME], entry[SimpleCacheManifest.FIELD_EPOCH], currentEpoch, maxStaleness
+            )
+        )
+
+
+    def _makeManifestEntries(self, written, metadata):
+        '''
+        :param written: The (propName, byteCount) tuples returned by the storage saveProperties().
+        :param metadata: A dict of property names mapped to their (epoch, lifetime, codec) tuples.
+        :returns: A dict of the new manifest entries, for SimpleCacheManifest.update().
+        '''
+        return {
+            propName: [byteCount] + list(metadata[propName]) + [self.CACHE_VERSION]
+            for propName, byteCount in written
+        }
+
+
+    def _storeCacheProperty(self, propName, data, lifetime, epoch, codec=None):
         '''
         Stores data in a persistent XBMC window memory property.
+        The codec is only remembered to be used when saving, the memory property is always JSON.
         '''
-        self.window.setProperty(propName, json.dumps((data, lifetime, epoch)))
+        self.window.setProperty(propName, json.dumps((data, lifetime, epoch, codec)))
 
 
-    def _saveCacheProperty(self, propName):
+    def _dirtyEntries(self, dirtyNames, metadata):
         '''
-        Saves a specific dirty, disk-enabled property to disk.
-        Assumes the destination folder already exists.
+        Generator of (propName, data, lifetime, epoch, codec) tuples of the dirty, disk-enabled
+        properties that are in memory, to be saved by the storage engine.
+        The (epoch, lifetime, codec) of each property is also kept in the 'metadata' dict, for the manifest.
         '''
-        propRaw = self.window.getProperty(propName)
-        if propRaw:
-            # Base structure as in _storeCacheProperty(), with the cache version added.
-            data, lifetime, epoch = json.loads(propRaw)
-            file = xbmcvfs.File(self.CACHE_PATH_DIR + propName + '.json', 'w')
-            file.write(
-                json.dumps(
-                    {
-                        'version': self.CACHE_VERSION,
-                        'propName': propName,
-                        'lifetime': lifetime,
-                        'epoch': epoch,
-                        'data': data
-                    }
-                )
-            )
-            file.close()
+        defaultCodec = self._getDefaultCodec()
+        for propName in dirtyNames:
+            propRaw = self.window.getProperty(propName)
+            if propRaw:
+                # Base structure as in _storeCacheProperty().
+                fields = json.loads(propRaw)
+                data, lifetime, epoch = fields[:3]
+                codec = (fields[3] if len(fields) > 3 else None) or defaultCodec # Properties from before the codecs have 3 fields.
+                metadata[propName] = (epoch, lifetime, codec)
+                yield propName, data, lifetime, epoch, codec
 
 
     def _setToString(self, setObject):
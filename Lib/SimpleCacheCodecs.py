@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+import sys
+import json
+import zlib
+from time import time
+from base64 import b64encode, b64decode
+
+try:
+    import marshal
+except ImportError:
+    marshal = None # Not every Python build has it.
+
+
+# Codecs used by SimpleCache to encode property data.
+
+# Each codec turns JSON-serializable data into a byte string and back. The codec of a payload is
+# detected from its first bytes, so any payload can be decoded without knowing how it was encoded:
+# - JSON text, as in CACHE_VERSION 3, starts with one of the JSON value characters.
+# - zlib streams start with the 0x78 byte ('x').
+# - gzip streams start with the 0x1F 0x8B bytes.
+# - marshal payloads start with MARSHAL_HEADER, which includes the Python major version as the
+#   marshal format changes between Python 2 and 3.
+
+CODEC_JSON = 'json'
+CODEC_ZLIB = 'zlib'
+CODEC_GZIP = 'gzip'
+CODEC_MARSHAL = 'marshal'
+
+COMPRESSION_LEVEL = 6 # The zlib default, a balance between size and speed.
+
+MARSHAL_HEADER = b'\x00M' + str(sys.version_info[0]).encode('ascii')
+GZIP_HEADER = b'\x1f\x8b'
+ZLIB_HEADER = b'\x78'
+
+# Prefix of window property text that holds a base64 payload instead of JSON text. JSON never starts with '#'.
+TEXT_PREFIX = '#'
+
+
+def availableCodecs():
+    return (CODEC_JSON, CODEC_ZLIB, CODEC_GZIP) + ((CODEC_MARSHAL,) if marshal else ())
+
+
+def encode(data, codec):
+    '''
+    Encodes 'data' into a byte string with the named codec. Unknown or unavailable codecs fall back to JSON.
+    '''
+    if codec == CODEC_MARSHAL and marshal:
+        return MARSHAL_HEADER + marshal.dumps(data)
+
+    jsonBytes = _toBytes(json.dumps(data, separators=(',', ':')))
+    if codec == CODEC_ZLIB:
+        return zlib.compress(jsonBytes, COMPRESSION_LEVEL)
+    elif codec == CODEC_GZIP:
+        compressor = zlib.compressobj(COMPRESSION_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS) # 16+ means gzip.
+        return compressor.compress(jsonBytes) + compressor.flush()
+    else:
+        return jsonBytes
+
+
+def decode(payload):
+    '''
+    Decodes a payload made with encode(), or the plain JSON text of older cache files.
+    :param payload: A byte string, bytearray or (JSON) text string.
+    :returns: The decoded data. Raises ValueError when the payload can't be decoded.
+    '''
+    if not isinstance(payload, bytes):
+        if isinstance(payload, bytearray):
+            payload = bytes(payload)
+        else:
+            return json.loads(payload) # Text, always JSON.
+
+    codec = detectCodec(payload)
+    if codec == CODEC_MARSHAL:
+        if marshal and payload.startswith(MARSHAL_HEADER):
+            return marshal.loads(payload[len(MARSHAL_HEADER):])
+        raise ValueError('Marshal payload from another Python version')
+    elif codec == CODEC_GZIP:
+        return json.loads(zlib.decompress(payload, 16 + zlib.MAX_WBITS).decode('utf-8'))
+    elif codec == CODEC_ZLIB:
+        return json.loads(zlib.decompress(payload).decode('utf-8'))
+    else:
+        return json.loads(payload.decode('utf-8'))
+
+
+def detectCodec(payload):
+    '''
+    :returns: The name of the codec that made a byte string payload, from its first bytes.
+    '''
+    if payload.startswith(MARSHAL_HEADER[:2]):
+        return CODEC_MARSHAL
+    elif payload.startswith(GZIP_HEADER):
+        return CODEC_GZIP
+    elif payload.startswith(ZLIB_HEADER):
+        return CODEC_ZLIB
+    else:
+        return CODEC_JSON
+
+
+def encodeText(data, codec):
+    '''
+    Encodes 'data' into text that can be stored in a window property. JSON stays as it is,
+    the other codecs are stored as base64.
+    '''
+    if codec == CODEC_JSON or codec not in availableCodecs():
+        return json.dumps(data)
+    return TEXT_PREFIX + b64encode(encode(data, codec)).decode('ascii')
+
+
+def decodeText(text):
+    '''
+    Decodes the window property text made with encodeText().
+    '''
+    if text.startswith(TEXT_PREFIX):
+        return decode(b64decode(text[len(TEXT_PREFIX):]))
+    return json.loads(text)
+
+
+def benchmark(data, repeat=3, writeRead=None):
+    '''
+    Measures each available codec with 'data', meant to be a real-sized '/GetAll(...)' payload.
+    :param repeat: How many times each step is repeated, the best time is kept.
+    :param writeRead: Optional function that takes a payload, writes it to disk and reads it back,
+    so that the disk speed is included in the results.
+    :returns: A list of (codec, size in bytes, encode ms, decode ms, write+read ms) tuples. The
+    write+read time is None without 'writeRead'.
+    '''
+    def _bestTime(function, *args):
+        bestTime = None
+        for index in range(repeat):
+            startTime = time()
+            result = function(*args)
+            elapsed = (time() - startTime) * 1000.0
+            bestTime = elapsed if bestTime == None else min(bestTime, elapsed)
+        return bestTime, result
+
+    results = [ ]
+    for codec in availableCodecs():
+        encodeTime, payload = _bestTime(encode, data, codec)
+        decodeTime, decoded = _bestTime(decode, payload)
+        ioTime = _bestTime(writeRead, payload)[0] if writeRead else None
+        results.append((codec, len(payload), encodeTime, decodeTime, ioTime))
+    return results
+
+
+def formatBenchmark(results):
+    lines = ['%-8s %10s %10s %10s %10s' % ('codec', 'bytes', 'encode ms', 'decode ms', 'disk ms')]
+    for codec, size, encodeTime, decodeTime, ioTime in results:
+        lines.append(
+            '%-8s %10i %10.1f %10.1f %10s'
+            % (codec, size, encodeTime, decodeTime, '%.1f' % ioTime if ioTime != None else '-')
+        )
+    return '\n'.join(lines)
+
+
+def _toBytes(text):
+    return text if isinstance(text, bytes) else text.encode('utf-8')
+
+
+if __name__ == '__main__':
+    # Benchmark outside of Kodi with a saved '/GetAll(...)' response:
+    # python -m Lib.SimpleCacheCodecs GetAllCartoon.json
+    with open(sys.argv[1], 'rb') as payloadFile:
+        print(formatBenchmark(benchmark(decode(payloadFile.read()))))
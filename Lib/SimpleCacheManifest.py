@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+import json
+from threading import Lock
+
+import xbmcvfs
+
+from Lib import DICT_ITER_ITEMS
+
+
+# The manifest of the properties that SimpleCache has in its storage engine.
+
+# It answers if a property is saved, and if it's expired, without touching the storage. It's
+# kept as JSON text in a window property, shared by all add-on invocations in a Kodi session,
+# and in a file in the cache folder so the next Kodi session doesn't need to rebuild it.
+# Changes are merged into the latest window property right away, the file is only written
+# when the cache is saved (see SimpleCache.saveCacheIfDirty()).
+
+class SimpleCacheManifest():
+    '''
+    The manifest is a dict of property names, each mapped to a list of fields:
+    {
+        propName: [size, epoch, lifetime, codec, version]
+    }
+    It belongs to one storage engine, it's rebuilt from the storage when the engine changes or when
+    the manifest file is missing (like when upgrading from an older cache version).
+    '''
+
+    # Property name for the JSON text of the manifest, in window memory.
+    PROPERTY_MANIFEST = 'scache.prop.manifest'
+    # Property that's '1' when the window memory manifest has changes that aren't in the file yet.
+    PROPERTY_FILE_DIRTY = 'scache.prop.manifestDirty'
+
+    # Manifest file in the cache folder. It's not '.json' so it's not mistaken for a cache file.
+    MANIFEST_FILENAME = 'manifest.dat'
+
+    # Indexes of the fields of each manifest entry.
+    FIELD_SIZE = 0
+    FIELD_EPOCH = 1
+    FIELD_LIFETIME = 2
+    FIELD_CODEC = 3
+    FIELD_VERSION = 4
+
+
+    def __init__(self, window, dirPath):
+        self.window = window
+        self.dirPath = dirPath
+        self.filePath = dirPath + self.MANIFEST_FILENAME
+        self.entries = None
+        self.lock = Lock() # Updated by worker threads that save properties.
+
+
+    def ensureLoaded(self, storage):
+        '''
+        Loads the manifest once per add-on invocation, from window memory or its file. If neither
+        belongs to the current storage engine, it's rebuilt by reading the storage once.
+        '''
+        if self.entries == None:
+            engine = storage.__class__.__name__
+            manifest = self._loadManifest()
+            if manifest.get('engine') != engine:
+                manifest = {'engine': engine, 'entries': storage.readManifest()}
+                self._storeManifest(manifest)
+            self.entries = manifest['entries']
+
+
+    def get(self, propName):
+        '''
+        :returns: The manifest entry of a property, or None if it's not in the storage.
+        '''
+        return self.entries.get(propName)
+
+
+    def iterItems(self):
+        return DICT_ITER_ITEMS(self.entries)
+
+
+    def update(self, storage, newEntries=None, removedNames=()):
+        '''
+        Merges changes into the manifest, after the storage saved or deleted properties.
+        :param newEntries: A dict of property names mapped to their new manifest entries.
+        :param removedNames: An iterable of property names that aren't in the storage anymore.
+        '''
+        with self.lock:
+            # Merge into the latest window memory manifest, as other add-on invocations (and their background
+            # saves) change it too. Window properties can't be locked between invocations, so the changes are
+            # applied right between reading and storing it, to keep the chance of overwriting another's short.
+            manifest = self._loadManifest()
+            if manifest.get('engine') != storage.__class__.__name__:
+                manifest = {'engine': storage.__class__.__name__, 'entries': storage.readManifest()}
+            entries = manifest['entries']
+            if newEntries:
+                entries.update(newEntries)
+            for propName in removedNames:
+                entries.pop(propName, None)
+            self._storeManifest(manifest)
+            self.entries = entries
+
+
+    def saveFile(self):
+        '''
+        Writes the window memory manifest to its file, if it changed since the last time.
+        '''
+        with self.lock:
+            if self.window.getProperty(self.PROPERTY_FILE_DIRTY):
+                self.window.setProperty(self.PROPERTY_FILE_DIRTY, '')
+                # The latest manifest, with the changes of all the add-on invocations.
+                manifestRaw = self.window.getProperty(self.PROPERTY_MANIFEST)
+                if manifestRaw:
+                    if not xbmcvfs.exists(self.dirPath):
+                        xbmcvfs.mkdir(self.dirPath)
+                    file = xbmcvfs.File(self.filePath, 'w')
+                    file.write(manifestRaw)
+                    file.close()
+
+
+    def clear(self):
+        with self.lock:
+            self.entries = None
+            self.window.setProperty(self.PROPERTY_MANIFEST, '')
+            self.window.setProperty(self.PROPERTY_FILE_DIRTY, '')
+            if xbmcvfs.exists(self.filePath):
+                xbmcvfs.delete(self.filePath)
+
+
+    def _loadManifest(self):
+        manifestRaw = self.window.getProperty(self.PROPERTY_MANIFEST)
+        if not manifestRaw and xbmcvfs.exists(self.filePath):
+            # First use in this Kodi session.
+            try:
+                file = xbmcvfs.File(self.filePath)
+                manifestRaw = file.read()
+                file.close()
+            except:
+                pass
+        try:
+            return json.loads(manifestRaw) if manifestRaw else { }
+        except ValueError:
+            return { }
+
+
+    def _storeManifest(self, manifest):
+        self.window.setProperty(self.PROPERTY_MANIFEST, json.dumps(manifest))
+        self.window.setProperty(self.PROPERTY_FILE_DIRTY, '1') # Written to the file by saveFile().
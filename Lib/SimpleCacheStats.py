@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+import json
+from time import time
+from threading import Lock
+
+import xbmcvfs
+
+from Lib import DICT_ITER_ITEMS
+
+
+# Per-property counters for SimpleCache, used to tell how often properties are found in memory,
+# loaded from disk or requested from the web, and how long each of these takes.
+
+class SimpleCacheStats():
+    '''
+    The statistics are a dict of property names, each mapped to a dict of counters:
+    {
+        propName: {
+            'memory': 12, 'memoryMs': 30.5, (found in window memory, and the total milliseconds it took)
+            'disk': 1, 'diskMs': 250.0, 'bytesRead': 760371, (loaded from the storage)
+            'miss': 1, (not in memory nor in the storage)
+            'web': 1, 'webMs': 3200.0, 'bytesWeb': 2058502, (requested from the web after a miss)
+            'write': 1, 'bytesWritten': 760371 (saved to the storage)
+        }
+    }
+    Counters are accumulated in this object and merged into a window property with flush(), so they
+    persist between add-on invocations. Every SAVE_INTERVAL seconds they're also saved to a file, so
+    they persist between Kodi sessions.
+    '''
+
+    # Property name for the JSON text of the statistics, in window memory.
+    PROPERTY_STATS = 'scache.prop.stats'
+    # Property name for the time when the statistics were last saved to their file.
+    PROPERTY_STATS_SAVED = 'scache.prop.statsSaved'
+
+    SAVE_INTERVAL = 300 # Seconds.
+
+    # Statistics file in the cache folder. It's not '.json' so it's not mistaken for a cache file.
+    STATS_FILENAME = 'stats.dat'
+
+    # Byte counter keys of each event.
+    BYTE_KEYS = {'disk': 'bytesRead', 'web': 'bytesWeb', 'write': 'bytesWritten'}
+
+
+    def __init__(self, window, dirPath):
+        self.window = window
+        self.dirPath = dirPath
+        self.filePath = dirPath + self.STATS_FILENAME
+        self.pending = { }
+        self.lock = Lock() # Events can be recorded by worker threads.
+        # The background save flushes too, so the read-merge-write of the window property is done
+        # by one thread at a time, or the events merged by the other thread would be lost.
+        self.flushLock = Lock()
+
+
+    def record(self, propName, event, elapsedMs=0.0, byteCount=0):
+        '''
+        Counts an event for a property.
+        :param event: One of 'memory', 'disk', 'miss', 'web' or 'write'.
+        '''
+        with self.lock:
+            counters = self.pending.setdefault(propName, { })
+            counters[event] = counters.get(event, 0) + 1
+            if elapsedMs:
+                counters[event + 'Ms'] = counters.get(event + 'Ms', 0.0) + elapsedMs
+            if byteCount:
+                byteKey = self.BYTE_KEYS.get(event, 'bytesRead')
+                counters[byteKey] = counters.get(byteKey, 0) + byteCount
+
+
+    def flush(self, forceSave=False):
+        '''
+        Merges the events recorded so far into the window memory statistics, and saves
+        them to their file if it's been a while (or if 'forceSave' is True).
+        '''
+        with self.flushLock:
+            self._flushLocked(forceSave)
+
+
+    def getStats(self):
+        self.flush()
+        return self._loadStats()
+
+
+    def reset(self):
+        with self.flushLock:
+            with self.lock:
+                self.pending = { }
+            self.window.setProperty(self.PROPERTY_STATS, '{}')
+            self._flushLocked(forceSave=True)
+
+
+    def _flushLocked(self, forceSave):
+        with self.lock:
+            pending, self.pending = self.pending, { }
+        if not pending and not forceSave:
+            return
+
+        stats = self._loadStats()
+        for propName, counters in DICT_ITER_ITEMS(pending):
+            totals = stats.setdefault(propName, { })
+            for key, value in DICT_ITER_ITEMS(counters):
+                totals[key] = totals.get(key, 0) + value
+        statsRaw = json.dumps(stats)
+        self.window.setProperty(self.PROPERTY_STATS, statsRaw)
+
+        currentTime = int(time())
+        lastSaved = self.window.getProperty(self.PROPERTY_STATS_SAVED)
+        if forceSave or not lastSaved or currentTime - int(lastSaved) > self.SAVE_INTERVAL:
+            if not xbmcvfs.exists(self.dirPath):
+                xbmcvfs.mkdir(self.dirPath)
+            file = xbmcvfs.File(self.filePath, 'w')
+            file.write(statsRaw)
+            file.close()
+            self.window.setProperty(self.PROPERTY_STATS_SAVED, str(currentTime))
+
+
+    def _loadStats(self):
+        statsRaw = self.window.getProperty(self.PROPERTY_STATS)
+        if not statsRaw and xbmcvfs.exists(self.filePath):
+            # First use in this Kodi session, continue from the saved statistics.
+            try:
+                file = xbmcvfs.File(self.filePath)
+                statsRaw = file.read()
+                file.close()
+            except:
+                pass
+        try:
+            return json.loads(statsRaw) if statsRaw else { }
+        except ValueError:
+            return { }
@@ -0,0 +1,429 @@
+# -*- coding: utf-8 -*-
+import sqlite3
+from os import utime
+from time import time
+from threading import current_thread
+
+import xbmcvfs
+
+from Lib import SimpleCacheCodecs as codecs
+
+
+# Storage engines used by SimpleCache to persist its disk-enabled properties.
+
+# Both engines have the same interface:
+# - load(propName, currentEpoch): returns a (propName, data, lifetime, epoch) tuple or None if the
+#   property doesn't exist, is expired or was saved with a cache version older than 'minVersion'.
+#   Expired properties are still returned for 'staleGrace' hours after their expiry, SimpleCache
+#   decides if they can be used. The size of the loaded payload is kept in 'lastLoadSize'.
+# - saveProperties(entries): saves an iterable of (propName, data, lifetime, epoch, codec) tuples,
+#   the data is encoded with the named codec from SimpleCacheCodecs. Returns a list of
+#   (propName, byteCount) tuples of what was written.
+# - readManifest(): returns a dict of the saved property names, each mapped to a list of
+#   [size, epoch, lifetime, codec, version] fields, to rebuild the SimpleCacheManifest.
+# - renew(propName, lifetime, epoch): changes the lifetime and epoch of a saved property without
+#   changing its data. Returns a (byteCount, codec) tuple, or None if the property isn't saved.
+# - delete(propNames): deletes the named properties.
+# - sweepLeftovers(): deletes what's left from interrupted saves and cleared properties.
+# - evict(byteBudget): deletes the least recently used properties until the total size fits the
+#   budget. Returns a list of the deleted property names.
+# - takeAccessTimes(): returns the dict of property names mapped to the times they were loaded, that
+#   weren't saved yet, and forgets them. saveAccessTimes(accessTimes) saves them, for the LRU eviction.
+# - clear(): forgets all saved properties, returns True if anything was cleared.
+
+class FileStorage():
+    '''
+    The original engine, one '<propName>.json' file for each disk-enabled property (the file
+    keeps the '.json' extension even when its content is compressed by a codec).
+    The modification time of each file is used as its last access time, for the LRU eviction.
+    '''
+
+    BLANK_FILE_SIZE = 4 # Size of the 'null' content of a blank cache file.
+
+    # Age in seconds after which a leftover temporary file is considered abandoned by a killed process.
+    TEMP_FILE_MAX_AGE = 3600
+
+
+    def __init__(self, dirPath, version, minVersion, staleGrace=0):
+        self.dirPath = dirPath
+        self.version = version
+        self.minVersion = minVersion
+        self.staleGrace = staleGrace
+        self.lastLoadSize = 0
+
+
+    def load(self, propName, currentEpoch):
+        fullPath = self.dirPath + propName + '.json'
+        if xbmcvfs.exists(fullPath):
+            fileProp = self._readCacheFile(fullPath)
+            if fileProp:
+                if self._isFresh(fileProp, currentEpoch):
+                    self._touch(fullPath)
+                    return (fileProp['propName'], fileProp['data'], fileProp['lifetime'], fileProp['epoch'])
+                else:
+                    xbmcvfs.delete(fullPath) # Expired or old version, it won't be used again.
+        return None
+
+
+    def saveProperties(self, entries):
+        if not xbmcvfs.exists(self.dirPath):
+            xbmcvfs.mkdir(self.dirPath)
+
+        written = [ ]
+        for propName, data, lifetime, epoch, codec in entries:
+            fullPath = self.dirPath + propName + '.json'
+            # Write to a temporary file first, unique to this thread as other add-on invocations might
+            # be saving the same property, then rename it over the cache file. The rename is atomic, so a
+            # killed process never leaves a half-written cache file, at most a stray temporary file.
+            tempPath = '%s.%i.tmp' % (fullPath, current_thread().ident)
+            payload = codecs.encode(
+                {
+                    'version': self.version,
+                    'propName': propName,
+                    'lifetime': lifetime,
+                    'epoch': epoch,
+                    'data': data
+                },
+                codec
+            )
+            file = xbmcvfs.File(tempPath, 'w')
+            success = file.write(bytearray(payload))
+            file.close()
+            if success:
+                self._replaceFile(tempPath, fullPath)
+                written.append((propName, len(payload)))
+            else:
+                xbmcvfs.delete(tempPath) # Probably out of disk space.
+        return written
+
+
+    def readManifest(self):
+        '''
+        Each file needs to be read to know its fields, so this should be called sparingly.
+        '''
+        manifest = { }
+        for fullPath in self._listCacheFiles():
+            payload = self._readPayload(fullPath)
+            try:
+                fileProp = codecs.decode(payload) if payload else None
+            except ValueError:
+                fileProp = None
+            if fileProp: # Blank files decode as None.
+                manifest[fileProp['propName']] = [
+                    len(payload), fileProp['epoch'], fileProp['lifetime'],
+                    codecs.detectCodec(bytes(payload)), fileProp['version']
+                ]
+        return manifest
+
+
+    def renew(self, propName, lifetime, epoch):
+        # The lifetime and epoch are inside the encoded file, so it needs to be saved again.
+        fullPath = self.dirPath + propName + '.json'
+        if not xbmcvfs.exists(fullPath):
+            return None
+        payload = self._readPayload(fullPath)
+        try:
+            fileProp = codecs.decode(payload) if payload else None
+        except ValueError:
+            fileProp = None
+        if not fileProp:
+            return None
+        codec = codecs.detectCodec(bytes(payload))
+        written = self.saveProperties(((propName, fileProp['data'], lifetime, epoch, codec),))
+        return (written[0][1], codec) if written else None
+
+
+    def delete(self, propNames):
+        for propName in propNames:
+            fullPath = self.dirPath + propName + '.json'
+            if xbmcvfs.exists(fullPath):
+                xbmcvfs.delete(fullPath)
+
+
+    def sweepLeftovers(self):
+        '''
+        Deletes the blank files and the temporary files from saves that never finished.
+        Only the file sizes and times are checked, no file is read.
+        '''
+        for fullPath in self._listCacheFiles():
+            if xbmcvfs.Stat(fullPath).st_size() <= self.BLANK_FILE_SIZE:
+                xbmcvfs.delete(fullPath)
+
+        currentTime = time()
+        for fullPath in self._listCacheFiles('.tmp'):
+            if currentTime - xbmcvfs.Stat(fullPath).st_mtime() > self.TEMP_FILE_MAX_AGE:
+                xbmcvfs.delete(fullPath)
+
+
+    def evict(self, byteBudget):
+        fileStats = [ ]
+        totalBytes = 0
+        for fullPath in self._listCacheFiles():
+            stat = xbmcvfs.Stat(fullPath)
+            fileStats.append((stat.st_mtime(), stat.st_size(), fullPath))
+            totalBytes += stat.st_size()
+
+        evictedNames = [ ]
+        if totalBytes > byteBudget:
+            for mtime, size, fullPath in sorted(fileStats): # Oldest access first.
+                xbmcvfs.delete(fullPath)
+                evictedNames.append(fullPath[len(self.dirPath):-len('.json')])
+                totalBytes -= size
+                if totalBytes <= byteBudget:
+                    break
+        return evictedNames
+
+
+    def takeAccessTimes(self):
+        return { } # The files are touched when they're loaded.
+
+
+    def saveAccessTimes(self, accessTimes):
+        pass
+
+
+    def clear(self):
+        jsonPaths = self._listCacheFiles()
+        for fullPath in jsonPaths:
+            self._writeBlankCacheFile(fullPath)
+        return len(jsonPaths) > 0 # Return True if at least one file was cleared.
+
+
+    def _listCacheFiles(self, extension='.json'):
+        if not xbmcvfs.exists(self.dirPath):
+            return ()
+        dirPaths, filePaths = xbmcvfs.listdir(self.dirPath)
+        return tuple(self.dirPath + filePath for filePath in filePaths if filePath.endswith(extension))
+
+
+    def _readCacheFile(self, fullPath):
+        '''
+        :returns: The dict from a cache file, or None if the file is blank or unreadable.
+        '''
+        try:
+            payload = self._readPayload(fullPath)
+            self.lastLoadSize = len(payload)
+            if payload:
+                return codecs.decode(payload) # Blank files decode as None.
+        except:
+            pass
+        return None
+
+
+    def _readPayload(self, fullPath):
+        file = xbmcvfs.File(fullPath)
+        # Python 3 Kodi reads text with read(), the payload might be compressed so it's read as bytes.
+        payload = file.readBytes() if hasattr(file, 'readBytes') else file.read()
+        file.close()
+        return payload
+
+
+    def _isFresh(self, fileProp, currentEpoch):
+        # Version restriction.
+        if fileProp['version'] >= self.minVersion:
+            lifetime = fileProp['lifetime']
+            # Lifetime restriction. See if the property lasts forever or if
+            # its age is now bigger than its lifetime (plus the stale grace period).
+            return lifetime == 0 or lifetime + self.staleGrace >= abs(currentEpoch - fileProp['epoch'])
+        return False
+
+
+    def _replaceFile(self, sourcePath, destPath):
+        if not xbmcvfs.rename(sourcePath, destPath):
+            # Some file systems (like on Windows) can't rename over an existing file.
+            xbmcvfs.delete(destPath)
+            xbmcvfs.rename(sourcePath, destPath)
+
+
+    def _touch(self, fullPath):
+        '''
+        Updates the modification time of a file, marking it as recently used.
+        '''
+        try:
+            utime(fullPath, None)
+        except:
+            pass # Not a local file system path, the file will just be evicted earlier.
+
+
+    def _writeBlankCacheFile(self, fullPath):
+        '''
+        Initializes a blank cache file.
+        '''
+        file = xbmcvfs.File(fullPath, 'w')
+        file.write('null') # JSON equivalent to None.
+        file.close()
+
+
+class SQLiteStorage():
+    '''
+    Keeps all disk-enabled properties in a single SQLite database file.
+    Lookups go through the primary key index, expiry is tested in the same query with
+    the 'expires' column, and all dirty properties are written in one transaction.
+    '''
+
+    DB_FILENAME = 'cache.db'
+
+    '''
+    Schema version log:
+    1: Development version after Toonmania2 0.5.2
+        propName, version, lifetime, epoch, expires, data.
+    2: Development version after Toonmania2 0.5.2
+        Added the 'size' and 'accessed' columns for the LRU eviction.
+    3: Toonmania2 0.5.3
+        The 'data' column is declared as BLOB, what it holds since the codecs.
+    '''
+    # Stored as the database 'user_version', the table is recreated when this doesn't match.
+    SCHEMA_VERSION = 3
+
+
+    def __init__(self, dirPath, version, minVersion, staleGrace=0):
+        self.dirPath = dirPath
+        self.version = version
+        self.minVersion = minVersion
+        self.staleGrace = staleGrace
+        self.lastLoadSize = 0
+        self.connection = None
+        self.accessTimes = { } # Properties loaded since the last saveAccessTimes(), see takeAccessTimes().
+
+
+    def load(self, propName, currentEpoch):
+        try:
+            self._ensureConnection()
+            row = self.connection.execute(
+                'SELECT lifetime, epoch, data FROM cache WHERE propName = ? AND version >= ? '
+                'AND (expires IS NULL OR expires + ? >= ?)',
+                (propName, self.minVersion, self.staleGrace, currentEpoch)
+            ).fetchone()
+        except sqlite3.Error:
+            return None
+        if row:
+            lifetime, epoch, payload = row
+            self.lastLoadSize = len(payload)
+            # The access time is saved later with the other ones, so a load doesn't write to the database.
+            self.accessTimes[propName] = int(time())
+            try:
+                # On Python 2 the BLOB comes as a buffer object.
+                return (propName, codecs.decode(bytes(payload)), lifetime, epoch)
+            except (ValueError, TypeError):
+                return None
+        return None
+
+
+    def saveProperties(self, entries):
+        self._ensureConnection()
+        rows = tuple(self._makeRows(entries))
+        with self.connection: # One transaction for the whole batch, committed on exit.
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO cache (propName, version, lifetime, epoch, expires, size, accessed, data) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                rows
+            )
+        return [(row[0], row[5]) for row in rows]
+
+
+    def readManifest(self):
+        self._ensureConnection()
+        # Only the first bytes of the data are read, to detect the codec.
+        return {
+            propName: [size, epoch, lifetime, codecs.detectCodec(bytes(header)), version]
+            for propName, size, epoch, lifetime, version, header in self.connection.execute(
+                'SELECT propName, size, epoch, lifetime, version, CAST(SUBSTR(data, 1, 3) AS BLOB) FROM cache'
+            )
+        }
+
+
+    def renew(self, propName, lifetime, epoch):
+        self._ensureConnection()
+        with self.connection:
+            self.connection.execute(
+                'UPDATE cache SET version = ?, lifetime = ?, epoch = ?, expires = ?, accessed = ? WHERE propName = ?',
+                (self.version, lifetime, epoch, (epoch + lifetime) if lifetime else None, int(time()), propName)
+            )
+        row = self.connection.execute(
+            'SELECT size, CAST(SUBSTR(data, 1, 3) AS BLOB) FROM cache WHERE propName = ?', (propName,)
+        ).fetchone()
+        return (row[0], codecs.detectCodec(bytes(row[1]))) if row else None
+
+
+    def delete(self, propNames):
+        self._ensureConnection()
+        with self.connection:
+            self.connection.executemany('DELETE FROM cache WHERE propName = ?', ((propName,) for propName in propNames))
+
+
+    def sweepLeftovers(self):
+        pass # Transactions leave nothing behind.
+
+
+    def evict(self, byteBudget):
+        self._ensureConnection()
+        totalBytes = self.connection.execute('SELECT COALESCE(SUM(size), 0) FROM cache').fetchone()[0]
+        evictedNames = [ ]
+        if totalBytes > byteBudget:
+            for propName, size in self.connection.execute('SELECT propName, size FROM cache ORDER BY accessed'):
+                evictedNames.append(propName)
+                totalBytes -= size
+                if totalBytes <= byteBudget:
+                    break
+            self.delete(evictedNames)
+        return evictedNames
+
+
+    def takeAccessTimes(self):
+        accessTimes, self.accessTimes = self.accessTimes, { }
+        return accessTimes
+
+
+    def saveAccessTimes(self, accessTimes):
+        self._ensureConnection()
+        with self.connection: # One transaction for all of them.
+            self.connection.executemany(
+                'UPDATE cache SET accessed = ? WHERE propName = ?',
+                ((accessed, propName) for propName, accessed in accessTimes.items())
+            )
+
+
+    def clear(self):
+        if not xbmcvfs.exists(self.dirPath + self.DB_FILENAME):
+            return False
+        self._ensureConnection()
+        with self.connection:
+            totalCleared = self.connection.execute('DELETE FROM cache').rowcount
+        return totalCleared > 0
+
+
+    def _makeRows(self, entries):
+        accessed = int(time())
+        for propName, data, lifetime, epoch, codec in entries:
+            payload = codecs.encode(data, codec)
+            expires = (epoch + lifetime) if lifetime else None # NULL expires means it lasts forever.
+            # Stored as a BLOB, the payload is bytes with any codec.
+            yield (propName, self.version, lifetime, epoch, expires, len(payload), accessed, sqlite3.Binary(payload))
+
+
+    def _ensureConnection(self):
+        if not self.connection:
+            if not xbmcvfs.exists(self.dirPath):
+                xbmcvfs.mkdir(self.dirPath)
+            # A timeout so that concurrent add-on invocations wait on the database lock instead of failing.
+            self.connection = sqlite3.connect(self.dirPath + self.DB_FILENAME, timeout=10)
+            if self.connection.execute('PRAGMA user_version').fetchone()[0] != self.SCHEMA_VERSION:
+                self._createSchema()
+
+
+    def _createSchema(self):
+        # Full auto-vacuum gives the space of deleted rows back to the file system, so the database
+        # file shrinks along with the evictions. It only takes effect on an existing file after a VACUUM.
+        self.connection.execute('PRAGMA auto_vacuum = FULL')
+        with self.connection:
+            self.connection.execute('DROP TABLE IF EXISTS cache')
+            self.connection.execute(
+                'CREATE TABLE cache ('
+                'propName TEXT PRIMARY KEY, version INTEGER, lifetime INTEGER, epoch INTEGER, expires INTEGER, '
+                'size INTEGER, accessed INTEGER, data BLOB'
+                ')'
+            )
+            self.connection.execute('CREATE INDEX cache_expires ON cache (expires)')
+            self.connection.execute('CREATE INDEX cache_accessed ON cache (accessed)')
+            self.connection.execute('PRAGMA user_version = %i' % self.SCHEMA_VERSION)
+        self.connection.execute('VACUUM')
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+from time import time
+from threading import Lock
+
+from Lib.SimpleCache import simpleCache as cache
+
+
+# A per-host circuit breaker, so that a host that is down fails fast instead of making each view
+# wait on request timeouts.
+
+# After FAILURE_THRESHOLD failed requests in a row to a host the circuit "opens", and requests to that
+# host fail right away for OPEN_SECONDS. Each retry of a request counts (see RequestHelper.GET()), the
+# threshold is above the attempts of one request so a single unlucky request doesn't open it. After that one trial request is let through (the circuit is
+# "half-open"): if it succeeds the circuit closes, if it fails the circuit opens again.
+# Like with SimpleRateLimiter, the state of each host is kept in window properties so it's shared by
+# all add-on invocations in a Kodi session.
+
+class SimpleCircuitBreaker():
+
+    # Prefix of the property names that hold the state of each host, as a "failures,openUntil" string.
+    PROPERTY_CIRCUIT = 'circuit.host.'
+
+    FAILURE_THRESHOLD = 5 # Failed requests in a row that open the circuit.
+    OPEN_SECONDS = 60 # Time that an open circuit fails requests before letting a trial one through.
+
+
+    def __init__(self):
+        self.lock = Lock() # Worker threads share the circuits.
+
+
+    def allow(self, url):
+        '''
+        :returns: True if a request to the host of 'url' can be made, or False if its circuit is open.
+        When a circuit is done waiting it allows one trial request and stays open for the others.
+        '''
+        host = self._getHost(url)
+        with self.lock:
+            failures, openUntil = self._loadState(host)
+            if failures < self.FAILURE_THRESHOLD:
+                return True
+            currentTime = time()
+            if currentTime < openUntil:
+                return False
+            # Half-open, let this request through and keep failing the others until it's done.
+            self._storeState(host, failures, currentTime + self.OPEN_SECONDS)
+            return True
+
+
+    def recordSuccess(self, url):
+        host = self._getHost(url)
+        with self.lock:
+            if cache.getRawProperty(self.PROPERTY_CIRCUIT + host):
+                cache.setRawProperty(self.PROPERTY_CIRCUIT + host, '')
+
+
+    def recordFailure(self, url):
+        host = self._getHost(url)
+        with self.lock:
+            failures = self._loadState(host)[0] + 1
+            openUntil = time() + self.OPEN_SECONDS if failures >= self.FAILURE_THRESHOLD else 0.0
+            self._storeState(host, failures, openUntil)
+
+
+    def _loadState(self, host):
+        stateRaw = cache.getRawProperty(self.PROPERTY_CIRCUIT + host)
+        if stateRaw:
+            failures, openUntil = stateRaw.split(',')
+            return int(failures), float(openUntil)
+        return 0, 0.0
+
+
+    def _storeState(self, host, failures, openUntil):
+        cache.setRawProperty(self.PROPERTY_CIRCUIT + host, '%d,%f' % (failures, openUntil))
+
+
+    def _getHost(self, url):
+        # From 'http://host/path...' get the 'host'.
+        return url.split('/', 3)[2] if '://' in url else url
+
+
+circuitBreaker = SimpleCircuitBreaker()
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+from time import time
+from threading import Lock
+
+from xbmc import sleep
+import xbmcaddon
+
+from Lib.SimpleCache import simpleCache as cache
+
+
+# A per-host token bucket rate limiter, to spare the scraped sources from too many requests.
+
+# Each host has a bucket of tokens that refills at a steady rate, and each request takes one token.
+# Requests only wait when the bucket is empty, so a request to a host that was last requested some
+# seconds ago goes out right away, while a burst of requests gets spread out to the refill rate.
+# The buckets are kept in window properties, so they're shared by all add-on invocations in a
+# Kodi session. Property writes aren't atomic between invocations, so two invocations requesting
+# at the exact same moment might both get a token, but within an invocation the buckets are exact.
+
+class SimpleRateLimiter():
+
+    # Prefix of the property names that hold the bucket of each host, as a "tokens,timestamp" string.
+    PROPERTY_BUCKET = 'ratelimit.bucket.'
+
+    DEFAULT_BURST = 2 # Tokens in a full bucket, when the 'request_burst' add-on setting isn't set.
+
+
+    def __init__(self):
+        self.lock = Lock() # Worker threads share the buckets.
+        self.burst = None
+        self.hosts = set() # Hosts requested in this add-on invocation.
+
+
+    def acquire(self, url, interval, burst=None):
+        '''
+        Takes a token from the bucket of the host of 'url', waiting until there's one available.
+        :param interval: The refill time of one token in milliseconds, that is, the average time
+        between requests to that host once its burst is used.
+        :param burst: Optional size of the bucket for this request, instead of the 'request_burst' setting.
+        '''
+        host = self._getHost(url)
+        rate = 1000.0 / max(interval, 1) # Tokens per second.
+        with self.lock:
+            burst = burst or self._getBurst()
+            currentTime = time()
+            bucketRaw = cache.getRawProperty(self.PROPERTY_BUCKET + host)
+            if bucketRaw:
+                tokens, lastTime = (float(value) for value in bucketRaw.split(','))
+                tokens = min(burst, tokens + (currentTime - lastTime) * rate)
+            else:
+                tokens = burst
+            self.hosts.add(host)
+            # Tokens can go negative, reserving future tokens for the threads already waiting.
+            tokens -= 1.0
+            cache.setRawProperty(self.PROPERTY_BUCKET + host, '%f,%f' % (tokens, currentTime))
+        if tokens < 0.0:
+            sleep(int(-tokens / rate * 1000))
+
+
+    def reset(self):
+        '''
+        Refills the buckets of all the hosts requested in this add-on invocation, used when benchmarking.
+        '''
+        with self.lock:
+            for host in self.hosts:
+                cache.setRawProperty(self.PROPERTY_BUCKET + host, '')
+
+
+    def _getBurst(self):
+        if self.burst == None:
+            try:
+                self.burst = max(int(xbmcaddon.Addon().getSetting('request_burst')), 1)
+            except ValueError:
+                self.burst = self.DEFAULT_BURST
+        return self.burst
+
+
+    def _getHost(self, url):
+        # From 'http://host/path...' get the 'host'.
+        return url.split('/', 3)[2] if '://' in url else url
+
+
+rateLimiter = SimpleRateLimiter()
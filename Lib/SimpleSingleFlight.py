@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+from time import time
+from uuid import uuid4
+
+from xbmc import sleep
+
+from Lib.SimpleCache import simpleCache as cache
+
+
+# Request coalescing ("single-flight") between add-on invocations.
+
+# Kodi can run several add-on invocations at the same time (widgets, skin shortcuts, going back and
+# forth quickly), and with a cold cache each one would download the same routes. With this, the first
+# invocation to begin a flight for a key does the download, and the others wait for it to end and then
+# read the result from the cache. Flights are marked in window properties as a "token,startTime" string.
+# Window properties can't be changed atomically, so a flight is only taken after reading the marker back.
+# Two invocations that write their markers at the very same time can both lead, which only means the
+# same download is made twice, as it was before.
+
+class SimpleSingleFlight():
+
+    # Prefix of the property names that mark the flights in progress.
+    PROPERTY_FLIGHT = 'singleflight.'
+
+    # Seconds after which a flight is ignored, in case its add-on invocation was killed.
+    FLIGHT_TIMEOUT = 90
+    # Milliseconds between checks when waiting for a flight to end.
+    POLL_INTERVAL = 100
+
+
+    def __init__(self):
+        self.tokens = { } # Keys of the flights led by this invocation, mapped to their markers.
+
+
+    def begin(self, key):
+        '''
+        Begins the flight of 'key', or waits for the one that's in progress to end.
+        :returns: True if the caller leads the flight and has to call end() when done. False if it
+        waited for another flight, then the result should be in the cache (if that flight didn't fail).
+        '''
+        if self.tryBegin(key):
+            return True
+        self.wait(key)
+        return False
+
+
+    def tryBegin(self, key):
+        '''
+        Non-blocking version of begin().
+        :returns: True if the caller leads the flight of 'key', or False if another flight is in progress.
+        '''
+        propName = self.PROPERTY_FLIGHT + key
+        if self._isFlying(cache.getRawProperty(propName)):
+            return False
+        token = '%s,%f' % (uuid4().hex, time())
+        cache.setRawProperty(propName, token)
+        if cache.getRawProperty(propName) == token:
+            self.tokens[key] = token
+            return True
+        return False # Another invocation overwrote the marker right after it was written.
+
+
+    def wait(self, key):
+        '''
+        Waits until the flight of 'key' ends, if there's one in progress.
+        '''
+        propName = self.PROPERTY_FLIGHT + key
+        flightRaw = cache.getRawProperty(propName)
+        while self._isFlying(flightRaw):
+            sleep(self.POLL_INTERVAL)
+            newFlightRaw = cache.getRawProperty(propName)
+            if newFlightRaw != flightRaw:
+                return # Ended, or taken over after timing out.
+
+
+    def end(self, key):
+        '''
+        Ends a flight led by the caller, so the invocations waiting on it go read its result.
+        '''
+        propName = self.PROPERTY_FLIGHT + key
+        token = self.tokens.pop(key, None)
+        if token and cache.getRawProperty(propName) == token:
+            cache.setRawProperty(propName, '')
+
+
+    def _isFlying(self, flightRaw):
+        return bool(flightRaw) and time() - float(flightRaw.split(',')[1]) < self.FLIGHT_TIMEOUT
+
+
+singleFlight = SimpleSingleFlight()
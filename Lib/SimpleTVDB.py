@@ -1,11 +1,9 @@
 # -*- coding: utf-8 -*-
 import requests
 from base64 import b64decode
-from datetime import datetime
 
-import xbmc
-
-from Lib.SimpleCache import cache
+from Lib.SimpleCache import simpleCache as cache
+from Lib.SimpleRateLimiter import rateLimiter
 
 
 # Simple TVDB metadata fetcher. UNUSED yet.
@@ -62,8 +60,8 @@ class SimpleTVDB():
     def tvdbRequest(self, path, retry = False):
         self.ensureToken()
         
+        rateLimiter.acquire(self.API_BASEURL, self.API_REQUEST_DELAY)
         r = requests.get(self.API_BASEURL + path, headers = self.CUSTOM_HEADERS)
-        xbmc.sleep(self.API_REQUEST_DELAY)
         if not r.ok and not retry:
             self.ensureToken(refresh = True)
             r = self.tvdbRequest(path, retry = True) # Maybe the token expired, if 24 hours have passed.
@@ -96,14 +94,5 @@ class SimpleTVDB():
                 self.CUSTOM_HEADERS.pop('Authorization', None)
 
                 
-    def delayBegin(self):
-        self.delayStartTime = datetime.now()
-
-
-    def delayEnd(self, delayOverride = 200):
-        elapsed = int((datetime.now() - self.delayStartTime).total_seconds() * 1000)
-        if elapsed < delayOverride: # Only delay if we haven't waited the full delay time, obviously.
-            sleep(max(delayOverride - elapsed, 100))
-                
                 
 tvdb = SimpleTVDB()
@@ -4,6 +4,7 @@ import sys
 # Support Python 2.7 (Kodi 17.6) and Python 3+ (Kodi 18).
 if sys.version.startswith('3'):
     from urllib.parse import parse_qsl, urlencode, quote_plus
+    from html.parser import HTMLParser
     DICT_ITER_ITEMS = lambda d: iter(d.items())
     DICT_ITER_KEYS = lambda d: iter(d.keys())
     UNICODE = str
@@ -11,6 +12,7 @@ if sys.version.startswith('3'):
 else:
     from urlparse import parse_qsl
     from urllib import urlencode, quote_plus
+    from HTMLParser import HTMLParser
     DICT_ITER_ITEMS = lambda d: d.iteritems()
     DICT_ITER_KEYS = lambda d: d.iterkeys()
     UNICODE = unicode
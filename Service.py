@@ -0,0 +1,4 @@
+# -*- coding: utf-8 -*-
+from Lib.PlaybackService import run
+
+run() # See Lib/PlaybackService.py.
\ No newline at end of file
@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+import sys
+import types
+import shutil
+import tempfile
+import time
+import xml.etree.ElementTree as ElementTree
+from os import path as osPath, makedirs, listdir, remove, rename, stat
+
+
+# Minimal stand-ins for the Kodi modules, so the add-on modules can be imported and tested outside
+# of Kodi. Call install() before importing anything from Lib.
+#
+# Window properties are one dict shared by all the windows, the add-on settings start with the
+# defaults from resources/settings.xml, and the add-on profile is a temporary folder.
+
+ADDON_DIR = osPath.dirname(osPath.dirname(osPath.abspath(__file__)))
+
+windowProperties = { }
+settings = { }
+profileDir = None
+resolvedURLs = [ ] # (succeeded, path) of each xbmcplugin.setResolvedUrl() call.
+
+
+def install():
+    global profileDir
+    if 'xbmc' in sys.modules:
+        return
+    profileDir = tempfile.mkdtemp(prefix='toonmania2-tests-')
+    resetSettings()
+    for name, module in (
+        ('xbmc', _makeXBMC()),
+        ('xbmcgui', _makeXBMCGUI()),
+        ('xbmcaddon', _makeXBMCAddon()),
+        ('xbmcvfs', _makeXBMCVFS()),
+        ('xbmcplugin', _makeXBMCPlugin())
+    ):
+        sys.modules[name] = module
+
+
+def resetSettings():
+    settings.clear()
+    for element in ElementTree.parse(osPath.join(ADDON_DIR, 'resources', 'settings.xml')).iter('setting'):
+        if element.get('id'):
+            settings[element.get('id')] = element.get('default', '')
+
+
+def resetState():
+    '''
+    Clears the window properties and the cache folder, for a test to start from a clean Kodi session.
+    '''
+    windowProperties.clear()
+    del resolvedURLs[:]
+    resetSettings()
+    if profileDir:
+        shutil.rmtree(profileDir, ignore_errors=True)
+        makedirs(profileDir)
+
+
+def _makeXBMC():
+    xbmc = types.ModuleType('xbmc')
+    xbmc.LOGDEBUG, xbmc.LOGINFO, xbmc.LOGNOTICE, xbmc.LOGWARNING, xbmc.LOGERROR = range(5)
+    xbmc.log = lambda message, level=0: None
+    xbmc.sleep = lambda milliseconds: time.sleep(milliseconds / 1000.0)
+
+    class _PathString(str):
+        def decode(self, encoding):
+            return str(self) # Kodi on Python 2 returns byte strings.
+    xbmc.translatePath = lambda path: _PathString(profileDir + '/')
+
+    class Monitor(object):
+        def waitForAbort(self, timeout=0):
+            time.sleep(timeout)
+            return False
+        def abortRequested(self):
+            return False
+    xbmc.Monitor = Monitor
+
+    class Player(object):
+        def isPlayingVideo(self):
+            return False
+        def getTime(self):
+            raise RuntimeError('Kodi is not playing any media file')
+        def getPlayingFile(self):
+            raise RuntimeError('Kodi is not playing any media file')
+    xbmc.Player = Player
+    return xbmc
+
+
+def _makeXBMCGUI():
+    xbmcgui = types.ModuleType('xbmcgui')
+    xbmcgui.NOTIFICATION_INFO = 'info'
+    xbmcgui.getCurrentWindowId = lambda: 10000
+
+    class Window(object):
+        def __init__(self, windowId=0):
+            pass
+        def getProperty(self, key):
+            return windowProperties.get(key, '')
+        def setProperty(self, key, value):
+            windowProperties[key] = value
+        def clearProperty(self, key):
+            windowProperties.pop(key, None)
+    xbmcgui.Window = Window
+
+    class Dialog(object):
+        def notification(self, *args, **kwargs):
+            pass
+    xbmcgui.Dialog = Dialog
+
+    class ListItem(object):
+        def __init__(self, label='', *args, **kwargs):
+            self.label = label
+            self.path = ''
+        def setPath(self, path):
+            self.path = path
+        def __getattr__(self, name):
+            return lambda *args, **kwargs: None # setInfo(), setArt() etc.
+    xbmcgui.ListItem = ListItem
+    return xbmcgui
+
+
+def _makeXBMCAddon():
+    xbmcaddon = types.ModuleType('xbmcaddon')
+
+    class Addon(object):
+        def getAddonInfo(self, key):
+            return {'id': 'plugin.video.toonmania2', 'profile': profileDir, 'path': ADDON_DIR}.get(key, '')
+        def getSetting(self, key):
+            return settings.get(key, '')
+        def setSetting(self, key, value):
+            settings[key] = value
+    xbmcaddon.Addon = Addon
+    return xbmcaddon
+
+
+def _makeXBMCPlugin():
+    xbmcplugin = types.ModuleType('xbmcplugin')
+    xbmcplugin.setResolvedUrl = lambda handle, succeeded, item: resolvedURLs.append((succeeded, item.path))
+    return xbmcplugin
+
+
+def _makeXBMCVFS():
+    xbmcvfs = types.ModuleType('xbmcvfs')
+    xbmcvfs.exists = osPath.exists
+    xbmcvfs.mkdir = lambda path: makedirs(path) or True
+    xbmcvfs.delete = lambda path: remove(path) or True
+    xbmcvfs.rename = lambda source, target: rename(source, target) or True
+
+    def _listdir(path):
+        names = listdir(path)
+        dirs = [name for name in names if osPath.isdir(osPath.join(path, name))]
+        return dirs, [name for name in names if name not in dirs]
+    xbmcvfs.listdir = _listdir
+
+    class File(object):
+        def __init__(self, path, mode='r'):
+            self.file = open(path, mode + 'b')
+        def read(self):
+            return self.file.read()
+        def readBytes(self):
+            return self.file.read()
+        def write(self, data):
+            self.file.write(data if isinstance(data, (bytes, bytearray)) else data.encode('utf-8'))
+            return True
+        def size(self):
+            return stat(self.file.name).st_size
+        def close(self):
+            self.file.close()
+    xbmcvfs.File = File
+
+    class Stat(object):
+        def __init__(self, path):
+            self.result = stat(path)
+        def st_size(self):
+            return self.result.st_size
+        def st_mtime(self):
+            return int(self.result.st_mtime)
+    xbmcvfs.Stat = Stat
+    return xbmcvfs
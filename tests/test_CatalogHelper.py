@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+from tests import KodiFakes
+KodiFakes.install()
+
+from Lib.SimpleCache import simpleCache as cache
+
+try:
+    import requests
+    from Lib.CatalogHelper import catalogHelper
+    from Lib.RequestHelper import RequestHelper, requestHelper
+except ImportError:
+    requests = None
+
+
+def _routeEntry(entryID, name):
+    return {'id': entryID, 'name': name, 'description': '', 'genres': ['Comedy'], 'released': None}
+
+
+class _RouteHelper(object):
+    # Answers routeGET() from a dict of routes, None for the others.
+    def __init__(self, routes):
+        self.routes = routes
+        self.requested = [ ]
+    def routeGET(self, route, *args, **kwargs):
+        self.requested.append(route)
+        return self.routes.get(route)
+
+
+@unittest.skipIf(requests == None, 'The requests module is needed for the catalog tests.')
+class PatchRoutesTest(unittest.TestCase):
+
+    ROUTE = '/GetAllCartoon'
+
+    def setUp(self):
+        KodiFakes.resetState()
+        self.api = requestHelper.API_ANIMETOON
+        self.propName = catalogHelper._diskFriendlyPropName(self.api, self.ROUTE)
+        self.expiredData = {self.ROUTE: [_routeEntry('1', 'Alpha'), _routeEntry('2', 'Bravo')]}
+
+
+    def _patch(self, routes):
+        helper = _RouteHelper(routes)
+        return catalogHelper._patchRoutes(helper, self.api, self.expiredData), helper
+
+
+    def test_newEntriesAreAdded(self):
+        fullRoutes, helper = self._patch({
+            '/GetUpdates/': {'updates': [{'id': '1'}, {'id': '3'}]},
+            '/GetNewCartoon': [_routeEntry('3', 'Charlie'), {'id': '4'}, _routeEntry('1', 'Alpha')],
+            '/GetDetails/4': _routeEntry('4', 'Delta')
+        })
+        self.assertEqual(fullRoutes, [ ])
+        self.assertEqual(
+            sorted(entry['id'] for entry in cache.peekCacheProperty(self.propName)), ['1', '2', '3', '4']
+        )
+        self.assertEqual(cache.peekCacheProperty(self.propName + catalogHelper.PATCHES_SUFFIX), 1)
+
+
+    def test_unplacedIDsDownloadAgain(self):
+        # ID 9 is in the updates but not new in the expired route, it's not known where it goes.
+        fullRoutes, helper = self._patch({
+            '/GetUpdates/': {'updates': [{'id': '9'}]},
+            '/GetNewCartoon': [_routeEntry('3', 'Charlie')]
+        })
+        self.assertEqual(fullRoutes, [self.ROUTE])
+        self.assertEqual(cache.peekCacheProperty(self.propName), None)
+
+
+    def test_incompleteEntryDownloadsAgain(self):
+        fullRoutes, helper = self._patch({
+            '/GetUpdates/': {'updates': [ ]},
+            '/GetNewCartoon': [_routeEntry('3', 'Charlie'), {'id': '4'}]
+        })
+        self.assertEqual(fullRoutes, [self.ROUTE])
+        self.assertTrue('/GetDetails/4' in helper.requested)
+        self.assertEqual(cache.peekCacheProperty(self.propName), None)
+
+
+    def test_tooManyPatchesInARow(self):
+        cache.saveCachePropertyNow(
+            self.propName + catalogHelper.PATCHES_SUFFIX, catalogHelper.PATCH_MAX_CONSECUTIVE, cache.LIFETIME_FOREVER
+        )
+        fullRoutes, helper = self._patch({'/GetUpdates/': {'updates': [ ]}, '/GetNewCartoon': [ ]})
+        self.assertEqual(fullRoutes, [self.ROUTE])
+        self.assertEqual(helper.requested, [ ])
+
+
+@unittest.skipIf(requests == None, 'The requests module is needed for the catalog tests.')
+class RevalidateRoutesTest(unittest.TestCase):
+
+    ROUTE = '/GetAllCartoon'
+    VALIDATORS = {'etag': '"abc"', 'lastModified': None}
+
+    def setUp(self):
+        KodiFakes.resetState()
+        KodiFakes.settings['cache_stale_hours'] = '0'
+        KodiFakes.settings['cache_background_save'] = 'false'
+        self.api = requestHelper.API_ANIMETOON
+        self.propName = catalogHelper._diskFriendlyPropName(self.api, self.ROUTE)
+        self.requests = [ ] # Validators of each route request.
+        # Patched in the class, the catalogs that need all the main routes request them with worker helpers.
+        self.routeGETEntries = RequestHelper.routeGETEntries
+        testCase = self
+        def _routeGETEntries(helper, route, interval=None, validators=None):
+            return testCase._routeGETEntries(helper, route, validators)
+        RequestHelper.routeGETEntries = _routeGETEntries
+
+
+    def tearDown(self):
+        RequestHelper.routeGETEntries = self.routeGETEntries
+        requestHelper.lastNotModified = False
+        requestHelper.lastValidators = None
+        if '_getEpochHours' in vars(cache):
+            del cache._getEpochHours
+
+
+    def _routeGETEntries(self, helper, route, validators):
+        # The API answers "304 Not Modified" to a request with the current validators.
+        self.requests.append(validators)
+        helper.lastNotModified = validators == self.VALIDATORS
+        helper.lastValidators = self.VALIDATORS
+        return None if helper.lastNotModified else iter([_routeEntry('1', 'Alpha'), _routeEntry('3', 'Charlie')])
+
+
+    def _cacheExpiredRoute(self, validators):
+        cache.saveCachePropertyNow(self.propName, [_routeEntry('1', 'Alpha')], cache.LIFETIME_THREE_DAYS)
+        cache.saveCachePropertyNow(self.propName + catalogHelper.VALIDATORS_SUFFIX, validators, cache.LIFETIME_FOREVER)
+        # A later Kodi session, after the route expired and past any stale use.
+        currentEpoch = cache._getEpochHours() + cache.LIFETIME_THREE_DAYS + 24
+        cache._getEpochHours = lambda: currentEpoch
+        KodiFakes.windowProperties.clear()
+
+
+    def _catalogIDs(self):
+        catalog = catalogHelper.allRouteCatalog({'api': self.api, 'route': self.ROUTE})
+        return sorted(item[0] for section in catalog.values() for item in section)
+
+
+    def test_notModifiedRouteIsRenewed(self):
+        self._cacheExpiredRoute(self.VALIDATORS)
+        self.assertEqual(self._catalogIDs(), ['1'])
+        self.assertEqual(self.requests, [self.VALIDATORS])
+
+        # Renewed, it's used without requesting it again.
+        KodiFakes.windowProperties.clear()
+        self.assertEqual(self._catalogIDs(), ['1'])
+        self.assertEqual(len(self.requests), 1)
+
+
+    def test_modifiedRouteIsDownloaded(self):
+        self._cacheExpiredRoute({'etag': '"old"', 'lastModified': None})
+        self.assertEqual(self._catalogIDs(), ['1', '3'])
+        self.assertEqual(self.requests, [{'etag': '"old"', 'lastModified': None}])
+        self.assertEqual(cache.peekCacheProperty(self.propName + catalogHelper.VALIDATORS_SUFFIX), self.VALIDATORS)
+
+
+    def test_fetchedRouteIsRenewed(self):
+        # The blocking requests of the catalogs that need all the main routes.
+        self._cacheExpiredRoute(self.VALIDATORS)
+        routesData = catalogHelper._getMainRoutesData(self.api, self.ROUTE)
+        self.assertEqual([entry[0] for entry in routesData[0]], ['1'])
+        self.assertEqual(self.requests, [self.VALIDATORS])
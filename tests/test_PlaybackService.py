@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+import json
+import unittest
+
+from tests import KodiFakes
+KodiFakes.install()
+
+from Lib.PlaybackService import PlaybackWatcher, playbackWatch
+
+
+class PlaybackWatchTest(unittest.TestCase):
+
+    STREAM = 'http://gateway.play44.net/videos/1.mp4'
+
+    def setUp(self):
+        KodiFakes.resetState()
+        self.watcher = PlaybackWatcher()
+
+
+    def test_failedStart(self):
+        playbackWatch.begin(self.STREAM, None, 'PLAY44.NET')
+        self.watcher.onPlayBackError()
+        self.assertEqual(playbackWatch.takeFailed(), [([self.STREAM], 'PLAY44.NET')])
+        self.assertEqual(playbackWatch.takeFailed(), [ ])
+
+
+    def test_stoppedBeforeStart(self):
+        partStreams = [self.STREAM, 'http://gateway.play44.net/videos/2.mp4']
+        playbackWatch.begin('stack://' + ' , '.join(partStreams), partStreams, None)
+        self.watcher.onPlayBackStopped()
+        self.assertEqual(playbackWatch.takeFailed(), [(partStreams, None)])
+
+
+    def test_started(self):
+        playbackWatch.begin(self.STREAM, None, 'PLAY44.NET')
+        self.watcher.onAVStarted()
+        self.watcher.onPlayBackStopped()
+        self.watcher.onPlayBackError() # Another video, not watched.
+        self.assertEqual(playbackWatch.takeFailed(), [ ])
+
+
+    def test_previousVideoStops(self):
+        self.watcher.onAVStarted()
+        playbackWatch.begin(self.STREAM, None, 'PLAY44.NET')
+        # Kodi stops the video that was playing before it opens the new one.
+        self.watcher.onPlayBackStopped()
+        self.assertEqual(playbackWatch.takeFailed(), [ ])
+        self.watcher.onPlayBackError()
+        self.assertEqual(playbackWatch.takeFailed(), [([self.STREAM], 'PLAY44.NET')])
+
+
+    def test_oldWatchIsNotBlamed(self):
+        playbackWatch.begin(self.STREAM, None, 'PLAY44.NET')
+        watch = json.loads(KodiFakes.windowProperties[playbackWatch.PROPERTY_WATCH])
+        watch['time'] -= playbackWatch.START_TIMEOUT + 1
+        KodiFakes.windowProperties[playbackWatch.PROPERTY_WATCH] = json.dumps(watch)
+        self.watcher.onPlayBackError()
+        self.assertEqual(playbackWatch.takeFailed(), [ ])
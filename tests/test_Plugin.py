@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+import sys
+import unittest
+from time import time
+
+from tests import KodiFakes
+KodiFakes.install()
+
+try:
+    import requests
+    from Lib.Plugin import viewResolve
+    from Lib.ProviderHealth import providerHealth
+    from Lib.PlaybackService import PlaybackWatcher
+    from Lib.RequestHelper import requestHelper
+except ImportError:
+    requests = None
+
+
+class _FailedResponse(object):
+    ok = False
+    status_code = 404
+    text = ''
+
+
+class _ProviderPageResponse(object):
+    ok = True
+    status_code = 200
+    text = '<script>var video_links = {"normal": [{"link": "http:\\/\\/gateway.play44.net\\/1.mp4"}]};</script>'
+
+
+@unittest.skipIf(requests == None, 'The requests module is needed for the plugin tests.')
+class ViewResolveTest(unittest.TestCase):
+
+    PARAMS = {
+        'view': 'RESOLVE', 'api': 'animetoon', 'episodeID': '1', 'showTitle': 'Show', 'name': 'Episode 1',
+        'season': '1', 'episode': '1', 'plot': '', 'providerURL': 'http://www.play44.net/embed.php?vid=1'
+    }
+
+    def setUp(self):
+        KodiFakes.resetState()
+        KodiFakes.settings['cache_background_save'] = 'false'
+        providerHealth.reload()
+        self.argv = sys.argv
+        sys.argv = ['plugin://plugin.video.toonmania2/', '1', '?view=RESOLVE']
+        self.responses = [ ]
+        requestHelper.GET = lambda *args, **kwargs: self.responses.pop(0) if self.responses else _FailedResponse()
+
+
+    def tearDown(self):
+        sys.argv = self.argv
+        del requestHelper.GET
+
+
+    def test_failedResolveIsSaved(self):
+        viewResolve(dict(self.PARAMS))
+        self.assertEqual(KodiFakes.resolvedURLs, [(False, '')])
+
+        # A new Kodi session: nothing in window memory, the health comes from the cache on disk.
+        KodiFakes.windowProperties.clear()
+        providerHealth.reload()
+        summary = providerHealth.getSummary('PLAY44.NET')
+        self.assertNotEqual(summary, None)
+        self.assertLess(summary[0], providerHealth.NEUTRAL_SUCCESS)
+
+
+    def test_failedStartIsResolvedAgain(self):
+        stream = 'http://gateway.play44.net/1.mp4'
+        self.responses = [_ProviderPageResponse()]
+        startTime = time()
+        viewResolve(dict(self.PARAMS))
+        # It doesn't wait for the playback to start.
+        self.assertLess(time() - startTime, 1.0)
+        # The stream is reused.
+        viewResolve(dict(self.PARAMS))
+        self.assertEqual(KodiFakes.resolvedURLs, [(True, stream), (True, stream)])
+
+        # The service saw it fail, the next resolve requests the provider page again.
+        PlaybackWatcher().onPlayBackError()
+        self.responses = [_ProviderPageResponse()]
+        viewResolve(dict(self.PARAMS))
+        self.assertEqual(self.responses, [ ])
+        self.assertEqual(KodiFakes.resolvedURLs[-1], (True, stream))
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+from Lib.ProviderRegistry import ProviderRegistry, providerRegistry
+
+
+class ProviderRegistryTest(unittest.TestCase):
+
+    def test_classify(self):
+        self.assertEqual(providerRegistry.classify('http://www.play44.net/embed.php?w=718&vid=1.mp4'), 'PLAY44.NET')
+        self.assertEqual(providerRegistry.classify('https://videozoo.me/embed.php?vid=2'), 'VIDEOZOO.ME')
+        self.assertEqual(providerRegistry.classify('http://www.vidzur.com/embed-3.html'), None)
+        self.assertEqual(providerRegistry.classify('not a url'), None)
+
+
+    def test_dottedVariants(self):
+        registry = ProviderRegistry()
+        registry.register('PLAY44.NET', ('play44.net',))
+        self.assertEqual(registry.classify('http://play44.net/embed.php?vid=1'), 'PLAY44.NET')
+        self.assertEqual(registry.classify('http://gateway.play44.net'), 'PLAY44.NET')
+        self.assertEqual(registry.classify('play44.net/embed.php'), 'PLAY44.NET')
+        self.assertEqual(registry.classify('http://www.play44.network/embed.php'), None)
+        self.assertEqual(registry.classify('http://www.play44.com/net.php'), None)
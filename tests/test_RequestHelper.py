@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+import unittest
+from time import sleep, time
+from email.utils import formatdate
+from threading import Lock
+
+from tests import KodiFakes
+KodiFakes.install()
+
+import xbmc
+
+try:
+    import requests
+    from Lib.RequestHelper import RequestHelper, firstConcurrently, iterJSONArray
+    from Lib.SimpleCircuitBreaker import circuitBreaker
+except ImportError:
+    requests = None
+
+
+class _Response(object):
+    def __init__(self, statusCode, headers=None):
+        self.status_code = statusCode
+        self.ok = statusCode < 400
+        self.headers = headers or { }
+    def close(self):
+        pass
+
+
+@unittest.skipIf(requests == None, 'The requests module is needed for the RequestHelper tests.')
+class FirstConcurrentlyTest(unittest.TestCase):
+
+    def setUp(self):
+        KodiFakes.resetState()
+        self.calls = [ ] # (helper, item) of each call, in order.
+        self.callsLock = Lock()
+
+
+    def _resolve(self, helper, item):
+        # Items are (name, seconds to take, result), like providers that resolve or fail after a while.
+        with self.callsLock:
+            self.calls.append((helper, item))
+        sleep(item[1])
+        return item[2]
+
+
+    def test_fastestResultWins(self):
+        items = [('dead', 1.0, None), ('slow', 0.6, 'slow stream'), ('fast', 0.2, 'fast stream'), ('dead 2', 1.0, None)]
+        startTime = time()
+        firstResult = firstConcurrently(self._resolve, items, 4)
+        elapsed = time() - startTime
+        self.assertEqual(firstResult, (items[2], 'fast stream'))
+        # The dead providers don't hold up the result.
+        self.assertLess(elapsed, 0.5)
+
+
+    def test_otherHelpersAreCancelled(self):
+        items = [('fast', 0.1, 'stream'), ('slow', 0.4, None)] + [('unused %i' % index, 0.0, 'stream') for index in range(4)]
+        firstResult = firstConcurrently(self._resolve, items, 2)
+        self.assertEqual(firstResult, (items[0], 'stream'))
+        sleep(0.5) # Let the slow call end.
+
+        # The worker of the slow call stopped after it, the items left weren't used.
+        self.assertEqual([item for helper, item in self.calls], items[:2])
+        slowHelper = self.calls[1][0]
+        self.assertTrue(slowHelper.isCancelled)
+
+        # A cancelled helper doesn't make requests anymore.
+        def _failingGet(*args, **kwargs):
+            raise AssertionError('A cancelled helper made a request.')
+        slowHelper.session.get = _failingGet
+        self.assertFalse(slowHelper.GET('http://www.animetoon.org/').ok)
+
+
+    def test_oneAtATime(self):
+        items = [('dead', 0.1, None), ('dead 2', 0.1, None), ('working', 0.1, 'stream'), ('unused', 0.1, 'stream')]
+        self.assertEqual(firstConcurrently(self._resolve, items, 1), (items[2], 'stream'))
+        self.assertEqual(len(self.calls), 3)
+
+
+    def test_allFail(self):
+        items = [('dead', 0.1, None), ('dead 2', 0.0, None), ('dead 3', 0.2, None)]
+        self.assertEqual(firstConcurrently(self._resolve, items, 2), None)
+        self.assertEqual(len(self.calls), 3)
+
+
+@unittest.skipIf(requests == None, 'The requests module is needed for the RequestHelper tests.')
+class IterJSONArrayTest(unittest.TestCase):
+
+    def _chunks(self, text, size):
+        data = text.encode('utf-8')
+        return [data[index : index+size] for index in range(0, len(data), size)]
+
+
+    def test_everyChunkSize(self):
+        text = u'[1, 23,456 , -7.5e3, "a,]b", {"id": "10", "name": "Caf\xe9"}, [1, [2]], true, null, 0.25 ]'
+        expected = [1, 23, 456, -7500.0, 'a,]b', {'id': '10', 'name': u'Caf\xe9'}, [1, [2]], True, None, 0.25]
+        for size in range(1, len(text) + 2):
+            self.assertEqual(list(iterJSONArray(self._chunks(text, size))), expected, 'Chunk size %i' % size)
+
+
+    def test_numbersSplitByChunks(self):
+        self.assertEqual(list(iterJSONArray(self._chunks('[1,23,456]', 1))), [1, 23, 456])
+        self.assertEqual(list(iterJSONArray([b'[12', b'.', b'5', b']'])), [12.5])
+
+
+    def test_invalidArrays(self):
+        for chunks in ([b'{"a": 1}'], [b'[1, 2'], [b'[1 2]'], [b'[1,', b'23']):
+            with self.assertRaises(ValueError):
+                list(iterJSONArray(chunks))
+
+
+@unittest.skipIf(requests == None, 'The requests module is needed for the RequestHelper tests.')
+class RetryTest(unittest.TestCase):
+
+    URL = 'http://api.animetoon.tv/GetAllCartoon'
+
+    def setUp(self):
+        KodiFakes.resetState()
+        self.helper = RequestHelper()
+        self.outcomes = [ ] # Responses or exceptions of the next attempts, in order.
+        self.attempts = 0
+        self.helper.session.get = self._get
+        self.delays = [ ] # Seconds of the waits between attempts.
+        self.sleep = xbmc.sleep
+        xbmc.sleep = lambda milliseconds: self.delays.append(milliseconds / 1000.0)
+
+
+    def tearDown(self):
+        xbmc.sleep = self.sleep
+
+
+    def _get(self, url, **kwargs):
+        self.attempts += 1
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+    def _GET(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.attempts = 0
+        del self.delays[:]
+        return self.helper.GET(self.URL, interval=1)
+
+
+    def _openCircuitNow(self):
+        # Makes the open circuit of the host done waiting, like OPEN_SECONDS later.
+        propName = circuitBreaker.PROPERTY_CIRCUIT + 'api.animetoon.tv'
+        failures = KodiFakes.windowProperties[propName].split(',')[0]
+        KodiFakes.windowProperties[propName] = failures + ',0.0'
+
+
+    def test_retryThenSuccess(self):
+        r = self._GET(_Response(503), requests.ConnectionError(), _Response(200))
+        self.assertEqual((r.status_code, self.attempts), (200, 3))
+        # Random waits up to the exponential backoff of each attempt.
+        self.assertEqual(len(self.delays), 2)
+        for attempt, delay in enumerate(self.delays, 1):
+            self.assertTrue(0.0 <= delay <= RequestHelper.RETRY_BASE_DELAY * 2 ** attempt, delay)
+
+
+    def test_attemptsRunOut(self):
+        r = self._GET(_Response(502), _Response(502), _Response(502))
+        self.assertEqual((r.status_code, self.attempts, len(self.delays)), (502, 3, 2))
+        circuitBreaker.recordSuccess(self.URL) # Some other request to the host worked in between.
+        r = self._GET(requests.Timeout(), requests.Timeout(), requests.Timeout())
+        self.assertFalse(r.ok)
+        self.assertEqual(self.attempts, 3)
+
+
+    def test_clientErrorIsNotRetried(self):
+        r = self._GET(_Response(404))
+        self.assertEqual((r.status_code, self.attempts), (404, 1))
+
+
+    def test_retryAfter(self):
+        r = self._GET(_Response(429, {'Retry-After': '2'}), _Response(200))
+        self.assertEqual((r.status_code, self.delays), (200, [2.0]))
+        # Waits that are too long aren't retried.
+        r = self._GET(_Response(503, {'Retry-After': '120'}))
+        self.assertEqual((r.status_code, self.attempts), (503, 1))
+        # The date form.
+        retryDate = formatdate(time() + 3, usegmt=True)
+        self.assertTrue(1.0 <= self.helper._retryDelay(1, retryDate) <= 3.0)
+        self.assertEqual(self.helper._retryDelay(1, formatdate(time() - 60, usegmt=True)), 0.0)
+
+
+    def test_circuitOpensDuringRetries(self):
+        # Each failed attempt counts, a request that fails all its attempts doesn't open the circuit alone.
+        self._GET(*[requests.ConnectionError()] * 3)
+        self.assertEqual(self.attempts, 3)
+        self.assertTrue(circuitBreaker.allow(self.URL))
+
+        # The next request opens it and stops retrying then.
+        r = self._GET(*[requests.ConnectionError()] * 3)
+        self.assertFalse(r.ok)
+        self.assertEqual(self.attempts, circuitBreaker.FAILURE_THRESHOLD - 3)
+
+        # Open: the host isn't requested.
+        r = self._GET(_Response(200))
+        self.assertFalse(r.ok)
+        self.assertEqual(self.attempts, 0)
+
+
+    def test_halfOpenTrial(self):
+        self._GET(*[requests.ConnectionError()] * 3)
+        self._GET(*[requests.ConnectionError()] * 3)
+
+        # Half-open: one trial attempt, not retried when it fails, and the circuit opens again.
+        self._openCircuitNow()
+        r = self._GET(_Response(503), _Response(200))
+        self.assertEqual((r.status_code, self.attempts), (503, 1))
+        self.assertEqual(self._GET(_Response(200)).ok, False)
+
+        # A trial that succeeds closes the circuit.
+        self._openCircuitNow()
+        self.assertEqual(self._GET(_Response(200)).status_code, 200)
+        self.assertEqual(self._GET(_Response(503), _Response(200)).status_code, 200)
+        self.assertEqual(self.attempts, 2)
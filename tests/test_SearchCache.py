@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+import unittest
+from time import time
+
+from tests import KodiFakes
+KodiFakes.install()
+
+from Lib.SimpleCache import simpleCache as cache
+from Lib.SearchCache import searchCache
+
+
+RESULTS = (('100', 'Dragon Tales', 'A show.'), ('200', 'Dragon Ball', 'Another show.'))
+
+
+class SearchCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        KodiFakes.resetState()
+        self.writes = 0
+        self.setCacheProperty = cache.setCacheProperty
+        def _countingSetCacheProperty(*args, **kwargs):
+            self.writes += 1
+            return self.setCacheProperty(*args, **kwargs)
+        cache.setCacheProperty = _countingSetCacheProperty
+
+
+    def tearDown(self):
+        del cache.setCacheProperty
+
+
+    def _ageSearch(self, api, text, seconds):
+        searches = cache.getCacheProperty(searchCache.PROPERTY_SEARCHES, readFromDisk=True)
+        entry = searches[searchCache._makeKey(api, text)]
+        entry[0] -= seconds
+        entry[1] -= seconds
+        self.setCacheProperty(searchCache.PROPERTY_SEARCHES, searches, saveToDisk=True)
+
+
+    def test_hitsDontWrite(self):
+        searchCache.setResults('animetoon', 'Dragon', RESULTS)
+        self.assertEqual(self.writes, 1)
+        for index in range(3):
+            self.assertEqual(searchCache.getResults('animetoon', ' dragon '), RESULTS)
+        self.assertEqual(self.writes, 1)
+
+
+    def test_oldUseIsUpdated(self):
+        searchCache.setResults('animetoon', 'dragon', RESULTS)
+        self._ageSearch('animetoon', 'dragon', searchCache.TOUCH_INTERVAL + 1)
+        self.assertEqual(searchCache.getResults('animetoon', 'dragon'), RESULTS)
+        self.assertEqual(self.writes, 2)
+        lastUsed = cache.getCacheProperty(searchCache.PROPERTY_SEARCHES, readFromDisk=True)['animetoon:dragon'][0]
+        self.assertAlmostEqual(lastUsed, time(), delta=5)
+
+
+    def test_expiredSearchIsDropped(self):
+        searchCache.setResults('animetoon', 'dragon', RESULTS)
+        self._ageSearch('animetoon', 'dragon', 25 * 3600)
+        self.assertEqual(searchCache.getResults('animetoon', 'dragon'), None)
+        self.assertEqual(cache.getCacheProperty(searchCache.PROPERTY_SEARCHES, readFromDisk=True), { })
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+import unittest
+from time import time
+from os import listdir, path as osPath
+
+from Lib.SearchParser import parseSearchPage
+
+try:
+    from bs4 import BeautifulSoup
+except ImportError:
+    BeautifulSoup = None
+
+
+# Parity of Lib/SearchParser.py with the BeautifulSoup extraction it replaced, over the saved
+# search result pages in tests/fixtures/search. Run from the add-on folder:
+# python -m unittest discover tests
+# Or time both extractors on the same pages:
+# python -m tests.test_SearchParser
+
+FIXTURES_DIR = osPath.join(osPath.dirname(osPath.abspath(__file__)), 'fixtures', 'search')
+
+
+def extractWithBeautifulSoup(html):
+    '''
+    The search page extraction of the original RequestHelper.nameSearchEntries(), before Lib/SearchParser.py.
+    :returns: A tuple (results, pageURLs) like parseSearchPage(). The page URLs are all the pagination
+    button links in order, repeated ones included, as the original requested every one of them.
+    '''
+    soup = BeautifulSoup(html, 'html.parser')
+    results = [ ]
+    mainUL = soup.find('div', class_='series_list').ul
+    for li in mainUL.find_all('li'):
+        img = li.find('img')
+        if img:
+            src = img['src']
+            thumbID = src[src.rfind('/')+1 : -4]
+            title = li.h3.text.strip()
+            descrDIV = li.find('div', class_='descr')
+            description = descrDIV.text.replace(' [More]', '').strip() if descrDIV else ''
+            results.append((thumbID, title, description))
+
+    pageURLs = [ ]
+    paginationDIV = soup.find('ul', {'class': 'pagination'})
+    if paginationDIV:
+        for button in paginationDIV.find_all('button'):
+            nextURL = button.get('href', None)
+            if nextURL:
+                pageURLs.append(nextURL)
+    return results, pageURLs
+
+
+def uniqueURLs(pageURLs):
+    # Intended change since the concurrent page downloads: a page linked by several buttons (like
+    # its number and 'Next') is only requested once, in the order of its first button.
+    uniqueURLs = [ ]
+    for pageURL in pageURLs:
+        if pageURL not in uniqueURLs:
+            uniqueURLs.append(pageURL)
+    return uniqueURLs
+
+
+def loadPage(fileName):
+    with open(osPath.join(FIXTURES_DIR, fileName), 'rb') as pageFile:
+        return pageFile.read().decode('utf-8')
+
+
+@unittest.skipIf(BeautifulSoup == None, 'BeautifulSoup is needed for the parity tests.')
+class SearchParserParityTest(unittest.TestCase):
+
+    def assertParity(self, fileName):
+        html = loadPage(fileName)
+        results, pageURLs = parseSearchPage(html)
+        soupResults, soupPageURLs = extractWithBeautifulSoup(html)
+        self.assertEqual(results, soupResults, fileName)
+        self.assertEqual(pageURLs, uniqueURLs(soupPageURLs), fileName)
+        return results, pageURLs
+
+
+    def test_savedPages(self):
+        for fileName in sorted(listdir(FIXTURES_DIR)):
+            self.assertParity(fileName)
+
+
+    def test_firstPage(self):
+        results, pageURLs = self.assertParity('results_page1.html')
+        self.assertEqual(len(results), 20)
+        # Entities in the titles, descriptions and pagination links are converted.
+        self.assertEqual(results[0][1], u'Dragon & Tiger – Part 0 \xe9')
+        self.assertEqual(results[0][2], u'Story of heroes "0" <TV>')
+        self.assertEqual(
+            pageURLs,
+            [
+                'http://www.animetoon.org/toon/search?key=dragon&page=2',
+                'http://www.animetoon.org/toon/search?key=dragon&page=3'
+            ]
+        )
+
+
+    def test_repeatedPageLinks(self):
+        # The 'Next' button links to page 2 again, the original requested it twice.
+        html = loadPage('results_page1.html')
+        self.assertEqual(len(extractWithBeautifulSoup(html)[1]), 3)
+        self.assertEqual(len(parseSearchPage(html)[1]), 2)
+
+
+    def test_unclosedItems(self):
+        results, pageURLs = self.assertParity('results_unclosed_li.html')
+        self.assertEqual(len(results), 12)
+        self.assertEqual(len(set(result[0] for result in results)), 12)
+
+
+    def test_noResults(self):
+        self.assertEqual(self.assertParity('results_empty.html'), ([ ], [ ]))
+
+
+class SearchParserTest(unittest.TestCase):
+
+    def test_unclosedItemWithoutDescription(self):
+        # Known difference: BeautifulSoup nests unclosed <li> tags, so an item without a description
+        # took the description of the next item. Here each item ends at the next <li>.
+        html = (
+            '<div class="series_list"><ul>'
+            '<li><img src="/small/1.jpg"><h3>One</h3>'
+            '<li><img src="/small/2.jpg"><h3>Two</h3><div class="descr">Second [More]</div>'
+            '</ul></div>'
+        )
+        self.assertEqual(parseSearchPage(html), ([('1', 'One', ''), ('2', 'Two', 'Second')], [ ]))
+
+
+def benchmark(repeat=20):
+    '''
+    Times both extractors on each saved page.
+    :returns: A list of (page, BeautifulSoup ms, SearchParser ms) tuples, with the best time of 'repeat' runs.
+    '''
+    def _bestTime(function, html):
+        bestTime = None
+        for index in range(repeat):
+            startTime = time()
+            function(html)
+            elapsed = (time() - startTime) * 1000.0
+            bestTime = elapsed if bestTime == None else min(bestTime, elapsed)
+        return bestTime
+
+    results = [ ]
+    for fileName in sorted(listdir(FIXTURES_DIR)):
+        html = loadPage(fileName)
+        results.append(
+            (fileName, _bestTime(extractWithBeautifulSoup, html) if BeautifulSoup else None, _bestTime(parseSearchPage, html))
+        )
+    return results
+
+
+if __name__ == '__main__':
+    print('%-26s %14s %14s' % ('page', 'bs4 ms', 'parser ms'))
+    for fileName, soupTime, parserTime in benchmark():
+        print('%-26s %14s %14.2f' % (fileName, '%.2f' % soupTime if soupTime != None else '-', parserTime))
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+import sys
+import json
+import unittest
+
+from tests import KodiFakes
+KodiFakes.install()
+
+from Lib import SimpleCacheCodecs as codecs
+from Lib.SimpleCacheStorage import FileStorage
+
+
+ROUTE_DATA = {
+    'entries': [{'id': str(index), 'name': u'Caf\xe9 %i' % index, 'genres': ['Comedy']} for index in range(50)],
+    'total': 50,
+    'ratio': 0.5,
+    'next': None,
+    'done': True
+}
+
+
+class SimpleCacheCodecsTest(unittest.TestCase):
+
+    def test_roundTrips(self):
+        for codec in codecs.availableCodecs():
+            payload = codecs.encode(ROUTE_DATA, codec)
+            self.assertTrue(isinstance(payload, bytes), codec)
+            self.assertEqual(codecs.detectCodec(payload), codec)
+            self.assertEqual(codecs.decode(payload), ROUTE_DATA, codec)
+            self.assertEqual(codecs.decode(bytearray(payload)), ROUTE_DATA, codec)
+
+
+    def test_unknownCodecIsJSON(self):
+        payload = codecs.encode(ROUTE_DATA, 'lzma')
+        self.assertEqual(codecs.detectCodec(payload), codecs.CODEC_JSON)
+        self.assertEqual(codecs.decode(payload), ROUTE_DATA)
+
+
+    def test_detectCodec(self):
+        self.assertEqual(codecs.detectCodec(b'{"a": 1}'), codecs.CODEC_JSON)
+        self.assertEqual(codecs.detectCodec(b'null'), codecs.CODEC_JSON)
+        self.assertEqual(codecs.detectCodec(b'[1]'), codecs.CODEC_JSON)
+        self.assertEqual(codecs.detectCodec(b'\x78\x9c...'), codecs.CODEC_ZLIB)
+        self.assertEqual(codecs.detectCodec(b'\x1f\x8b\x08...'), codecs.CODEC_GZIP)
+        self.assertEqual(codecs.detectCodec(b'\x00M2...'), codecs.CODEC_MARSHAL)
+        self.assertEqual(codecs.detectCodec(b'\x00M3...'), codecs.CODEC_MARSHAL)
+
+
+    def test_text(self):
+        for codec in codecs.availableCodecs():
+            text = codecs.encodeText(ROUTE_DATA, codec)
+            self.assertEqual(text.startswith(codecs.TEXT_PREFIX), codec != codecs.CODEC_JSON, codec)
+            self.assertEqual(codecs.decodeText(text), ROUTE_DATA, codec)
+        # JSON stays readable, and window properties from before the codecs are still decoded.
+        self.assertEqual(json.loads(codecs.encodeText(ROUTE_DATA, codecs.CODEC_JSON)), ROUTE_DATA)
+        self.assertEqual(codecs.decodeText(json.dumps(ROUTE_DATA)), ROUTE_DATA)
+        self.assertEqual(codecs.decode(json.dumps(ROUTE_DATA)), ROUTE_DATA)
+
+
+    def test_marshalFromAnotherPython(self):
+        otherVersion = 2 if sys.version_info[0] != 2 else 3
+        payload = b'\x00M' + str(otherVersion).encode('ascii') + b'\x00\x01\x02'
+        self.assertEqual(codecs.detectCodec(payload), codecs.CODEC_MARSHAL)
+        with self.assertRaises(ValueError):
+            codecs.decode(payload)
+
+
+class PlainJSONCacheFileTest(unittest.TestCase):
+
+    def setUp(self):
+        KodiFakes.resetState()
+        self.dirPath = KodiFakes.profileDir + '/'
+        self.storage = FileStorage(self.dirPath, 4, 3)
+
+
+    def _writeFile(self, propName, payload):
+        with open(self.dirPath + propName + '.json', 'wb') as cacheFile:
+            cacheFile.write(payload)
+
+
+    def test_readVersion3File(self):
+        # A cache file as written before the codecs: indented JSON text of cache version 3.
+        self._writeFile(
+            'route',
+            json.dumps(
+                {'version': 3, 'propName': 'route', 'lifetime': 72, 'epoch': 1000, 'data': ROUTE_DATA}, indent=4
+            ).encode('utf-8')
+        )
+        self.assertEqual(self.storage.load('route', 1000), ('route', ROUTE_DATA, 72, 1000))
+        self.assertEqual(self.storage.readManifest()['route'][3:], [codecs.CODEC_JSON, 3])
+
+
+    def test_blankFile(self):
+        self._writeFile('route', b'null')
+        self.assertEqual(self.storage.load('route', 1000), None)
+        self.assertEqual(self.storage.readManifest(), { })
+
+
+    def test_marshalFileFromAnotherPython(self):
+        otherVersion = 2 if sys.version_info[0] != 2 else 3
+        self._writeFile('route', b'\x00M' + str(otherVersion).encode('ascii') + b'\x00\x01\x02')
+        self.assertEqual(self.storage.load('route', 1000), None)
+        self.assertEqual(self.storage.readManifest(), { })
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+import json
+import unittest
+from os import path as osPath
+
+from tests import KodiFakes
+KodiFakes.install()
+
+import xbmcgui
+
+from Lib.SimpleCache import simpleCache as cache
+from Lib.SimpleCacheManifest import SimpleCacheManifest
+
+
+class FileStorage():
+    # Stands in for the storage engine of the same name, the manifest only uses its class name and readManifest().
+    def readManifest(self):
+        return { }
+
+
+class SimpleCacheManifestTest(unittest.TestCase):
+
+    def setUp(self):
+        KodiFakes.resetState()
+        self.dirPath = KodiFakes.profileDir + '/'
+        self.storage = FileStorage()
+
+
+    def _makeManifest(self):
+        # Each add-on invocation has its own manifest object, sharing the window properties.
+        manifest = SimpleCacheManifest(xbmcgui.Window(10000), self.dirPath)
+        manifest.ensureLoaded(self.storage)
+        return manifest
+
+
+    def _readFile(self, manifest):
+        with open(manifest.filePath, 'r') as file:
+            return json.load(file)['entries']
+
+
+    def test_fileIsOnlyWrittenBySaveFile(self):
+        manifest = self._makeManifest()
+        manifest.update(self.storage, {'route': [100, 1, 72, 'json', 2]})
+        self.assertFalse(osPath.exists(manifest.filePath))
+        manifest.saveFile()
+        self.assertEqual(self._readFile(manifest), {'route': [100, 1, 72, 'json', 2]})
+
+
+    def test_invocationsMergeTheirChanges(self):
+        first = self._makeManifest()
+        second = self._makeManifest()
+        first.update(self.storage, {'first': [1, 1, 72, 'json', 2]})
+        second.update(self.storage, {'second': [2, 1, 72, 'json', 2]})
+        first.update(self.storage, removedNames=('missing',))
+        second.saveFile()
+        self.assertEqual(sorted(self._readFile(second)), ['first', 'second'])
+        self.assertEqual(sorted(name for name, entry in first.iterItems()), ['first', 'second'])
+
+
+    def test_saveCacheIfDirtyWritesTheFile(self):
+        KodiFakes.settings['cache_background_save'] = 'false'
+        cache.setCacheProperty('test.route', [1, 2, 3], saveToDisk=True)
+        cache.saveCacheIfDirty()
+        self.assertIn('test.route', self._readFile(cache.manifest))
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+import unittest
+from time import sleep
+from threading import Thread
+
+from tests import KodiFakes
+KodiFakes.install()
+
+import xbmcgui
+
+from Lib.SimpleCacheStats import SimpleCacheStats
+
+
+class SimpleCacheStatsTest(unittest.TestCase):
+
+    def setUp(self):
+        KodiFakes.resetState()
+        self.stats = SimpleCacheStats(xbmcgui.Window(10000), KodiFakes.profileDir + '/')
+
+
+    def test_concurrentFlushesKeepAllEvents(self):
+        # A slow read of the window property, so that unlocked flushes would overwrite each other's merge.
+        loadStats = self.stats._loadStats
+        def _slowLoadStats():
+            statsData = loadStats()
+            sleep(0.05)
+            return statsData
+        self.stats._loadStats = _slowLoadStats
+
+        def _recordAndFlush():
+            for index in range(5):
+                self.stats.record('route', 'memory', 1.0)
+                self.stats.flush()
+        threads = [Thread(target=_recordAndFlush) for index in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        del self.stats._loadStats
+        self.assertEqual(self.stats.getStats()['route'], {'memory': 15, 'memoryMs': 15.0})
+
+
+    def test_reset(self):
+        self.stats.record('route', 'web', 100.0, 2048)
+        self.stats.flush()
+        self.assertEqual(self.stats.getStats()['route']['bytesWeb'], 2048)
+        self.stats.record('route', 'disk')
+        self.stats.reset()
+        self.assertEqual(self.stats.getStats(), { })
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+import sqlite3
+import unittest
+
+from tests import KodiFakes
+KodiFakes.install()
+
+from Lib.SimpleCacheStorage import SQLiteStorage
+
+
+class SQLiteStorageTest(unittest.TestCase):
+
+    def setUp(self):
+        KodiFakes.resetState()
+        self.dirPath = KodiFakes.profileDir + '/'
+        self.storage = SQLiteStorage(self.dirPath, 2, 1)
+        self.storage.saveProperties(
+            (propName, {'entries': [propName] * 100}, 72, 1000, 'json') for propName in ('first', 'second', 'third')
+        )
+        self._setAccessed({'first': 1, 'second': 2, 'third': 3})
+
+
+    def tearDown(self):
+        self.storage.connection.close()
+
+
+    def _setAccessed(self, accessTimes):
+        with self.storage.connection:
+            self.storage.connection.executemany(
+                'UPDATE cache SET accessed = ? WHERE propName = ?', ((value, name) for name, value in accessTimes.items())
+            )
+
+
+    def _getAccessed(self):
+        # Read with another connection, like another add-on invocation.
+        connection = sqlite3.connect(self.dirPath + SQLiteStorage.DB_FILENAME)
+        try:
+            return dict(connection.execute('SELECT propName, accessed FROM cache'))
+        finally:
+            connection.close()
+
+
+    def test_loadDoesNotWrite(self):
+        propName, data, lifetime, epoch = self.storage.load('first', 1000)
+        self.assertEqual((propName, data), ('first', {'entries': ['first'] * 100}))
+        self.assertEqual(self._getAccessed(), {'first': 1, 'second': 2, 'third': 3})
+
+        accessTimes = self.storage.takeAccessTimes()
+        self.assertEqual(list(accessTimes), ['first'])
+        self.assertEqual(self.storage.takeAccessTimes(), { })
+        self.storage.saveAccessTimes(accessTimes)
+        self.assertGreater(self._getAccessed()['first'], 3)
+
+
+    def test_evictionUsesTheSavedAccessTimes(self):
+        self.storage.load('first', 1000)
+        self.storage.saveAccessTimes(self.storage.takeAccessTimes())
+        totalBytes = sum(entry[0] for entry in self.storage.readManifest().values())
+        # Room for about one property, the least recently loaded ones go first.
+        self.assertEqual(self.storage.evict(totalBytes // 3 + 1), ['second', 'third'])
+
+
+    def test_olderSchemaIsRecreated(self):
+        self.storage.connection.close()
+        connection = sqlite3.connect(self.dirPath + SQLiteStorage.DB_FILENAME)
+        connection.execute('PRAGMA user_version = 2')
+        connection.close()
+
+        storage = SQLiteStorage(self.dirPath, 2, 1)
+        self.assertEqual(storage.load('first', 1000), None)
+        columnTypes = dict((row[1], row[2]) for row in storage.connection.execute('PRAGMA table_info(cache)'))
+        self.assertEqual(columnTypes['data'], 'BLOB')
+        storage.saveProperties([('first', {'entries': [ ]}, 72, 1000, 'zlib')])
+        self.assertEqual(storage.load('first', 1000)[1], {'entries': [ ]})
+        self.storage = storage
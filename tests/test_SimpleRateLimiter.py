@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+import unittest
+from time import time
+
+from tests import KodiFakes
+KodiFakes.install()
+
+from Lib.SimpleRateLimiter import rateLimiter
+
+
+class SimpleRateLimiterTest(unittest.TestCase):
+
+    URL = 'http://www.animetoon.org/toon/search?key=test'
+
+    def setUp(self):
+        KodiFakes.resetState()
+        rateLimiter.burst = None
+
+
+    def _timeAcquires(self, count, interval, burst=None):
+        startTime = time()
+        for index in range(count):
+            rateLimiter.acquire(self.URL, interval, burst)
+        return time() - startTime
+
+
+    def test_burstThenInterval(self):
+        # The default 'request_burst' of 2 goes out right away, the third request waits one interval.
+        self.assertLess(self._timeAcquires(2, 300), 0.05)
+        self.assertGreaterEqual(self._timeAcquires(1, 300), 0.25)
+
+
+    def test_requestBurst(self):
+        # Like a name search with three worker threads: the first page plus three more.
+        self.assertLess(self._timeAcquires(4, 300, burst=4), 0.05)
+        self.assertGreaterEqual(self._timeAcquires(1, 300, burst=4), 0.25)
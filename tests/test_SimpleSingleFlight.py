@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+import unittest
+from time import sleep, time
+from threading import Thread
+
+from tests import KodiFakes
+KodiFakes.install()
+
+from Lib.SimpleCache import simpleCache as cache
+from Lib.SimpleSingleFlight import singleFlight
+
+try:
+    import requests
+    from Lib.RequestHelper import requestHelper
+    from Lib.CatalogHelper import catalogHelper
+except ImportError:
+    requests = None
+
+
+# Threads stand in for the concurrent add-on invocations, they share the window properties like these do.
+
+ROUTE_ENTRIES = [
+    {'id': str(index), 'name': name, 'description': '', 'genres': ['Comedy'], 'released': '2010-01-01'}
+    for index, name in enumerate(('Alpha', 'Bravo', 'Charlie', 'Delta', '9 Lives'))
+]
+
+
+class SimpleSingleFlightTest(unittest.TestCase):
+
+    def setUp(self):
+        KodiFakes.resetState()
+
+
+    def test_leaderAndWaiters(self):
+        self.assertTrue(singleFlight.tryBegin('route'))
+        self.assertFalse(singleFlight.tryBegin('route'))
+        self.assertTrue(singleFlight.tryBegin('other route'))
+        singleFlight.end('route')
+        singleFlight.end('other route')
+        self.assertTrue(singleFlight.tryBegin('route'))
+        singleFlight.end('route')
+
+
+    def test_waitEndsWithTheFlight(self):
+        self.assertTrue(singleFlight.begin('route'))
+        ender = Thread(target=lambda: (sleep(0.3), singleFlight.end('route')))
+        ender.start()
+        startTime = time()
+        self.assertFalse(singleFlight.begin('route'))
+        self.assertGreaterEqual(time() - startTime, 0.25)
+        ender.join()
+
+
+    def test_staleFlightIsTakenOver(self):
+        # The marker of an invocation that was killed mid-flight.
+        cache.setRawProperty(
+            singleFlight.PROPERTY_FLIGHT + 'route', 'dead,%f' % (time() - singleFlight.FLIGHT_TIMEOUT - 1)
+        )
+        startTime = time()
+        self.assertTrue(singleFlight.begin('route'))
+        self.assertLess(time() - startTime, 0.1)
+        singleFlight.end('route')
+
+
+    @unittest.skipIf(requests == None, 'The requests module is needed for the catalog tests.')
+    def test_concurrentCatalogBuildsMakeOneRequest(self):
+        requestedRoutes = [ ]
+        def _routeGETEntries(route, *args, **kwargs):
+            requestedRoutes.append(route)
+            sleep(0.3) # A slow download, so the other invocations come in while it's in flight.
+            return iter(ROUTE_ENTRIES)
+
+        catalogs = [ ]
+        def _buildCatalog():
+            catalogs.append(catalogHelper.allRouteCatalog({'api': requestHelper.API_ANIMETOON, 'route': '/GetAllCartoon'}))
+
+        requestHelper.routeGETEntries = _routeGETEntries
+        try:
+            threads = [Thread(target=_buildCatalog) for index in range(3)]
+            threads[0].start()
+            sleep(0.1)
+            for thread in threads[1:]:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            del requestHelper.routeGETEntries
+
+        self.assertEqual(requestedRoutes, ['/GetAllCartoon'])
+        self.assertEqual(len(catalogs), 3)
+        for catalog in catalogs:
+            self.assertEqual(catalog, catalogs[0])
+        self.assertEqual(sum(len(sectionItems) for sectionItems in catalogs[0].values()), len(ROUTE_ENTRIES))